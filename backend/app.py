@@ -1,17 +1,41 @@
-from flask import Flask, jsonify, request
+from flask import Flask, abort, jsonify, request, url_for
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity
 from functools import wraps
+import datetime
+import hashlib
+import io
+import json
+from urllib.parse import urlencode
 from models import db, User, Quiz, Score, Subject, Chapter, Question
 from config import Config
-from tasks import celery, generate_user_performance_report
+from tasks import celery, delete_content, generate_user_performance_report
 from flask import send_from_directory
-from app_factory import create_app
-from sqlalchemy import or_
-from sqlalchemy import func
+from app_factory import create_app, default_profile
+from stats import record_attempt
+from exports import exports_dir
+from question_import import detect_format, import_questions, iter_rows
+from search import ensure_search_index, in_rank_order, search
+from pagination import InvalidCursor, keyset_page, paginated_response, result_limit
+from queries import (
+    CATALOG_ORDER, CHAPTER_LIST_ORDER, QUESTION_LIST_ORDER, SCORE_LIST_ORDER, USER_LIST_ORDER,
+    chapter_quizzes, performance_overview, quiz_catalog, quiz_questions, subject_chapters,
+    user_by_email, user_list, user_scores,
+)
+from cache import cache, mark_changed
+from snapshots import get_snapshot, grade, publish_quiz, republish_quiz
+from score_queue import enqueue_score
+from identity import identity_cache
+from database import replica_reads
+from leaderboards import SCOPES, board_key, leaderboards
+from counters import adjust_for_quiz, get_counters, subject_counters
+from responses import etag_matches, versioned
+from deletion import delete_tree
+from task_events import check_stream_token, event_stream, stream_token
+import redis
 
 # --- App Initialization ---
-app = create_app()
+app = create_app(default_profile())
 
 
 # --- THIS IS THE FIX: Explicitly configure Celery ---
@@ -20,23 +44,33 @@ celery.conf.result_backend = app.config['CELERY_RESULT_BACKEND']
 
 # ---------------------------------------------------
 
+# --- Error Handlers ---
+@app.errorhandler(InvalidCursor)
+def handle_invalid_cursor(error):
+    return jsonify({"msg": str(error)}), 400
+
 # --- Custom Decorators ---
 def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        if user and user.role == 'admin':
-            return fn(*args, **kwargs)
-        return jsonify(msg="Admins only!"), 403
+        # The role claim is signed into the token at login; tokens issued before a
+        # role change or deletion are rejected by the JWT blocklist check
+        if get_jwt().get('role') != 'admin':
+            return jsonify(msg="Admins only!"), 403
+        if not identity_cache.revocations_current():
+            # The blocklist may be missing this admin's demotion: check the role itself
+            user = db.session.get(User, int(get_jwt_identity()))
+            if user is None or user.role != 'admin':
+                return jsonify(msg="Admins only!"), 403
+        return fn(*args, **kwargs)
     return wrapper
 
 # --- Auth APIs ---
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
-    if User.query.filter_by(username=data.get('email')).first():
+    if user_by_email(data.get('email')).first():
         return jsonify({"msg": "User with this email already exists"}), 409
     new_user = User(username=data.get('email'), full_name=data.get('fullName'), qualification=data.get('qualification'))
     new_user.set_password(data.get('password'))
@@ -47,7 +81,7 @@ def register():
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
-    user = User.query.filter_by(username=data.get('email')).first()
+    user = user_by_email(data.get('email')).first()
     if user and user.check_password(data.get('password')):
         access_token = create_access_token(identity=user.id, additional_claims={'role': user.role})
         return jsonify(access_token=access_token)
@@ -56,27 +90,32 @@ def login():
 
 @app.route('/api/admin/stats', methods=['GET'])
 @admin_required
+@replica_reads
 def get_admin_stats():
-    admin_user_id = get_jwt_identity()
-    admin = User.query.get(admin_user_id)
-    admin_name = admin.full_name if admin else "Admin"
-    total_subjects = Subject.query.count()
-    total_quizzes = Quiz.query.count()
-    total_users = User.query.filter(User.role != 'admin').count()
-    return jsonify({"admin_name": admin_name, "total_subjects": total_subjects, "total_quizzes": total_quizzes, "total_users": total_users})
+    admin = identity_cache.get_profile(get_jwt_identity())
+    admin_name = admin['full_name'] if admin else "Admin"
+    # Maintained counters instead of COUNT(*) over each table
+    counts = get_counters()
+    return jsonify({
+        "admin_name": admin_name, "total_subjects": counts['subjects'], "total_quizzes": counts['quizzes'],
+        "total_users": counts['users'], "total_chapters": counts['chapters'], "total_questions": counts['questions']
+    })
 
 
 # --- NEW: Global Search API for Admin ---
 @app.route('/api/admin/search', methods=['GET'])
 @admin_required
+@replica_reads
 def global_admin_search():
     query_term = request.args.get('q', '').strip()
     if len(query_term) < 2:
         return jsonify({"subjects": [], "chapters": [], "users": []})
-    like_term = f'%{query_term}%'
-    subjects = Subject.query.filter(or_(Subject.name.ilike(like_term), Subject.description.ilike(like_term))).limit(5).all()
-    chapters = Chapter.query.join(Subject).filter(or_(Chapter.name.ilike(like_term), Chapter.description.ilike(like_term))).limit(5).all()
-    users = User.query.filter(User.role != 'admin', or_(User.full_name.ilike(like_term), User.username.ilike(like_term))).limit(5).all()
+    subject_ids = search('subject', query_term, limit=5)
+    chapter_ids = search('chapter', query_term, columns=('title', 'body'), limit=5)
+    user_ids = search('user', query_term, limit=5)
+    subjects = in_rank_order(Subject.query.filter(Subject.id.in_(subject_ids)).all(), subject_ids)
+    chapters = in_rank_order(Chapter.query.filter(Chapter.id.in_(chapter_ids)).all(), chapter_ids)
+    users = in_rank_order(User.query.filter(User.id.in_(user_ids)).all(), user_ids)
     return jsonify({
         "subjects": [{'id': s.id, 'name': s.name, 'description': s.description} for s in subjects],
         "chapters": [{'id': c.id, 'name': c.name, 'subject_name': c.subject.name} for c in chapters],
@@ -85,17 +124,9 @@ def global_admin_search():
 
 @app.route('/api/admin/performance-overview', methods=['GET'])
 @admin_required
+@replica_reads
 def get_user_performance_overview():
-    questions_per_quiz = db.session.query(Quiz.id, func.count(Question.id).label('question_count')).join(Question).group_by(Quiz.id).subquery()
-    top_users_data = db.session.query(
-        User.full_name,
-        func.avg(Score.total_scored * 100.0 / questions_per_quiz.c.question_count),
-    ).join(Score, User.id == Score.user_id)\
-     .join(Quiz, Score.quiz_id == Quiz.id)\
-     .join(questions_per_quiz, Quiz.id == questions_per_quiz.c.id)\
-     .group_by(User.id)\
-     .order_by(func.avg(Score.total_scored * 100.0 / questions_per_quiz.c.question_count).desc())\
-     .limit(10).all()
+    top_users_data = performance_overview(10).all()
     labels = [user[0] for user in top_users_data]
     avg_scores = [round(user[1], 2) if user[1] is not None else 0 for user in top_users_data]
     return jsonify({'labels': labels, 'avg_scores': avg_scores})
@@ -104,13 +135,21 @@ def get_user_performance_overview():
 # --- Subject Management APIs (No search param needed anymore) ---
 @app.route('/api/subjects', methods=['GET'])
 @admin_required
+@versioned('catalog')
 def get_all_subjects():
     query_term = request.args.get('q', '')
-    query = Subject.query
     if query_term:
-        query = query.filter(or_(Subject.name.ilike(f'%{query_term}%'), Subject.description.ilike(f'%{query_term}%')))
-    subjects = query.order_by(Subject.name).all()
-    return jsonify([{'id': s.id, 'name': s.name, 'description': s.description} for s in subjects])
+        ids = search('subject', query_term, limit=result_limit())
+        subjects = in_rank_order(Subject.query.filter(Subject.id.in_(ids)).all(), ids)
+        next_cursor = None
+    else:
+        subjects, next_cursor = keyset_page(Subject.query, [Subject.name, Subject.id])
+    counts = subject_counters([s.id for s in subjects])
+    return paginated_response([{
+        'id': s.id, 'name': s.name, 'description': s.description,
+        'chapter_count': counts[s.id]['chapters'], 'quiz_count': counts[s.id]['quizzes'],
+        'question_count': counts[s.id]['questions']
+    } for s in subjects], next_cursor)
 
 @app.route('/api/subjects', methods=['POST'])
 @admin_required
@@ -133,30 +172,42 @@ def update_subject(subject_id):
     db.session.commit()
     return jsonify({'id': subject.id, 'name': subject.name, 'description': subject.description})
 
+def _delete_content(kind, ref_id, msg):
+    # Set-based batched deletes; ?background=true hands big trees to a Celery task
+    if request.args.get('background', '').lower() in ('1', 'true', 'yes'):
+        task = delete_content.delay(kind, ref_id)
+        return jsonify({"task_id": task.id, "events_url": _events_url(task.id)}), 202
+    deleted = delete_tree(kind, ref_id, app.config['DELETE_BATCH_SIZE'])
+    if deleted is None:
+        abort(404)
+    return jsonify({"msg": msg, "deleted": deleted}), 200
+
 @app.route('/api/subjects/<int:subject_id>', methods=['DELETE'])
 @admin_required
 def delete_subject(subject_id):
-    subject = Subject.query.get_or_404(subject_id)
-    db.session.delete(subject)
-    db.session.commit()
-    return jsonify({"msg": "Subject deleted successfully"}), 200
+    Subject.query.get_or_404(subject_id)
+    return _delete_content('subject', subject_id, "Subject deleted successfully")
 
 # --- Chapter Management APIs ---
 @app.route('/api/chapters/<int:chapter_id>', methods=['GET'])
 @admin_required
+@versioned('catalog')
 def get_chapter_details(chapter_id):
     chapter = Chapter.query.get_or_404(chapter_id)
     return jsonify({'id': chapter.id, 'name': chapter.name, 'description': chapter.description})
 
 @app.route('/api/subjects/<int:subject_id>/chapters', methods=['GET'])
 @admin_required
+@versioned('catalog')
 def get_chapters_for_subject(subject_id):
     query_term = request.args.get('q', '')
-    query = Chapter.query.filter_by(subject_id=subject_id)
     if query_term:
-        query = query.filter(or_(Chapter.name.ilike(f'%{query_term}%'), Chapter.description.ilike(f'%{query_term}%')))
-    chapters = query.order_by(Chapter.name).all()
-    return jsonify([{'id': c.id, 'name': c.name, 'description': c.description} for c in chapters])
+        ids = search('chapter', query_term, scope_id=subject_id, columns=('title', 'body'), limit=result_limit())
+        chapters = in_rank_order(Chapter.query.filter(Chapter.id.in_(ids)).all(), ids)
+        next_cursor = None
+    else:
+        chapters, next_cursor = keyset_page(subject_chapters(subject_id), CHAPTER_LIST_ORDER)
+    return paginated_response([{'id': c.id, 'name': c.name, 'description': c.description} for c in chapters], next_cursor)
 
 
 @app.route('/api/subjects/<int:subject_id>/chapters', methods=['POST'])
@@ -184,22 +235,24 @@ def update_chapter(chapter_id):
 @app.route('/api/chapters/<int:chapter_id>', methods=['DELETE'])
 @admin_required
 def delete_chapter(chapter_id):
-    chapter = Chapter.query.get_or_404(chapter_id)
-    db.session.delete(chapter)
-    db.session.commit()
-    return jsonify({"msg": "Chapter deleted successfully"})
+    Chapter.query.get_or_404(chapter_id)
+    return _delete_content('chapter', chapter_id, "Chapter deleted successfully")
 
 # --- Quiz Management APIs ---
 @app.route('/api/chapters/<int:chapter_id>/quizzes', methods=['GET'])
 @admin_required
+@versioned('catalog')
 def get_quizzes_for_chapter(chapter_id):
     Chapter.query.get_or_404(chapter_id)
     search_term = request.args.get('q', '')
-    query = Quiz.query.filter_by(chapter_id=chapter_id)
     if search_term:
-        # Search by remarks or quiz ID
-        query = query.filter(or_(Quiz.remarks.ilike(f'%{search_term}%'), Quiz.id.ilike(f'%{search_term}%')))
-    quizzes = query.all()
+        # Search by remarks, or an exact quiz ID
+        ids = search('quiz', search_term, scope_id=chapter_id, columns=('title',))
+        if search_term.strip().isdigit():
+            ids = [int(search_term)] + [i for i in ids if i != int(search_term)]
+        quizzes = in_rank_order(Quiz.query.filter(Quiz.chapter_id == chapter_id, Quiz.id.in_(ids)).all(), ids)
+    else:
+        quizzes = chapter_quizzes(chapter_id).all()
     return jsonify([{'id': q.id, 'time_duration': q.time_duration, 'remarks': q.remarks} for q in quizzes])
 
 
@@ -222,28 +275,37 @@ def update_quiz(quiz_id):
     data = request.get_json()
     quiz.time_duration = data.get('time_duration', quiz.time_duration)
     quiz.remarks = data.get('remarks', quiz.remarks)
+    if quiz.published_version and 'time_duration' in data:
+        publish_quiz(quiz.id)
     db.session.commit()
     return jsonify({'id': quiz.id, 'time_duration': quiz.time_duration, 'remarks': quiz.remarks})
 
+@app.route('/api/quizzes/<int:quiz_id>/publish', methods=['POST'])
+@admin_required
+def publish_quiz_snapshot(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    version = publish_quiz(quiz_id)
+    db.session.commit()
+    return jsonify({'quiz_id': quiz_id, 'version': version}), 201
+
 @app.route('/api/quizzes/<int:quiz_id>', methods=['DELETE'])
 @admin_required
 def delete_quiz(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    db.session.delete(quiz)
-    db.session.commit()
-    return jsonify({"msg": "Quiz deleted successfully"})
+    Quiz.query.get_or_404(quiz_id)
+    return _delete_content('quiz', quiz_id, "Quiz deleted successfully")
 
 # --- Question Management APIs ---
 @app.route('/api/quizzes/<int:quiz_id>/questions', methods=['GET'])
 @admin_required
+@versioned('catalog')
 def get_questions_for_quiz(quiz_id):
     Quiz.query.get_or_404(quiz_id)
-    questions = Question.query.filter_by(quiz_id=quiz_id).all()
-    return jsonify([{
+    questions, next_cursor = keyset_page(quiz_questions(quiz_id), QUESTION_LIST_ORDER)
+    return paginated_response([{
         'id': q.id, 'statement': q.statement, 'option1': q.option1,
         'option2': q.option2, 'option3': q.option3, 'option4': q.option4,
         'correct_option': q.correct_option
-    } for q in questions])
+    } for q in questions], next_cursor)
 
 @app.route('/api/quizzes/<int:quiz_id>/questions', methods=['POST'])
 @admin_required
@@ -264,9 +326,32 @@ def create_question_for_quiz(quiz_id):
         correct_option=data['correct_option']
     )
     db.session.add(new_question)
+    republish_quiz(quiz_id)
     db.session.commit()
     return jsonify({'id': new_question.id}), 201
 
+@app.route('/api/quizzes/<int:quiz_id>/questions/import', methods=['POST'])
+@admin_required
+def import_questions_for_quiz(quiz_id):
+    Quiz.query.get_or_404(quiz_id)
+    upload = request.files.get('file')
+    if upload:
+        fmt = detect_format(upload.filename, upload.mimetype, request.args.get('format'))
+        stream = upload.stream
+    else:
+        fmt = detect_format(content_type=request.mimetype, requested=request.args.get('format'))
+        stream = io.BufferedReader(request.stream)
+    if fmt is None:
+        return jsonify({"msg": "Unsupported format. Upload CSV or JSON Lines."}), 415
+
+    result = import_questions(quiz_id, iter_rows(stream, fmt), app.config['IMPORT_BATCH_SIZE'])
+    mark_changed(db.session, 'catalog')
+    adjust_for_quiz(db.session, quiz_id, 'questions', result['imported'])
+    if result['imported']:
+        republish_quiz(quiz_id)
+    db.session.commit()
+    return jsonify(result), 400 if result['failed'] and not result['imported'] else 201
+
 @app.route('/api/questions/<int:question_id>', methods=['PUT'])
 @admin_required
 def update_question(question_id):
@@ -278,6 +363,7 @@ def update_question(question_id):
     question.option3 = data.get('option3', question.option3)
     question.option4 = data.get('option4', question.option4)
     question.correct_option = data.get('correct_option', question.correct_option)
+    republish_quiz(question.quiz_id)
     db.session.commit()
     return jsonify({'id': question.id})
 
@@ -285,7 +371,9 @@ def update_question(question_id):
 @admin_required
 def delete_question(question_id):
     question = Question.query.get_or_404(question_id)
+    quiz_id = question.quiz_id
     db.session.delete(question)
+    republish_quiz(quiz_id)
     db.session.commit()
     return jsonify({"msg": "Question deleted successfully"})
 
@@ -295,11 +383,13 @@ def delete_question(question_id):
 @admin_required
 def get_all_users():
     query_term = request.args.get('q', '')
-    query = User.query.filter(User.role != 'admin')
     if query_term:
-        query = query.filter(or_(User.full_name.ilike(f'%{query_term}%'), User.username.ilike(f'%{query_term}%')))
-    users = query.order_by(User.full_name).all()
-    return jsonify([{'id': u.id, 'full_name': u.full_name, 'username': u.username, 'qualification': u.qualification, 'role': u.role} for u in users])
+        ids = search('user', query_term, limit=result_limit())
+        users = in_rank_order(User.query.filter(User.id.in_(ids)).all(), ids)
+        next_cursor = None
+    else:
+        users, next_cursor = keyset_page(user_list(), USER_LIST_ORDER)
+    return paginated_response([{'id': u.id, 'full_name': u.full_name, 'username': u.username, 'qualification': u.qualification, 'role': u.role} for u in users], next_cursor)
 
 
 
@@ -312,9 +402,12 @@ def update_user(user_id):
     # Fields an admin is allowed to change
     user.full_name = data.get('full_name', user.full_name)
     user.qualification = data.get('qualification', user.qualification)
+    role_changed = data.get('role', user.role) != user.role
     user.role = data.get('role', user.role) # e.g., promote a user to admin
     
     db.session.commit()
+    # Tokens carry the old role claim, so a role change revokes them
+    identity_cache.publish(user.id, revoke=role_changed)
     return jsonify({'id': user.id, 'full_name': user.full_name, 'role': user.role})
 
 @app.route('/api/users/<int:user_id>', methods=['DELETE'])
@@ -324,8 +417,11 @@ def delete_user(user_id):
     if user.role == 'admin':
         return jsonify({"msg": "Cannot delete an admin account."}), 403
     
+    boards = leaderboards.user_boards(user_id)
     db.session.delete(user)
     db.session.commit()
+    leaderboards.remove_user(user_id, boards)
+    identity_cache.publish(user_id, revoke=True)
     return jsonify({"msg": "User deleted successfully"})
 
 
@@ -334,7 +430,7 @@ def delete_user(user_id):
 @admin_required
 def trigger_user_report():
     task = generate_user_performance_report.delay()
-    return jsonify({"task_id": task.id}), 202 # 202 Accepted
+    return jsonify({"task_id": task.id, "events_url": _events_url(task.id)}), 202 # 202 Accepted
 
 @app.route('/api/admin/reports/status/<task_id>', methods=['GET'])
 @admin_required
@@ -342,27 +438,59 @@ def get_report_status(task_id):
     task = celery.AsyncResult(task_id)
     response = {
         'state': task.state,
+        'progress': task.info if task.state == 'PROGRESS' else None,
         'result': task.result if task.state == 'SUCCESS' else None
     }
     return jsonify(response)
 
+@app.route('/api/admin/tasks/<task_id>', methods=['GET'])
+@admin_required
+def get_task_status(task_id):
+    # In the PROGRESS state deletions report {'deleted', 'total'} and reports {'rows', 'total'}
+    task = celery.AsyncResult(task_id)
+    return jsonify({
+        'state': task.state,
+        'progress': task.info if task.state == 'PROGRESS' else None,
+        'result': task.result if task.state == 'SUCCESS' else None,
+        'error': str(task.result) if task.state == 'FAILURE' else None
+    })
+
+def _events_url(task_id):
+    return url_for('stream_task_events', task_id=task_id, token=stream_token(task_id))
+
+@app.route('/api/admin/tasks/<task_id>/events', methods=['GET'])
+def stream_task_events(task_id):
+    # EventSource can't send an Authorization header, so the stream is authorized by the
+    # signed token handed out with the task id instead of the admin's JWT
+    if not check_stream_token(request.args.get('token', ''), task_id):
+        return jsonify({"msg": "Invalid or expired stream token"}), 401
+    return event_stream(task_id)
+
 @app.route('/api/admin/reports/download/<filename>', methods=['GET'])
 @admin_required
 def download_report(filename):
-    return send_from_directory('exports', filename, as_attachment=True)
+    # Reports are immutable once written, so conditional GETs (ETag/If-None-Match)
+    # and Range requests let clients cache them and resume interrupted downloads
+    # Compressed exports are guessed as their inner type (report.csv.gz as text/csv)
+    mimetype = 'application/gzip' if filename.endswith('.gz') else None
+    response = send_from_directory(exports_dir(), filename, mimetype=mimetype, as_attachment=True,
+                                   conditional=True, etag=True)
+    response.cache_control.private = True
+    return response
 
 # --- User Dashboard APIs ---
 @app.route('/api/user/profile', methods=['GET'])
 @jwt_required()
 def get_user_profile():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = identity_cache.get_profile(get_jwt_identity())
+    if user is None:
+        return jsonify({"msg": "User not found"}), 404
     return jsonify({
-        "fullName": user.full_name,
-        "notifications_enabled": user.notifications_enabled,
-        "email_notifications": user.email_notifications,
-        "gchat_webhook": user.gchat_webhook,
-        "notification_time": user.notification_time.strftime('%H:%M') if user.notification_time else None
+        "fullName": user['full_name'],
+        "notifications_enabled": user['notifications_enabled'],
+        "email_notifications": user['email_notifications'],
+        "gchat_webhook": user['gchat_webhook'],
+        "notification_time": user['notification_time']
     })
 
 @app.route('/api/user/notifications', methods=['PUT'])
@@ -386,6 +514,7 @@ def update_notification_preferences():
             return jsonify({"msg": "Invalid time format. Use HH:MM"}), 400
     
     db.session.commit()
+    identity_cache.publish(user.id)
     return jsonify({
         "notifications_enabled": user.notifications_enabled,
         "email_notifications": user.email_notifications,
@@ -396,76 +525,118 @@ def update_notification_preferences():
 @app.route('/api/quizzes', methods=['GET'])
 @jwt_required()
 def get_available_quizzes():
+    # The catalog is identical for every student, so pages are cached under the catalog
+    # version (bumped on any subject/chapter/quiz/question write) and revalidated by ETag.
+    # It is read from the primary: the version is bumped when the primary commits, and a
+    # lagging replica's page would be cached and ETagged under the new version.
+    version = cache.version('catalog')
+    if version is None:
+        # No shared version to validate against; serve the page fresh (the response layer
+        # still ETags it by content)
+        data, next_cursor = _quiz_catalog_page()
+        return paginated_response(data, next_cursor)
+    args = urlencode(sorted(request.args.items(multi=True)))
+    etag = hashlib.sha1(f'{version}:{args}'.encode()).hexdigest()
+    if etag_matches(etag):
+        response = app.response_class(status=304)
+    else:
+        cache_key = f'catalog:{version}:{args}'
+        cached = cache.get(cache_key)
+        if cached:
+            data, next_cursor = json.loads(cached)
+        else:
+            data, next_cursor = _quiz_catalog_page()
+            cache.set(cache_key, json.dumps([data, next_cursor]))
+        response = paginated_response(data, next_cursor)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _quiz_catalog_page():
+    query = quiz_catalog()
     query_term = request.args.get('q', '')
-    query = Quiz.query.join(Chapter).join(Subject)
     if query_term:
-        query = query.filter(or_(Subject.name.ilike(f'%{query_term}%'), Chapter.name.ilike(f'%{query_term}%'), Quiz.remarks.ilike(f'%{query_term}%')))
-    quizzes = query.all()
-    return jsonify([{"id": q.id, "title": f"{q.chapter.subject.name} - {q.chapter.name}", "description": q.remarks or f"{len(q.questions)} questions"} for q in quizzes])
+        ids = search('quiz', query_term, limit=result_limit())
+        quizzes = in_rank_order(query.filter(Quiz.id.in_(ids)).all(), ids)
+        next_cursor = None
+    else:
+        quizzes, next_cursor = keyset_page(query, CATALOG_ORDER)
+    data = [{"id": q.id, "title": f"{q.subject_name} - {q.chapter_name}", "description": q.remarks or f"{q.question_count} questions"} for q in quizzes]
+    return data, next_cursor
 
 
 
 @app.route('/api/user/scores', methods=['GET'])
 @jwt_required()
+@replica_reads
 def get_user_scores():
     user_id = get_jwt_identity()
-    scores = Score.query.filter_by(user_id=user_id).all()
-    # Search for scores is implemented on the frontend for simplicity,
-    # as a user's score list is not expected to be excessively long.
-    return jsonify([{"id": s.id, "quizName": f"Quiz #{s.quiz_id}", "score": s.total_scored, "date": s.time_stamp.strftime('%Y-%m-%d')} for s in scores])
+    # Long-lived accounts accumulate many scores, so this list is paginated like the others
+    scores, next_cursor = keyset_page(user_scores(user_id), SCORE_LIST_ORDER)
+    return paginated_response([{"id": s.id, "quizName": f"Quiz #{s.quiz_id}", "score": s.total_scored, "date": s.time_stamp.strftime('%Y-%m-%d')} for s in scores], next_cursor)
 
 # --- Quiz Taking APIs ---
 
 @app.route('/api/quizzes/<int:quiz_id>/attempt', methods=['GET'])
 @jwt_required()
 def get_quiz_for_attempt(quiz_id):
-    quiz = Quiz.query.get_or_404(quiz_id)
-    questions = quiz.questions
-    
-    # Return questions without the correct answer
-    question_list = [{
-        'id': q.id,
-        'statement': q.statement,
-        'option1': q.option1,
-        'option2': q.option2,
-        'option3': q.option3,
-        'option4': q.option4
-    } for q in questions]
-    
-    return jsonify({
-        'quiz_id': quiz.id,
-        'time_duration': quiz.time_duration,
-        'questions': question_list
-    })
+    # Served straight from the published snapshot, which holds the questions
+    # without the correct answers, already serialized
+    snapshot = get_snapshot(quiz_id)
+    if snapshot is None:
+        abort(404)
+    # A snapshot never changes, so its token doubles as the ETag
+    etag = f'snapshot-{snapshot.token}'
+    if etag_matches(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(snapshot.attempt_json, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 @app.route('/api/quizzes/<int:quiz_id>/submit', methods=['POST'])
 @jwt_required()
 def submit_quiz_attempt(quiz_id):
-    data = request.get_json()
-    user_answers = data.get('answers') # e.g., {"question_id": "selected_option_num"}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('answers'), dict):
+        return jsonify({"msg": "Missing answers"}), 400
+    user_answers = data['answers'] # e.g., {"question_id": "selected_option_num"}
     user_id = get_jwt_identity()
     
-    quiz = Quiz.query.get_or_404(quiz_id)
-    questions = quiz.questions
-    
-    score = 0
-    total_questions = len(questions)
-    
-    # Calculate score
-    for question in questions:
-        # User answers are sent as strings, so convert question.id to string for lookup
-        user_answer = user_answers.get(str(question.id))
-        if user_answer and int(user_answer) == question.correct_option:
-            score += 1
+    # Grade against the snapshot version the attempt was served from
+    version = data.get('version')
+    if version is not None:
+        try:
+            version = int(version)
+        except (TypeError, ValueError):
+            return jsonify({"msg": "Invalid quiz version"}), 400
+    snapshot = get_snapshot(quiz_id, version or None)
+    if snapshot is None:
+        abort(404)
+    score = grade(snapshot, user_answers)
+    total_questions = snapshot.question_count
             
-    # Save the score to the database
-    new_score = Score(
-        quiz_id=quiz_id,
-        user_id=user_id,
-        total_scored=score
-    )
-    db.session.add(new_score)
-    db.session.commit()
+    queued = False
+    if app.config['SCORE_WRITE_MODE'] == 'queued':
+        # Write-behind: the drainer inserts the row; fall back to a direct write if the queue is down
+        try:
+            enqueue_score(user_id, quiz_id, score, total_questions)
+            queued = True
+        except (redis.RedisError, OSError):
+            app.logger.exception("Score queue unavailable, writing synchronously")
+
+    if not queued:
+        # Save the score to the database
+        new_score = Score(
+            quiz_id=quiz_id,
+            user_id=user_id,
+            total_scored=score
+        )
+        db.session.add(new_score)
+        record_attempt(user_id, score, total_questions)
+        db.session.commit()
+        leaderboards.record([(user_id, quiz_id, score)])
     
     return jsonify({
         'msg': 'Quiz submitted successfully!',
@@ -473,31 +644,59 @@ def submit_quiz_attempt(quiz_id):
         'total': total_questions
     })
 
-@app.route('/api/admin/performance-overview', methods=['GET'])
-@admin_required
-def get_performance_overview():
-    questions_per_quiz = db.session.query(Quiz.id, func.count(Question.id).label('question_count')).join(Question).group_by(Quiz.id).subquery()
-    top_users_data = db.session.query(
-        User.full_name,
-        func.avg(Score.total_scored * 100.0 / questions_per_quiz.c.question_count),
-    ).join(Score, User.id == Score.user_id)\
-     .join(Quiz, Score.quiz_id == Quiz.id)\
-     .join(questions_per_quiz, Quiz.id == questions_per_quiz.c.id)\
-     .group_by(User.id)\
-     .order_by(func.avg(Score.total_scored * 100.0 / questions_per_quiz.c.question_count).desc())\
-     .limit(10).all()
-    labels = [user[0] for user in top_users_data]
-    avg_scores = [round(user[1], 2) if user[1] is not None else 0 for user in top_users_data]
-    return jsonify({'labels': labels, 'avg_scores': avg_scores})
+# --- Leaderboard APIs ---
+def _leaderboard_key(scope, scope_id):
+    if scope not in SCOPES or (scope == 'global') != (scope_id is None):
+        abort(404)
+    return board_key(scope, scope_id)
+
+def _leaderboard_entries(entries):
+    # Deleted users leave the boards when deleted; this only covers the moment in between
+    names = dict(db.session.query(User.id, User.full_name).filter(User.id.in_([e[1] for e in entries])))
+    return [{"rank": rank, "user_id": user_id, "full_name": names[user_id], "score": score}
+            for rank, user_id, score in entries if user_id in names]
+
+@app.route('/api/leaderboards/global', methods=['GET'], defaults={'scope': 'global', 'scope_id': None})
+@app.route('/api/leaderboards/<scope>/<int:scope_id>', methods=['GET'])
+@jwt_required()
+def get_leaderboard(scope, scope_id):
+    key = _leaderboard_key(scope, scope_id)
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), app.config['LEADERBOARD_MAX_K'])
+    except ValueError:
+        return jsonify({"msg": "limit must be an integer"}), 400
+    return jsonify({
+        "scope": scope, "scope_id": scope_id, "total": leaderboards.size(key),
+        "entries": _leaderboard_entries(leaderboards.top(key, limit))
+    })
+
+@app.route('/api/leaderboards/global/me', methods=['GET'], defaults={'scope': 'global', 'scope_id': None})
+@app.route('/api/leaderboards/<scope>/<int:scope_id>/me', methods=['GET'])
+@jwt_required()
+def get_my_leaderboard_rank(scope, scope_id):
+    key = _leaderboard_key(scope, scope_id)
+    try:
+        neighbors = min(max(int(request.args.get('neighbors', 2)), 0), 25)
+    except ValueError:
+        return jsonify({"msg": "neighbors must be an integer"}), 400
+    rank, score, window = leaderboards.around(key, get_jwt_identity(), neighbors)
+    return jsonify({
+        "scope": scope, "scope_id": scope_id, "total": leaderboards.size(key),
+        "rank": rank, "score": score, "neighbors": _leaderboard_entries(window)
+    })
 
 # --- App Runner ---
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        ensure_search_index()
         if not User.query.filter_by(username=app.config['ADMIN_EMAIL']).first():
             admin = User(username=app.config['ADMIN_EMAIL'], full_name='Admin', role='admin')
             admin.set_password(app.config['ADMIN_PASSWORD'])
             db.session.add(admin)
             db.session.commit()
             print('Initialized the database and created admin user.')
+    if app.config['SCHEDULER_ENABLED']:
+        from scheduler import init_scheduler
+        init_scheduler(app)
     app.run(debug=True, use_reloader=False)
\ No newline at end of file
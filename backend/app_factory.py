@@ -1,39 +1,120 @@
+import click
 from flask import Flask
 from config import Config
 from models import db
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
+from database import configure_database, init_database
 from tasks import celery
-from notifications import mail
+from cache import cache
+from snapshots import init_snapshots
+from leaderboards import leaderboards
+from task_events import task_events
+# Imported for their session hooks, which keep derived data in step with every write
+import counters  # noqa: F401
+import search  # noqa: F401
 
+# Each process type builds only what it uses:
+#
+#   web     the API: CORS, JWT, the response layer and metrics
+#   worker  Celery tasks: database, caches and leaderboards only
+#   cli     web plus Flask-Migrate, Flask-Mail and the maintenance commands
+#
+# Extensions and command modules only one profile needs are imported inside the
+# function that initializes them, so a worker never loads Alembic, APScheduler or
+# the mail stack.
+PROFILES = ('web', 'worker', 'cli')
 
-from scheduler import init_scheduler
 
+def default_profile():
+    """APP_PROFILE if set, otherwise 'cli' when loaded by the flask command and 'web' elsewhere"""
+    if Config.APP_PROFILE:
+        return Config.APP_PROFILE
+    # The flask command loads the app from inside its click context
+    return 'cli' if click.get_current_context(silent=True) is not None else 'web'
 
-def create_app():
+
+def _init_web(app):
+    from flask_cors import CORS
+    from flask_jwt_extended import JWTManager
+    from identity import identity_cache, is_token_revoked, issued_at_claims
+    from metrics import init_metrics
+    from responses import init_responses
+
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['X-Next-Cursor', 'Link'])
+    jwt = JWTManager(app)
+    jwt.token_in_blocklist_loader(is_token_revoked)
+    jwt.additional_claims_loader(issued_at_claims)
+    identity_cache.init_app(app)
+
+    # Fast JSON, ETags and compression for API responses
+    init_responses(app)
+
+    # Opt-in request/SQL instrumentation and /metrics
+    init_metrics(app, db)
+
+
+def _init_cli(app):
+    from flask_migrate import Migrate
+    from notifications import mail
+    from stats import rebuild_user_stats_command
+    from search import rebuild_search_index_command
+    from score_queue import drain_scores_command
+    from leaderboards import rebuild_leaderboards_command
+    from counters import reconcile_counters_command
+    from mailer import mail_benchmark_command
+    from scheduler import run_scheduler_command
+    from query_plans import check_query_plans_command
+    from seed import seed_data_command
+    from benchmark import benchmark_command, benchmark_responses_command, benchmark_startup_command
+
+    # Initialize Flask-Migrate
+    Migrate(app, db)
+
+    # Initialize Flask-Mail
+    mail.init_app(app)
+
+    # Maintenance commands
+    app.cli.add_command(rebuild_user_stats_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(rebuild_leaderboards_command)
+    app.cli.add_command(reconcile_counters_command)
+    app.cli.add_command(drain_scores_command)
+    app.cli.add_command(mail_benchmark_command)
+    app.cli.add_command(run_scheduler_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(seed_data_command)
+    app.cli.add_command(benchmark_command)
+    app.cli.add_command(benchmark_responses_command)
+    app.cli.add_command(benchmark_startup_command)
+
+
+def create_app(profile='web'):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown app profile {profile!r}, expected one of: {', '.join(PROFILES)}")
     app = Flask(__name__)
     app.config.from_object(Config)
-    
+    app.config['APP_PROFILE'] = profile
+
+    configure_database(app)
     db.init_app(app)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
-    JWTManager(app)
-    
-    # Initialize Flask-Migrate
-    migrate = Migrate(app, db)
-    
+    init_database(app, db)
+
     # Configure celery
     celery.conf.broker_url = app.config['CELERY_BROKER_URL']
     celery.conf.result_backend = app.config['CELERY_RESULT_BACKEND']
-    celery.conf.update(app.config)
-    
-    # Initialize Flask-Mail
-    mail.init_app(app)
-    
+    # Old-style CELERY_* keys can't be mixed with the lowercase ones set above
+    celery.conf.update({key: value for key, value in app.config.items() if not key.startswith('CELERY_')})
+
+    # Initialize the shared response cache
+    cache.init_app(app)
+    init_snapshots(app)
+    leaderboards.init_app(app)
+    task_events.init_app(app)
 
-    # Initialize scheduler
-    init_scheduler(app)
+    if profile in ('web', 'cli'):
+        _init_web(app)
+    if profile == 'cli':
+        _init_cli(app)
 
-    
+    # Periodic jobs are not started here: every web process and Celery worker process builds
+    # an app, and each would otherwise start its own scheduler. See scheduler.py.
     return app
-    return app
\ No newline at end of file
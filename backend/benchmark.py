@@ -0,0 +1,440 @@
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import click
+import requests
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from flask.cli import with_appcontext
+from models import db, User
+from seed import SEED_PASSWORD, USER_PREFIX, WORDS, SUBJECTS
+from tasks import celery
+from responses import OrjsonProvider, available_encodings, orjson
+
+# Load/latency benchmark for the main endpoints. Runs against the app in-process
+# (Flask test client, one per worker thread) or a running server with --base-url.
+# Seed data first with `flask seed-data`; results are written as JSON so runs on
+# different commits can be compared with --compare.
+
+SCENARIOS = ('login', 'catalog', 'attempt', 'submit', 'admin_search', 'performance_overview', 'report')
+
+
+class _TestClient:
+    """In-process client; every thread gets its own Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, json_body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = client.open(path, method=method, headers=headers, json=json_body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class _HttpClient:
+    """Client for a running server; one pooled session per thread"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, json_body=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = session.request(method, self.base_url + path, headers=headers, json=json_body,
+                                   timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, errors, seconds):
+    """Throughput and latency percentiles (ms) for one scenario"""
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(ordered) / seconds, 1) if seconds else None,
+        'latency_ms': {
+            'p50': ms(_percentile(ordered, 50)),
+            'p95': ms(_percentile(ordered, 95)),
+            'p99': ms(_percentile(ordered, 99)),
+            'mean': ms(sum(ordered) / len(ordered)) if ordered else None,
+            'max': ms(ordered[-1]) if ordered else None,
+        },
+    }
+
+
+class Benchmark:
+    """Prepares tokens and fixtures, then runs each scenario at a fixed concurrency"""
+
+    def __init__(self, client, concurrency, seed=None, report_timeout=300):
+        self.client = client
+        self.concurrency = concurrency
+        self.report_timeout = report_timeout
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _choice(self, values):
+        with self._rng_lock:
+            return self.rng.choice(values)
+
+    def _login(self, email, password):
+        status, body = self.client.request('POST', '/api/login', json_body={'email': email, 'password': password})
+        if status != 200:
+            raise click.ClickException(f'Login as {email} failed with HTTP {status}.')
+        return body['access_token']
+
+    def prepare(self, usernames, admin_email, admin_password):
+        if not usernames:
+            raise click.ClickException('No seeded users found; run `flask seed-data` first.')
+        self.usernames = usernames
+        self.admin_token = self._login(admin_email, admin_password)
+        self.user_tokens = [self._login(name, SEED_PASSWORD) for name in usernames[:self.concurrency]]
+
+        status, body = self.client.request('GET', '/api/quizzes?limit=100', token=self.user_tokens[0])
+        quiz_ids = [quiz['id'] for quiz in body] if status == 200 else []
+        # Attempts are fetched once up front so submit measures only grading and the write
+        self.attempts = []
+        for quiz_id in quiz_ids:
+            status, attempt = self.client.request('GET', f'/api/quizzes/{quiz_id}/attempt', token=self.user_tokens[0])
+            if status == 200 and attempt['questions']:
+                self.attempts.append(attempt)
+        if not self.attempts:
+            raise click.ClickException('No quizzes with questions found; run `flask seed-data` first.')
+        self.search_terms = [word[:5] for word in WORDS + SUBJECTS]
+
+    def _token(self, worker):
+        return self.user_tokens[worker % len(self.user_tokens)]
+
+    def login(self, worker):
+        return self.client.request('POST', '/api/login', json_body={
+            'email': self._choice(self.usernames), 'password': SEED_PASSWORD})[0]
+
+    def catalog(self, worker):
+        return self.client.request('GET', '/api/quizzes', token=self._token(worker))[0]
+
+    def attempt(self, worker):
+        quiz_id = self._choice(self.attempts)['quiz_id']
+        return self.client.request('GET', f'/api/quizzes/{quiz_id}/attempt', token=self._token(worker))[0]
+
+    def submit(self, worker):
+        attempt = self._choice(self.attempts)
+        answers = {str(question['id']): str(self._choice((1, 2, 3, 4))) for question in attempt['questions']}
+        return self.client.request('POST', f"/api/quizzes/{attempt['quiz_id']}/submit", token=self._token(worker),
+                                   json_body={'answers': answers, 'version': attempt['version']})[0]
+
+    def admin_search(self, worker):
+        term = self._choice(self.search_terms)
+        return self.client.request('GET', f'/api/admin/search?q={term}', token=self.admin_token)[0]
+
+    def performance_overview(self, worker):
+        return self.client.request('GET', '/api/admin/performance-overview', token=self.admin_token)[0]
+
+    def report(self, worker):
+        status, body = self.client.request('POST', '/api/admin/reports/user-performance', token=self.admin_token)
+        if status != 202 or celery.conf.task_always_eager:
+            # Eager tasks have already run inside the request
+            return status
+        deadline = time.monotonic() + self.report_timeout
+        while time.monotonic() < deadline:
+            status, state = self.client.request('GET', f"/api/admin/reports/status/{body['task_id']}",
+                                                token=self.admin_token)
+            if status != 200 or state['state'] == 'FAILURE':
+                return status if status != 200 else 500
+            if state['state'] == 'SUCCESS':
+                return 200
+            time.sleep(0.2)
+        return 504
+
+    def run(self, scenario, count):
+        """Issue `count` calls spread over the worker threads"""
+        action = getattr(self, scenario)
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        per_worker = [count // self.concurrency + (1 if i < count % self.concurrency else 0)
+                      for i in range(self.concurrency)]
+
+        def work(worker):
+            for _ in range(per_worker[worker]):
+                started = time.perf_counter()
+                try:
+                    status = action(worker)
+                except (requests.RequestException, KeyError, TypeError):
+                    status = None
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if status is None or status >= 400:
+                        errors[0] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(work, range(self.concurrency)))
+        return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_comparison(results, previous):
+    click.echo(f"\nCompared with {previous['meta'].get('commit')} ({previous['meta'].get('created_at')}):")
+    for scenario, current in results['scenarios'].items():
+        before = previous['scenarios'].get(scenario)
+        if not before or not before['latency_ms']['p95'] or not current['latency_ms']['p95']:
+            continue
+        change = (current['latency_ms']['p95'] / before['latency_ms']['p95'] - 1) * 100
+        click.echo(f"  {scenario:<22} p95 {before['latency_ms']['p95']:>9.2f} -> "
+                   f"{current['latency_ms']['p95']:>9.2f} ms ({change:+.1f}%)")
+
+
+@click.command('benchmark')
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(SCENARIOS),
+              help='Scenario to run; repeatable. Defaults to all.')
+@click.option('--concurrency', default=8, show_default=True, help='Concurrent client threads.')
+@click.option('--requests', 'count', default=200, show_default=True, help='Requests per scenario.')
+@click.option('--report-requests', default=2, show_default=True, help='Runs of the (slow) report scenario.')
+@click.option('--warmup', default=20, show_default=True, help='Unmeasured requests per scenario.')
+@click.option('--base-url', help='Benchmark a running server instead of the in-process app.')
+@click.option('--timeout', default=30, show_default=True, help='HTTP timeout in seconds (--base-url only).')
+@click.option('--seed', type=int, help='Random seed for request parameters.')
+@click.option('--output', default='benchmark.json', show_default=True, type=click.Path(dir_okay=False))
+@click.option('--compare', type=click.File('r'), help='Earlier results file to compare p95 latencies with.')
+@with_appcontext
+def benchmark_command(scenarios, concurrency, count, report_requests, warmup, base_url, timeout, seed,
+                      output, compare):
+    """Measure throughput and latency percentiles of the main endpoints."""
+    app = current_app._get_current_object()
+    if base_url:
+        client = _HttpClient(base_url, timeout)
+    else:
+        client = _TestClient(app)
+        # No worker runs in-process; the report task executes inside the trigger request
+        celery.conf.task_always_eager = True
+
+    usernames = [row[0] for row in db.session.query(User.username).filter(
+        User.username.like(f'{USER_PREFIX}%')).order_by(User.id).limit(1000)]
+    db.session.remove()
+    bench = Benchmark(client, concurrency, seed)
+    bench.prepare(usernames, app.config['ADMIN_EMAIL'], app.config['ADMIN_PASSWORD'])
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'target': base_url or 'in-process',
+            'database': db.engine.dialect.name,
+            'python': platform.python_version(),
+            'concurrency': concurrency,
+            'requests': count,
+            'report_requests': report_requests,
+            'seed': seed,
+        },
+        'scenarios': {},
+    }
+    for scenario in scenarios or SCENARIOS:
+        runs = report_requests if scenario == 'report' else count
+        if warmup and scenario != 'report':
+            bench.run(scenario, warmup)
+        summary = bench.run(scenario, runs)
+        results['scenarios'][scenario] = summary
+        latency = summary['latency_ms']
+        click.echo(f"{scenario:<22} {summary['throughput_rps'] or 0:>8.1f} req/s  "
+                   f"p50 {latency['p50'] or 0:>8.2f}  p95 {latency['p95'] or 0:>8.2f}  "
+                   f"p99 {latency['p99'] or 0:>8.2f} ms  errors {summary['errors']}")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {output}')
+    if compare:
+        _print_comparison(results, json.load(compare))
+
+
+# Large list responses, used to measure what the response layer saves
+RESPONSE_ENDPOINTS = (
+    ('catalog', '/api/quizzes?all=1', 'user'),
+    ('users', '/api/users?all=1', 'admin'),
+    ('subjects', '/api/subjects?all=1', 'admin'),
+    ('questions', '/api/quizzes/{quiz_id}/questions?all=1', 'admin'),
+    ('attempt', '/api/quizzes/{quiz_id}/attempt', 'user'),
+)
+
+
+def _measure(client, path, headers, count):
+    """(status, wire bytes, CPU ms per request) for repeated GETs"""
+    cpu = 0.0
+    for _ in range(count):
+        started = time.process_time()
+        response = client.get(path, headers=headers)
+        cpu += time.process_time() - started
+    return response.status_code, len(response.data), cpu / count * 1000, response.get_etag()[0]
+
+
+@click.command('benchmark-responses')
+@click.option('--requests', 'count', default=50, show_default=True, help='Requests per endpoint and mode.')
+@click.option('--output', default='benchmark-responses.json', show_default=True, type=click.Path(dir_okay=False))
+@with_appcontext
+def benchmark_responses_command(count, output):
+    """Compare bytes sent and server CPU with and without fast JSON, compression and 304s."""
+    app = current_app._get_current_object()
+    usernames = [row[0] for row in db.session.query(User.username).filter(
+        User.username.like(f'{USER_PREFIX}%')).order_by(User.id).limit(1)]
+    db.session.remove()
+    bench = Benchmark(_TestClient(app), 1)
+    bench.prepare(usernames, app.config['ADMIN_EMAIL'], app.config['ADMIN_PASSWORD'])
+    tokens = {'admin': bench.admin_token, 'user': bench.user_tokens[0]}
+    quiz_id = max(bench.attempts, key=lambda attempt: len(attempt['questions']))['quiz_id']
+
+    modes = [('default json', DefaultJSONProvider, None)]
+    if orjson is not None:
+        modes.append(('orjson', OrjsonProvider, None))
+    fast = OrjsonProvider if orjson is not None else DefaultJSONProvider
+    modes.extend((f'{modes[-1][0]} + {coding}', fast, coding) for coding in reversed(available_encodings()))
+
+    client = app.test_client()
+    original = app.json
+    results = {'meta': {'commit': _git_commit(), 'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                        'requests': count, 'compress_min_bytes': app.config['COMPRESS_MIN_BYTES']},
+               'endpoints': {}}
+    try:
+        for name, path, role in RESPONSE_ENDPOINTS:
+            path = path.format(quiz_id=quiz_id)
+            auth = {'Authorization': f'Bearer {tokens[role]}'}
+            rows = {}
+            for label, provider, coding in modes:
+                app.json = provider(app)
+                headers = dict(auth, **{'Accept-Encoding': coding or 'identity'})
+                status, size, cpu_ms, etag = _measure(client, path, headers, count)
+                rows[label] = {'status': status, 'bytes': size, 'cpu_ms': round(cpu_ms, 3)}
+            # Revalidation with the ETag of the last representation
+            status, size, cpu_ms, _ = _measure(client, path, dict(headers, **{'If-None-Match': f'"{etag}"'}), count)
+            rows['revalidated (304)'] = {'status': status, 'bytes': size, 'cpu_ms': round(cpu_ms, 3)}
+            results['endpoints'][name] = rows
+
+            baseline = rows['default json']
+            click.echo(f'{name} ({path})')
+            for label, row in rows.items():
+                saved_bytes = 100 - row['bytes'] * 100 / baseline['bytes'] if baseline['bytes'] else 0
+                saved_cpu = 100 - row['cpu_ms'] * 100 / baseline['cpu_ms'] if baseline['cpu_ms'] else 0
+                click.echo(f"  {label:<24} {row['status']}  {row['bytes']:>9} B ({saved_bytes:+6.1f}% saved)  "
+                           f"{row['cpu_ms']:>8.3f} ms CPU ({saved_cpu:+6.1f}% saved)")
+    finally:
+        app.json = original
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {output}')
+
+
+# What each kind of process runs at startup, in a fresh interpreter per run
+STARTUP_ENTRIES = {
+    'web': 'import app',
+    'worker': 'import tasks; tasks.worker_app()',
+    'cli': 'import app',
+}
+# Dependencies a profile should only load if it uses them
+HEAVY_MODULES = ('alembic', 'apscheduler', 'flask_mail', 'flask_migrate', 'flask_cors', 'flask_jwt_extended')
+
+_STARTUP_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+{entry}
+ready = time.perf_counter()
+# What a task that built its own app used to pay on every run
+from app_factory import create_app
+create_app({profile!r})
+rebuilt = time.perf_counter()
+try:
+    with open('/proc/self/status') as status:
+        rss = next(int(line.split()[1]) / 1024 for line in status if line.startswith('VmHWM:'))
+except (OSError, StopIteration):
+    rss = None
+print(json.dumps({{
+    'ms': (ready - started) * 1000,
+    'rebuild_ms': (rebuilt - ready) * 1000,
+    'modules': len(sys.modules),
+    'max_rss_mib': rss,
+    'heavy': sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+'''
+
+
+def _startup_run(profile):
+    backend = os.path.dirname(os.path.abspath(__file__))
+    probe = _STARTUP_PROBE.format(backend=backend, entry=STARTUP_ENTRIES[profile], profile=profile,
+                                  heavy=HEAVY_MODULES)
+    env = dict(os.environ, APP_PROFILE=profile, SCHEDULER_ENABLED='false')
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, env=env, cwd=backend)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise click.ClickException(f'{profile} startup failed:\n{result.stderr}')
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run['wall_ms'] = wall * 1000
+    return run
+
+
+@click.command('benchmark-startup')
+@click.option('--profile', 'profiles', multiple=True, type=click.Choice(tuple(STARTUP_ENTRIES)),
+              help='App profile to measure; repeatable. Defaults to all.')
+@click.option('--runs', default=5, show_default=True, help='Fresh interpreters started per profile.')
+@click.option('--output', default='benchmark-startup.json', show_default=True, type=click.Path(dir_okay=False))
+def benchmark_startup_command(profiles, runs, output):
+    """Measure startup time, modules loaded and memory of each app profile."""
+    results = {'meta': {'commit': _git_commit(), 'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                        'python': platform.python_version(), 'runs': runs},
+               'profiles': {}}
+    for profile in profiles or tuple(STARTUP_ENTRIES):
+        samples = [_startup_run(profile) for _ in range(runs)]
+        ordered = sorted(sample['ms'] for sample in samples)
+        summary = {
+            'entry': STARTUP_ENTRIES[profile],
+            'import_and_build_ms': {'min': round(ordered[0], 1), 'p50': round(_percentile(ordered, 50), 1),
+                                    'max': round(ordered[-1], 1)},
+            'process_wall_ms_p50': round(_percentile(sorted(sample['wall_ms'] for sample in samples), 50), 1),
+            'rebuild_ms_p50': round(_percentile(sorted(sample['rebuild_ms'] for sample in samples), 50), 2),
+            'modules': samples[-1]['modules'],
+            'max_rss_mib': max((sample['max_rss_mib'] or 0 for sample in samples), default=0),
+            'heavy_modules': samples[-1]['heavy'],
+        }
+        results['profiles'][profile] = summary
+        timing = summary['import_and_build_ms']
+        click.echo(f"{profile:<7} p50 {timing['p50']:>7.1f} ms (min {timing['min']:.1f})  "
+                   f"process {summary['process_wall_ms_p50']:>7.1f} ms  rebuild {summary['rebuild_ms_p50']:>6.2f} ms  "
+                   f"{summary['modules']:>5} modules  {summary['max_rss_mib']:>6.1f} MiB  heavy: {', '.join(summary['heavy_modules']) or '-'}")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    click.echo(f'Results written to {output}')
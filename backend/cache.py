@@ -0,0 +1,154 @@
+import threading
+import time
+import uuid
+import redis
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Subject, Chapter, Quiz, Question
+
+# Cache namespaces and the models whose writes invalidate them
+NAMESPACE_MODELS = {
+    'catalog': (Subject, Chapter, Quiz, Question),
+}
+
+
+class _MemoryStore:
+    """Per-process fallback used when Redis is not configured or unreachable"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def setex(self, key, ttl, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value, _ = self._data.get(key, (0, None))
+            self._data[key] = (int(value) + 1, None)
+            return int(value) + 1
+
+
+class Cache:
+    """Versioned cache: entries are keyed by a namespace version that writes bump"""
+
+    def __init__(self, app=None):
+        self.redis = None
+        self.memory = _MemoryStore()
+        self.default_ttl = 300
+        self._pending_bumps = set()  # namespaces whose bump has not reached Redis yet
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('CACHE_REDIS_URL')
+        if url:
+            self.redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+        app.extensions['cache'] = self
+
+    def _call(self, method, *args, local_fallback=True):
+        if self.redis is not None:
+            try:
+                return getattr(self.redis, method)(*args)
+            except redis.RedisError:
+                pass
+        if local_fallback:
+            return getattr(self.memory, method)(*args)
+        return None
+
+    def get(self, key, local_fallback=True):
+        """Read a key; with local_fallback=False only the shared Redis tier is consulted"""
+        return self._call('get', key, local_fallback=local_fallback)
+
+    def set(self, key, value, ttl=None, local_fallback=True):
+        self._call('setex', key, ttl or self.default_ttl, value, local_fallback=local_fallback)
+
+    def delete(self, key):
+        self._call('delete', key)
+        self.memory.delete(key)
+
+    # Versions live only in Redis: a per-process counter would miss other processes'
+    # writes. Each bump sets a new random token rather than incrementing, so a Redis
+    # restart or a lost bump can never bring back a version an earlier ETag carries.
+    def version(self, namespace):
+        """Current version token of a namespace, or None while it can't be trusted"""
+        if self.redis is None:
+            return None
+        key = f'version:{namespace}'
+        try:
+            self._flush_bumps()
+            value = self.redis.get(key)
+            if value is None:
+                # First use, or Redis lost its data
+                self.redis.set(key, uuid.uuid4().hex, nx=True)
+                value = self.redis.get(key)
+        except redis.RedisError:
+            return None
+        return value.decode() if value is not None else None
+
+    def bump(self, namespace):
+        """Give a namespace a new version; one that can't reach Redis is retried before the next read"""
+        if self.redis is None:
+            return
+        with self._lock:
+            self._pending_bumps.add(namespace)
+        try:
+            self._flush_bumps()
+        except redis.RedisError:
+            current_app.logger.warning("Could not bump cache version for %s; will retry", namespace)
+
+    def _flush_bumps(self):
+        with self._lock:
+            pending = list(self._pending_bumps)
+        for namespace in pending:
+            self.redis.set(f'version:{namespace}', uuid.uuid4().hex)
+            with self._lock:
+                self._pending_bumps.discard(namespace)
+
+
+cache = Cache()
+
+
+def mark_changed(session, namespace):
+    """Invalidate a namespace once the session commits (for Core writes the ORM can't see)"""
+    session.info.setdefault('cache_changed', set()).add(namespace)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for namespace, models in NAMESPACE_MODELS.items():
+            if isinstance(obj, models):
+                mark_changed(session, namespace)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions(session):
+    changed = session.info.pop('cache_changed', None)
+    if changed and has_app_context() and 'cache' in current_app.extensions:
+        for namespace in changed:
+            current_app.extensions['cache'].bump(namespace)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('cache_changed', None)
@@ -11,9 +11,74 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///quiz_master.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool (server databases) and SQLite tuning
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_RECYCLE_SECONDS = int(os.getenv('DB_POOL_RECYCLE_SECONDS', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'True').lower() == 'true'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+    # Optional read replica for read-only endpoints (search, scores, stats); the cached,
+    # versioned catalog always reads the primary
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
+    # Report exports
+    REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE', 1000))
+    REPORT_TRACE_MEMORY = os.getenv('REPORT_TRACE_MEMORY', 'False').lower() == 'true'
+    REPORT_GZIP = os.getenv('REPORT_GZIP', 'False').lower() == 'true'
+    EXPORTS_DIR = os.getenv('EXPORTS_DIR', 'exports')
+    EXPORTS_MAX_AGE_DAYS = int(os.getenv('EXPORTS_MAX_AGE_DAYS', 7))
+    EXPORTS_MAX_TOTAL_MB = int(os.getenv('EXPORTS_MAX_TOTAL_MB', 1024))
+    EXPORTS_SWEEP_INTERVAL_HOURS = int(os.getenv('EXPORTS_SWEEP_INTERVAL_HOURS', 1))
+
+    # Task progress pushed to browsers over Server-Sent Events through Redis pub/sub
+    # (per-process memory when Redis is unavailable, which only reaches eager tasks)
+    TASK_EVENTS_REDIS_URL = os.getenv('TASK_EVENTS_REDIS_URL', os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/1'))
+    TASK_EVENTS_TTL = int(os.getenv('TASK_EVENTS_TTL', 86400))
+    TASK_EVENTS_TOKEN_MAX_AGE = int(os.getenv('TASK_EVENTS_TOKEN_MAX_AGE', 3600))
+    TASK_EVENTS_HEARTBEAT_SECONDS = int(os.getenv('TASK_EVENTS_HEARTBEAT_SECONDS', 15))
+    TASK_EVENTS_MAX_STREAM_SECONDS = int(os.getenv('TASK_EVENTS_MAX_STREAM_SECONDS', 300))
+    TASK_PROGRESS_INTERVAL_SECONDS = float(os.getenv('TASK_PROGRESS_INTERVAL_SECONDS', 0.5))
+
+    # Response cache (falls back to per-process memory when Redis is unavailable)
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/1')
+    CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+
+    # Per-process cache of user identity records, invalidated through Redis pub/sub
+    IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', 60))
+
+    # Published quiz snapshots
+    SNAPSHOT_LRU_SIZE = int(os.getenv('SNAPSHOT_LRU_SIZE', 256))
+    SNAPSHOT_CACHE_TTL = int(os.getenv('SNAPSHOT_CACHE_TTL', 86400))
+    SNAPSHOT_POINTER_TTL = int(os.getenv('SNAPSHOT_POINTER_TTL', 60))
+
+    # Sorted-set leaderboards (per-process memory when Redis is unavailable)
+    LEADERBOARD_REDIS_URL = os.getenv('LEADERBOARD_REDIS_URL', CACHE_REDIS_URL)
+    LEADERBOARD_MAX_K = int(os.getenv('LEADERBOARD_MAX_K', 100))
+
+    # Score ingestion: 'sync' writes on submit, 'queued' appends to a durable queue
+    # ('redis' stream or local 'file' log) that a background drainer flushes in batches.
+    # A 'file' log is per host, so every host must run the scheduler to drain its own.
+    SCORE_WRITE_MODE = os.getenv('SCORE_WRITE_MODE', 'sync')
+    SCORE_QUEUE_BACKEND = os.getenv('SCORE_QUEUE_BACKEND', 'redis')
+    SCORE_QUEUE_REDIS_URL = os.getenv('SCORE_QUEUE_REDIS_URL', 'redis://localhost:6379/2')
+    SCORE_QUEUE_STREAM = os.getenv('SCORE_QUEUE_STREAM', 'score-submissions')
+    SCORE_QUEUE_DIR = os.getenv('SCORE_QUEUE_DIR', 'score_queue')
+    SCORE_QUEUE_BATCH_SIZE = int(os.getenv('SCORE_QUEUE_BATCH_SIZE', 500))
+    SCORE_DRAIN_INTERVAL_SECONDS = int(os.getenv('SCORE_DRAIN_INTERVAL_SECONDS', 2))
+
+    # List endpoint pagination
+    PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', 50))
+    PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', 500))
+
+    # Bulk question import
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@example.com')
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')
     
@@ -23,4 +88,52 @@ class Config:
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'True').lower() == 'true'
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
-    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@quizmaster.com')
\ No newline at end of file
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@quizmaster.com')
+
+    # Messages sent over one SMTP connection before it is recycled
+    MAIL_MAX_EMAILS = int(os.getenv('MAIL_MAX_EMAILS', 100))
+
+    # Google Chat webhook dispatch
+    GCHAT_MAX_WORKERS = int(os.getenv('GCHAT_MAX_WORKERS', 16))
+    GCHAT_PER_HOST_LIMIT = int(os.getenv('GCHAT_PER_HOST_LIMIT', 8))
+    GCHAT_TIMEOUT_SECONDS = int(os.getenv('GCHAT_TIMEOUT_SECONDS', 10))
+    GCHAT_MAX_RETRIES = int(os.getenv('GCHAT_MAX_RETRIES', 3))
+
+    # Monthly report recipients loaded, rendered and sent per batch
+    MONTHLY_REPORT_BATCH_SIZE = int(os.getenv('MONTHLY_REPORT_BATCH_SIZE', 1000))
+    # The scheduler checks this often whether the month's reports still need sending,
+    # and gives up on a month this many days after the 1st
+    MONTHLY_REPORT_CHECK_MINUTES = int(os.getenv('MONTHLY_REPORT_CHECK_MINUTES', 15))
+    MONTHLY_REPORT_CATCHUP_DAYS = int(os.getenv('MONTHLY_REPORT_CATCHUP_DAYS', 3))
+
+    # Subject/chapter/quiz deletions remove this many rows per statement and transaction
+    DELETE_BATCH_SIZE = int(os.getenv('DELETE_BATCH_SIZE', 1000))
+
+    # Content counters are recounted this often to repair any drift
+    COUNTER_RECONCILE_INTERVAL_HOURS = int(os.getenv('COUNTER_RECONCILE_INTERVAL_HOURS', 6))
+
+    # Periodic jobs: the dev server runs them in-process; deployments run `flask run-scheduler`.
+    # Either way only the holder of the scheduler lease executes them.
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'True').lower() == 'true'
+    SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', 60))
+    # Job run history older than this is pruned as new runs are recorded
+    JOB_RUN_RETENTION_DAYS = int(os.getenv('JOB_RUN_RETENTION_DAYS', 30))
+
+    # What create_app() initializes: 'web', 'worker' or 'cli' (see app_factory.py). When
+    # unset, the flask command gets 'cli' and everything else 'web'.
+    APP_PROFILE = os.getenv('APP_PROFILE')
+
+    # Daily reminders are sent in notification_time buckets of this many minutes
+    REMINDER_BUCKET_MINUTES = int(os.getenv('REMINDER_BUCKET_MINUTES', 5))
+    REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 500))
+    REMINDER_CATCHUP_MINUTES = int(os.getenv('REMINDER_CATCHUP_MINUTES', 60))
+
+    # Performance instrumentation and the /metrics endpoint (off by default)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 200))
+
+    # API responses: JSON encoder ('orjson' when installed, or 'default') and compression
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'orjson')
+    COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
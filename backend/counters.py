@@ -0,0 +1,205 @@
+from collections import Counter
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+from models import db, ContentCounter, User, Subject, Chapter, Quiz, Question
+
+# Content counters: row counts kept in content_counter and adjusted in the same
+# transaction as the writes that change them, so dashboards read totals in O(1)
+# instead of running COUNT(*). ORM inserts and deletes (including cascades) are
+# counted automatically at flush; Core bulk writes call adjust_for_quiz() or
+# adjust(). reconcile_counters() recounts everything periodically to repair drift.
+SITE = 0  # subject_id of the site-wide totals
+SITE_COUNTERS = ('subjects', 'chapters', 'quizzes', 'questions', 'users')
+SUBJECT_COUNTERS = ('chapters', 'quizzes', 'questions')
+
+
+def _upsert(connection, subject_id, name, delta):
+    """Add delta to a counter, creating it if needed"""
+    table = ContentCounter.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table).values(subject_id=subject_id, name=name, value=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['subject_id', 'name'], set_={'value': table.c.value + stmt.excluded.value}
+        )
+        connection.execute(stmt)
+        return
+    result = connection.execute(
+        update(table).where(table.c.subject_id == subject_id, table.c.name == name)
+        .values(value=table.c.value + delta)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(subject_id=subject_id, name=name, value=delta))
+
+
+def adjust(connection, deltas):
+    """Apply {(subject_id, name): delta} in the connection's transaction"""
+    # A fixed order keeps concurrent transactions from deadlocking on the counter rows
+    for (subject_id, name), delta in sorted(deltas.items()):
+        if delta:
+            _upsert(connection, subject_id, name, delta)
+
+
+def adjust_for_quiz(session, quiz_id, name, delta):
+    """Count Core-inserted or -deleted rows under a quiz, e.g. imported questions"""
+    subject_id = session.execute(
+        select(Chapter.subject_id).join(Quiz, Quiz.chapter_id == Chapter.id).filter(Quiz.id == quiz_id)
+    ).scalar()
+    deltas = {(SITE, name): delta}
+    if subject_id is not None:
+        deltas[(subject_id, name)] = delta
+    adjust(session.connection(), deltas)
+
+
+def get_counters(subject_id=SITE):
+    """{name: value} for the site totals or one subject"""
+    values = dict(db.session.query(ContentCounter.name, ContentCounter.value)
+                  .filter(ContentCounter.subject_id == subject_id))
+    names = SITE_COUNTERS if subject_id == SITE else SUBJECT_COUNTERS
+    return {name: values.get(name, 0) for name in names}
+
+
+def subject_counters(subject_ids):
+    """{subject_id: {name: value}} for several subjects in one query"""
+    counts = {subject_id: dict.fromkeys(SUBJECT_COUNTERS, 0) for subject_id in subject_ids}
+    if subject_ids:
+        rows = db.session.query(ContentCounter.subject_id, ContentCounter.name, ContentCounter.value)\
+            .filter(ContentCounter.subject_id.in_(subject_ids))
+        for subject_id, name, value in rows:
+            counts[subject_id][name] = value
+    return counts
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_flushed(session, flush_context):
+    added = [(obj, 1) for obj in session.new]
+    removed = [(obj, -1) for obj in session.deleted]
+    deltas = Counter()
+    dropped_subjects = set()
+
+    # Parents are resolved from objects in this flush first (a cascade deletes them
+    # together), then from the database
+    chapter_subject = {}
+    quiz_chapter = {}
+    for obj, _ in added + removed:
+        if isinstance(obj, Chapter):
+            chapter_subject[obj.id] = obj.subject_id
+        elif isinstance(obj, Quiz):
+            quiz_chapter[obj.id] = obj.chapter_id
+
+    pending = []  # (name, sign, chapter_id, quiz_id); one of the two ids is known
+    for obj, sign in added + removed:
+        if isinstance(obj, Subject):
+            deltas[(SITE, 'subjects')] += sign
+            if sign < 0:
+                dropped_subjects.add(obj.id)
+        elif isinstance(obj, Chapter):
+            pending.append(('chapters', sign, obj.id, None))
+        elif isinstance(obj, Quiz):
+            pending.append(('quizzes', sign, obj.chapter_id, None))
+        elif isinstance(obj, Question):
+            pending.append(('questions', sign, None, obj.quiz_id))
+        elif isinstance(obj, User) and obj.role != 'admin':
+            deltas[(SITE, 'users')] += sign
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            history = inspect(obj).attrs.role.history
+            if history.deleted and history.added:
+                was_user, is_user = history.deleted[0] != 'admin', history.added[0] != 'admin'
+                deltas[(SITE, 'users')] += is_user - was_user
+    if not deltas and not pending:
+        return
+
+    connection = session.connection()
+    missing = {quiz_id for *_, quiz_id in pending if quiz_id is not None and quiz_id not in quiz_chapter}
+    if missing:
+        quiz_chapter.update(connection.execute(
+            select(Quiz.id, Quiz.chapter_id).filter(Quiz.id.in_(missing))).all())
+    pending = [(name, sign, chapter_id if chapter_id is not None else quiz_chapter.get(quiz_id))
+               for name, sign, chapter_id, quiz_id in pending]
+    missing = {chapter_id for _, _, chapter_id in pending
+               if chapter_id is not None and chapter_id not in chapter_subject}
+    if missing:
+        chapter_subject.update(connection.execute(
+            select(Chapter.id, Chapter.subject_id).filter(Chapter.id.in_(missing))).all())
+
+    for name, sign, chapter_id in pending:
+        deltas[(SITE, name)] += sign
+        subject_id = chapter_subject.get(chapter_id)
+        if subject_id is not None and subject_id not in dropped_subjects:
+            deltas[(subject_id, name)] += sign
+
+    adjust(connection, deltas)
+    if dropped_subjects:
+        connection.execute(delete(ContentCounter).where(ContentCounter.subject_id.in_(dropped_subjects)))
+
+
+def _actual_counts(connection):
+    """Recount every counter from the content tables"""
+    counts = {}
+    for (subject_id,) in connection.execute(select(Subject.id)):
+        for name in SUBJECT_COUNTERS:
+            counts[(subject_id, name)] = 0
+    per_subject = {
+        'chapters': select(Chapter.subject_id, func.count(Chapter.id)).group_by(Chapter.subject_id),
+        'quizzes': select(Chapter.subject_id, func.count(Quiz.id)).join(Quiz, Quiz.chapter_id == Chapter.id)
+        .group_by(Chapter.subject_id),
+        'questions': select(Chapter.subject_id, func.count(Question.id)).join(Quiz, Quiz.chapter_id == Chapter.id)
+        .join(Question, Question.quiz_id == Quiz.id).group_by(Chapter.subject_id),
+    }
+    for name, stmt in per_subject.items():
+        for subject_id, value in connection.execute(stmt):
+            counts[(subject_id, name)] = value
+        counts[(SITE, name)] = sum(value for (s, n), value in counts.items() if n == name and s != SITE)
+    counts[(SITE, 'subjects')] = connection.execute(select(func.count(Subject.id))).scalar()
+    counts[(SITE, 'users')] = connection.execute(
+        select(func.count(User.id)).filter(User.role != 'admin')).scalar()
+    return counts
+
+
+def reconcile_counters():
+    """Recount all counters and correct any that drifted; returns {(subject_id, name): (stored, actual)}"""
+    engine = db.engine
+    options = {'isolation_level': 'REPEATABLE READ'} if engine.dialect.name == 'postgresql' else {}
+    # Stored values and recounts come from one snapshot, and corrections are applied as
+    # deltas, so writes committed while this runs are neither lost nor counted twice
+    with engine.connect().execution_options(**options) as connection:
+        with connection.begin():
+            if engine.dialect.name == 'sqlite':
+                # pysqlite doesn't begin a transaction for SELECTs, which would leave each
+                # statement its own snapshot; an explicit BEGIN holds one for all of them
+                connection.exec_driver_sql('BEGIN')
+            stored = {(subject_id, name): value for subject_id, name, value in connection.execute(
+                select(ContentCounter.subject_id, ContentCounter.name, ContentCounter.value))}
+            actual = _actual_counts(connection)
+
+    drift = {key: (stored.get(key, 0), value) for key, value in actual.items() if stored.get(key, 0) != value}
+    # Rows left behind for subjects that no longer exist
+    drift.update({key: (value, None) for key, value in stored.items() if key not in actual})
+    connection = db.session.connection()
+    adjust(connection, {key: new - old for key, (old, new) in drift.items() if new is not None})
+    stale = {subject_id for (subject_id, _), (_, new) in drift.items() if new is None}
+    if stale:
+        connection.execute(delete(ContentCounter).where(ContentCounter.subject_id.in_(stale)))
+    db.session.commit()
+    if drift:
+        current_app.logger.warning("Corrected %d drifted content counters: %s", len(drift), drift)
+    return drift
+
+
+@click.command('reconcile-counters')
+@with_appcontext
+def reconcile_counters_command():
+    """Recount content counters and fix any drift."""
+    drift = reconcile_counters()
+    for (subject_id, name), (old, new) in sorted(drift.items()):
+        scope = 'site' if subject_id == SITE else f'subject {subject_id}'
+        click.echo(f'{scope} {name}: {old} -> {new}')
+    click.echo(f'Reconciled content counters: {len(drift)} corrected.')
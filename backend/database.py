@@ -0,0 +1,79 @@
+from functools import wraps
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Database profile: connection pool settings, SQLite pragmas and read-replica routing.
+REPLICA = 'replica'
+
+
+def engine_options(config, url):
+    """Engine options for a database URL"""
+    if make_url(url).get_backend_name() == 'sqlite':
+        # Connections are cheap local file handles; Flask-SQLAlchemy picks the pool
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE_SECONDS'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def configure_database(app):
+    """Fill in engine options and the optional replica bind; call before db.init_app"""
+    config = app.config
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config, config['SQLALCHEMY_DATABASE_URI'])
+    if config['DATABASE_REPLICA_URL']:
+        config['SQLALCHEMY_BINDS'] = {
+            REPLICA: {'url': config['DATABASE_REPLICA_URL'],
+                      **engine_options(config, config['DATABASE_REPLICA_URL'])},
+        }
+
+
+def init_database(app, db):
+    """Apply SQLite pragmas to every new connection; call after db.init_app"""
+    pragmas = (
+        # WAL lets readers proceed while a writer commits
+        'PRAGMA journal_mode=WAL',
+        f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}",
+        f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={app.config['SQLITE_MMAP_SIZE']}",
+    )
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                event.listen(engine, 'connect', set_pragmas)
+
+
+class RoutingSession(Session):
+    """Sends reads from replica-routed requests to the replica; writes stay on the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and not getattr(clause, 'is_dml', False)
+            and has_request_context()
+            and g.get('use_replica')
+            and REPLICA in self._db.engines
+        ):
+            return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_reads(fn):
+    """Serve a read-only endpoint's queries from the read replica, when one is configured"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,199 @@
+import time
+from collections import Counter
+from sqlalchemy import delete, func, select
+from models import db, ContentCounter, Subject, Chapter, Quiz, QuizSnapshot, Question, Score
+from cache import mark_changed
+from counters import SITE, adjust
+from leaderboards import board_key, leaderboards
+from search import delete_documents
+from snapshots import mark_quizzes_deleted, mark_snapshots_deleted
+from stats import refresh_user_stats
+
+# Set-based deletion of a subject, chapter or quiz and everything under it. Rather than
+# loading the whole tree into the session for the ORM cascade, rows are deleted
+# bottom-up with DELETE ... WHERE id IN (...) in batches, each in its own short
+# transaction. Everything derived from the deleted rows is kept in step batch by batch:
+# content counters, user_stats, leaderboards, the search index, the catalog cache
+# version and cached snapshots.
+#
+# An interrupted deletion leaves a smaller tree behind and can simply be run again.
+
+
+def _quiz_filter(kind, ref_id):
+    if kind == 'subject':
+        return Quiz.chapter_id.in_(select(Chapter.id).filter(Chapter.subject_id == ref_id))
+    if kind == 'chapter':
+        return Quiz.chapter_id == ref_id
+    return Quiz.id == ref_id
+
+
+def _scope(kind, ref_id):
+    """(subject_id, chapter_id) the target belongs to, or None if it does not exist"""
+    if kind == 'subject':
+        found = db.session.get(Subject, ref_id)
+        return (ref_id, None) if found else None
+    if kind == 'chapter':
+        subject_id = db.session.query(Chapter.subject_id).filter(Chapter.id == ref_id).scalar()
+        return (subject_id, ref_id) if subject_id is not None else None
+    row = db.session.query(Chapter.subject_id, Quiz.chapter_id).join(Quiz, Quiz.chapter_id == Chapter.id)\
+        .filter(Quiz.id == ref_id).first()
+    return tuple(row) if row else None
+
+
+def score_batch_query(quiz_ids, limit):
+    """Next batch of the quizzes' scores to delete"""
+    return select(Score.id, Score.quiz_id, Score.user_id).filter(Score.quiz_id.in_(quiz_ids)).limit(limit)
+
+
+def count_tree(kind, ref_id):
+    """Rows a deletion of the target will remove"""
+    quizzes = select(Quiz.id).filter(_quiz_filter(kind, ref_id))
+    total = sum(
+        db.session.query(func.count(model.id)).filter(model.quiz_id.in_(quizzes)).scalar()
+        for model in (Score, Question, QuizSnapshot)
+    )
+    total += db.session.query(func.count(Quiz.id)).filter(_quiz_filter(kind, ref_id)).scalar()
+    if kind == 'subject':
+        total += db.session.query(func.count(Chapter.id)).filter(Chapter.subject_id == ref_id).scalar() + 1
+    elif kind == 'chapter':
+        total += 1
+    return total
+
+
+class _TreeDeletion:
+    def __init__(self, kind, ref_id, batch_size, progress):
+        self.kind = kind
+        self.ref_id = ref_id
+        self.batch_size = batch_size
+        self.progress = progress
+        self.subject_id, self.chapter_id = _scope(kind, ref_id)
+        self.deleted = Counter()
+        self.total = count_tree(kind, ref_id)
+        # Boards above the target that its scores also counted towards
+        self.ancestor_boards = [board_key('global')]
+        if kind in ('chapter', 'quiz'):
+            self.ancestor_boards.append(board_key('subject', self.subject_id))
+        if kind == 'quiz':
+            self.ancestor_boards.append(board_key('chapter', self.chapter_id))
+
+    def _commit(self, name, count, counter_deltas=None):
+        if counter_deltas:
+            adjust(db.session.connection(), counter_deltas)
+        mark_changed(db.session, 'catalog')
+        db.session.commit()
+        self.deleted[name] += count
+        if self.progress:
+            self.progress(sum(self.deleted.values()), self.total)
+
+    def _counter_deltas(self, name, count):
+        return {(SITE, name): -count, (self.subject_id, name): -count}
+
+    @staticmethod
+    def _best_scores(pairs):
+        """{(quiz_id, user_id): best score} for the pairs that have scores"""
+        rows = db.session.execute(
+            select(Score.quiz_id, Score.user_id, func.max(Score.total_scored))
+            .filter(Score.quiz_id.in_({quiz_id for quiz_id, _ in pairs}),
+                    Score.user_id.in_({user_id for _, user_id in pairs}))
+            .group_by(Score.quiz_id, Score.user_id)
+        ).all()
+        return {(quiz_id, user_id): best for quiz_id, user_id, best in rows if (quiz_id, user_id) in pairs}
+
+    def _delete_scores(self, quiz_ids):
+        while True:
+            rows = db.session.execute(score_batch_query(quiz_ids, self.batch_size)).all()
+            if not rows:
+                return
+            # The boards above a quiz hold each user's best on it, so they lose the
+            # difference between the best before and after this batch
+            pairs = {(quiz_id, user_id) for _, quiz_id, user_id in rows}
+            before = self._best_scores(pairs)
+            db.session.execute(delete(Score).where(Score.id.in_([row[0] for row in rows])))
+            after = self._best_scores(pairs)
+            points = Counter()
+            for (quiz_id, user_id), best in before.items():
+                points[user_id] += best - after.get((quiz_id, user_id), 0)
+            refresh_user_stats({user_id for _, user_id in pairs})
+            self._commit('scores', len(rows))
+            leaderboards.subtract(self.ancestor_boards, points)
+
+    def _delete_questions(self, quiz_ids):
+        while True:
+            ids = db.session.execute(
+                select(Question.id).filter(Question.quiz_id.in_(quiz_ids)).limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return
+            db.session.execute(delete(Question).where(Question.id.in_(ids)))
+            self._commit('questions', len(ids), self._counter_deltas('questions', len(ids)))
+
+    def _delete_snapshots(self, quiz_ids):
+        while True:
+            rows = db.session.execute(
+                select(QuizSnapshot.id, QuizSnapshot.token)
+                .filter(QuizSnapshot.quiz_id.in_(quiz_ids)).limit(self.batch_size)
+            ).all()
+            if not rows:
+                return
+            db.session.execute(delete(QuizSnapshot).where(QuizSnapshot.id.in_([row[0] for row in rows])))
+            # Evicted from the in-process LRU and Redis when the batch commits
+            mark_snapshots_deleted(db.session, [row[1] for row in rows])
+            self._commit('snapshots', len(rows))
+
+    def _delete_quizzes(self):
+        while True:
+            quiz_ids = db.session.execute(
+                select(Quiz.id).filter(_quiz_filter(self.kind, self.ref_id)).order_by(Quiz.id).limit(self.batch_size)
+            ).scalars().all()
+            if not quiz_ids:
+                return
+            self._delete_scores(quiz_ids)
+            self._delete_questions(quiz_ids)
+            self._delete_snapshots(quiz_ids)
+            db.session.execute(delete(Quiz).where(Quiz.id.in_(quiz_ids)))
+            delete_documents(db.session.connection(), 'quiz', quiz_ids)
+            mark_quizzes_deleted(db.session, quiz_ids)
+            self._commit('quizzes', len(quiz_ids), self._counter_deltas('quizzes', len(quiz_ids)))
+            leaderboards.discard(board_key('quiz', quiz_id) for quiz_id in quiz_ids)
+
+    def _delete_chapters(self, chapter_filter):
+        while True:
+            chapter_ids = db.session.execute(
+                select(Chapter.id).filter(chapter_filter).limit(self.batch_size)
+            ).scalars().all()
+            if not chapter_ids:
+                return
+            db.session.execute(delete(Chapter).where(Chapter.id.in_(chapter_ids)))
+            delete_documents(db.session.connection(), 'chapter', chapter_ids)
+            self._commit('chapters', len(chapter_ids), self._counter_deltas('chapters', len(chapter_ids)))
+            leaderboards.discard(board_key('chapter', chapter_id) for chapter_id in chapter_ids)
+
+    def run(self):
+        self._delete_quizzes()
+        if self.kind == 'chapter':
+            self._delete_chapters(Chapter.id == self.ref_id)
+        elif self.kind == 'subject':
+            self._delete_chapters(Chapter.subject_id == self.ref_id)
+            db.session.execute(delete(Subject).where(Subject.id == self.ref_id))
+            delete_documents(db.session.connection(), 'subject', [self.ref_id])
+            # The subject's own counter rows go with it
+            connection = db.session.connection()
+            adjust(connection, {(SITE, 'subjects'): -1})
+            connection.execute(delete(ContentCounter).where(ContentCounter.subject_id == self.ref_id))
+            self._commit('subjects', 1)
+            leaderboards.discard([board_key('subject', self.ref_id)])
+        return dict(self.deleted)
+
+
+def delete_tree(kind, ref_id, batch_size, progress=None):
+    """Delete a subject, chapter or quiz and everything under it in bounded batches.
+
+    progress(deleted_rows, total_rows) is called after every batch commits. Returns
+    deleted row counts by table, or None if the target does not exist.
+    """
+    if _scope(kind, ref_id) is None:
+        return None
+    started = time.perf_counter()
+    deleted = _TreeDeletion(kind, ref_id, batch_size, progress).run()
+    deleted['seconds'] = round(time.perf_counter() - started, 3)
+    return deleted
@@ -0,0 +1,63 @@
+import gzip
+import os
+import time
+from flask import current_app
+
+PARTIAL_SUFFIX = '.part'
+
+
+def exports_dir(app=None):
+    """Absolute path of the report exports directory (created on demand)"""
+    app = app or current_app
+    path = os.path.join(app.root_path, app.config['EXPORTS_DIR'])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def open_export(path, compress=False):
+    """Open an export file for CSV writing, gzip-compressed when requested"""
+    if compress:
+        return gzip.open(path, 'wt', newline='', compresslevel=6)
+    return open(path, 'w', newline='')
+
+
+def sweep_exports(directory, max_age_days, max_total_bytes):
+    """Delete expired report files, then the oldest ones until under the size budget.
+
+    Returns the list of deleted file names.
+    """
+    if not os.path.isdir(directory):
+        return []
+
+    now = time.time()
+    max_age_seconds = max_age_days * 24 * 3600
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+
+    deleted = []
+    kept = []
+    for mtime, size, name in sorted(files):
+        if now - mtime > max_age_seconds:
+            deleted.append(name)
+        else:
+            kept.append((mtime, size, name))
+
+    # Oldest first; never evict a report that is still being written
+    total = sum(size for _, size, _ in kept)
+    for mtime, size, name in kept:
+        if total <= max_total_bytes:
+            break
+        if name.endswith(PARTIAL_SUFFIX):
+            continue
+        deleted.append(name)
+        total -= size
+
+    for name in deleted:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+    return deleted
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+import redis
+from flask import current_app
+from models import db, User
+
+# Authorization trusts the signed 'role' claim in the access token, and profile reads are
+# served from a short-lived per-process cache. Both stay safe across workers through
+# identity events published on Redis: every worker subscribes, evicts cached records, and
+# rejects tokens a user was issued before their last revocation (role change or deletion).
+CHANNEL = 'identity-events'
+REVOCATIONS_KEY = 'identity:revocations'
+# The standard iat claim is whole seconds, too coarse to order a token against a
+# revocation in the same second, so tokens also carry their issue time in microseconds
+ISSUED_AT_CLAIM = 'iat_us'
+
+
+class IdentityCache:
+    def __init__(self):
+        self._records = {}
+        self._revoked_at = {}
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._synced = False
+        self.redis = None
+        self.ttl = 60
+        self.token_lifetime = 15 * 60
+
+    def init_app(self, app):
+        url = app.config.get('CACHE_REDIS_URL')
+        if url:
+            self.redis = redis.Redis.from_url(url, socket_connect_timeout=0.5)
+        self.ttl = app.config['IDENTITY_CACHE_TTL']
+        expires = app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+        if expires:
+            self.token_lifetime = int(expires.total_seconds())
+        app.extensions['identity_cache'] = self
+
+    # --- Cached identity records ---
+    def get_profile(self, user_id):
+        """Identity/profile fields for a user, or None if the user does not exist"""
+        self._ensure_listener()
+        now = time.monotonic()
+        with self._lock:
+            item = self._records.get(user_id)
+        if item is not None and item[1] > now:
+            return item[0]
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        record = {
+            'id': user.id,
+            'full_name': user.full_name,
+            'role': user.role,
+            'notifications_enabled': user.notifications_enabled,
+            'email_notifications': user.email_notifications,
+            'gchat_webhook': user.gchat_webhook,
+            'notification_time': user.notification_time.strftime('%H:%M') if user.notification_time else None,
+        }
+        with self._lock:
+            self._records[user_id] = (record, now + self.ttl)
+        return record
+
+    def _evict(self, user_id, revoked_at=None):
+        with self._lock:
+            self._records.pop(user_id, None)
+            if revoked_at is not None:
+                self._revoked_at[user_id] = max(revoked_at, self._revoked_at.get(user_id, 0))
+
+    # --- Token revocation ---
+    def is_revoked(self, user_id, issued_at):
+        """True if the token was issued before the user's last revocation"""
+        self._ensure_listener()
+        with self._lock:
+            revoked_at = self._revoked_at.get(user_id)
+        # Equal times count as revoked: a whole-second iat may be rounded down from after it
+        return revoked_at is not None and issued_at <= revoked_at
+
+    def revocations_current(self):
+        """False while this process may have missed revocations (Redis unreachable or resubscribing)"""
+        self._ensure_listener()
+        return self.redis is None or self._synced
+
+    # --- Events ---
+    def publish(self, user_id, revoke=False):
+        """Invalidate a user's cached record everywhere; revoke also kills their current tokens"""
+        revoked_at = time.time() if revoke else None
+        self._evict(user_id, revoked_at)
+        if self.redis is None:
+            return
+        try:
+            if revoke:
+                self.redis.hset(REVOCATIONS_KEY, user_id, revoked_at)
+            self.redis.publish(CHANNEL, json.dumps({'user_id': user_id, 'revoked_at': revoked_at}))
+        except redis.RedisError:
+            current_app.logger.warning("Could not publish identity event for user %s", user_id)
+
+    def _ensure_listener(self):
+        # One subscriber thread per process (re-created after fork)
+        if self.redis is None or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._synced = False
+        # Load the revocations before the first token check rather than leaving it to the
+        # listener thread, so a fresh worker doesn't accept revoked tokens meanwhile
+        try:
+            self._load_revocations()
+            self._synced = True
+        except redis.RedisError:
+            current_app.logger.warning("Could not load token revocations; admin roles are checked in the database")
+        threading.Thread(target=self._listen, name='identity-events', daemon=True).start()
+
+    def _load_revocations(self):
+        cutoff = int(time.time()) - self.token_lifetime
+        for user_id, revoked_at in self.redis.hgetall(REVOCATIONS_KEY).items():
+            if float(revoked_at) < cutoff:
+                # Every token issued before this has expired anyway
+                self.redis.hdel(REVOCATIONS_KEY, user_id)
+            else:
+                self._evict(int(user_id), float(revoked_at))
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Catch up on revocations published while we were not subscribed
+                self._load_revocations()
+                self._synced = True
+                for message in pubsub.listen():
+                    event = json.loads(message['data'])
+                    self._evict(event['user_id'], event.get('revoked_at'))
+            except redis.RedisError:
+                self._synced = False
+                time.sleep(5)
+
+
+identity_cache = IdentityCache()
+
+
+def issued_at_claims(identity):
+    """flask-jwt-extended additional claims callback"""
+    return {ISSUED_AT_CLAIM: int(time.time() * 1_000_000)}
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """flask-jwt-extended blocklist callback"""
+    if ISSUED_AT_CLAIM in jwt_payload:
+        issued_at = jwt_payload[ISSUED_AT_CLAIM] / 1_000_000
+    else:
+        # Tokens issued before the claim existed
+        issued_at = jwt_payload['iat']
+    return identity_cache.is_revoked(int(jwt_payload['sub']), issued_at)
@@ -0,0 +1,341 @@
+import bisect
+import threading
+import click
+import redis
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from models import db, Score, Quiz, Chapter
+
+# Leaderboards are Redis sorted sets keyed by scope, updated on every committed
+# submission, so top-K and rank lookups cost O(log n) instead of an aggregate query.
+#
+#   quiz     leaderboard:quiz:<id>      the user's best score on the quiz
+#   chapter  leaderboard:chapter:<id>   the user's best scores summed over the scope's quizzes
+#   subject  leaderboard:subject:<id>
+#   global   leaderboard:global
+#
+# Retaking a quiz only moves the boards above it by the improvement on the user's best,
+# so repeating one easy quiz doesn't climb them. Members are user ids. Content deletions
+# (deletion.py) drop the deleted scopes' boards and take the deleted bests off the boards
+# above them; deleting a user takes them off every board their scores reached.
+SCOPES = ('global', 'subject', 'chapter', 'quiz')
+PREFIX = 'leaderboard:'
+
+# KEYS[1] is the quiz board, the other keys the boards that sum its bests; ARGV is
+# (user id, score). Raises the user's best and adds the improvement to the other boards.
+_RECORD_BEST = """
+local previous = redis.call('ZSCORE', KEYS[1], ARGV[1])
+local score = tonumber(ARGV[2])
+local gain = score
+if previous then
+    if score <= tonumber(previous) then
+        return 0
+    end
+    gain = score - tonumber(previous)
+end
+redis.call('ZADD', KEYS[1], score, ARGV[1])
+for i = 2, #KEYS do
+    redis.call('ZINCRBY', KEYS[i], gain, ARGV[1])
+end
+return gain
+"""
+
+
+def board_key(scope, scope_id=None):
+    return PREFIX + scope if scope == 'global' else f'{PREFIX}{scope}:{scope_id}'
+
+
+class _MemorySortedSets:
+    """Per-process stand-in for the Redis sorted-set commands used here"""
+
+    def __init__(self):
+        self._scores = {}  # key -> {member: score}
+        self._order = {}   # key -> sorted [(-score, member)]
+        self._lock = threading.Lock()
+
+    def _set(self, key, member, score):
+        scores = self._scores.setdefault(key, {})
+        order = self._order.setdefault(key, [])
+        if member in scores:
+            del order[bisect.bisect_left(order, (-scores[member], member))]
+        scores[member] = score
+        bisect.insort(order, (-score, member))
+
+    def zincrby(self, key, amount, member):
+        with self._lock:
+            score = self._scores.get(key, {}).get(member, 0) + amount
+            self._set(key, member, score)
+            return score
+
+    def record_best(self, quiz_key, totals_keys, member, score):
+        with self._lock:
+            previous = self._scores.get(quiz_key, {}).get(member)
+            if previous is not None and score <= previous:
+                return 0
+            self._set(quiz_key, member, score)
+            gain = score - (previous or 0)
+            for key in totals_keys:
+                self._set(key, member, self._scores.get(key, {}).get(member, 0) + gain)
+            return gain
+
+    def zadd(self, key, mapping, gt=False):
+        with self._lock:
+            for member, score in mapping.items():
+                current = self._scores.get(key, {}).get(member)
+                if not gt or current is None or score > current:
+                    self._set(key, member, score)
+
+    def zrevrange(self, key, start, end, withscores=False):
+        with self._lock:
+            order = self._order.get(key, [])
+            items = order[start:end + 1 if end >= 0 else len(order) + end + 1]
+            return [(member, -score) if withscores else member for score, member in items]
+
+    def zrevrank(self, key, member):
+        with self._lock:
+            score = self._scores.get(key, {}).get(member)
+            if score is None:
+                return None
+            return bisect.bisect_left(self._order[key], (-score, member))
+
+    def zscore(self, key, member):
+        with self._lock:
+            return self._scores.get(key, {}).get(member)
+
+    def zrem(self, key, *members):
+        with self._lock:
+            scores = self._scores.get(key, {})
+            for member in members:
+                if member in scores:
+                    del self._order[key][bisect.bisect_left(self._order[key], (-scores[member], member))]
+                    del scores[member]
+
+    def zcard(self, key):
+        with self._lock:
+            return len(self._scores.get(key, {}))
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._scores.pop(key, None)
+                self._order.pop(key, None)
+
+    def replace_all(self, boards):
+        with self._lock:
+            self._scores = {key: dict(members) for key, members in boards.items()}
+            self._order = {key: sorted((-score, member) for member, score in members.items())
+                           for key, members in boards.items()}
+
+
+class Leaderboards:
+    """Sorted-set leaderboards in Redis, falling back to process memory when Redis is unavailable"""
+
+    def __init__(self, app=None):
+        self.redis = None
+        self.memory = _MemorySortedSets()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('LEADERBOARD_REDIS_URL')
+        if url:
+            self.redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            self._record_best = self.redis.register_script(_RECORD_BEST)
+        app.extensions['leaderboards'] = self
+
+    def _call(self, method, *args, **kwargs):
+        if self.redis is not None:
+            try:
+                return getattr(self.redis, method)(*args, **kwargs)
+            except redis.RedisError:
+                pass
+        return getattr(self.memory, method)(*args, **kwargs)
+
+    @staticmethod
+    def _member(value):
+        return int(value)
+
+    def record(self, scores):
+        """Fold committed (user_id, quiz_id, total_scored) scores into every scope they count towards"""
+        scores = list(scores)
+        if not scores:
+            return
+        quiz_ids = {quiz_id for _, quiz_id, _ in scores}
+        scope_ids = {
+            quiz_id: (chapter_id, subject_id)
+            for quiz_id, chapter_id, subject_id in db.session.execute(
+                select(Quiz.id, Quiz.chapter_id, Chapter.subject_id)
+                .join(Chapter, Quiz.chapter_id == Chapter.id)
+                .filter(Quiz.id.in_(quiz_ids))
+            )
+        }
+        updates = []
+        for user_id, quiz_id, total_scored in scores:
+            if quiz_id not in scope_ids:
+                continue
+            chapter_id, subject_id = scope_ids[quiz_id]
+            totals_keys = [board_key('chapter', chapter_id), board_key('subject', subject_id), board_key('global')]
+            updates.append((board_key('quiz', quiz_id), totals_keys, user_id, total_scored))
+
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for quiz_key, totals_keys, user_id, total_scored in updates:
+                    # Read and raise the best in one step, so concurrent submissions can't both count
+                    self._record_best(keys=[quiz_key, *totals_keys], args=[user_id, total_scored], client=pipe)
+                pipe.execute()
+                return
+            except redis.RedisError:
+                pass
+        for update in updates:
+            self.memory.record_best(*update)
+
+    def subtract(self, keys, points):
+        """Take {user_id: points} lost to deleted scores off the given boards, dropping users left with nothing"""
+        updates = [(key, -amount, user_id) for key in keys for user_id, amount in points.items()]
+        if not updates:
+            return
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for update in updates:
+                    pipe.zincrby(*update)
+                scores = pipe.execute()
+                for (key, _, user_id), score in zip(updates, scores):
+                    if score <= 0:
+                        pipe.zrem(key, user_id)
+                pipe.execute()
+                return
+            except redis.RedisError:
+                pass
+        for key, amount, user_id in updates:
+            if self.memory.zincrby(key, amount, user_id) <= 0:
+                self.memory.zrem(key, user_id)
+
+    def remove_user(self, user_id, keys):
+        """Take a deleted user off the given boards"""
+        keys = list(keys)
+        if not keys:
+            return
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.zrem(key, user_id)
+                pipe.execute()
+                return
+            except redis.RedisError:
+                pass
+        for key in keys:
+            self.memory.zrem(key, user_id)
+
+    def user_boards(self, user_id):
+        """Keys of every board the user's scores count towards"""
+        rows = db.session.execute(
+            select(Score.quiz_id, Quiz.chapter_id, Chapter.subject_id).distinct()
+            .join(Quiz, Score.quiz_id == Quiz.id).join(Chapter, Quiz.chapter_id == Chapter.id)
+            .filter(Score.user_id == user_id)
+        ).all()
+        keys = {board_key('global')} if rows else set()
+        for quiz_id, chapter_id, subject_id in rows:
+            keys.update((board_key('quiz', quiz_id), board_key('chapter', chapter_id),
+                         board_key('subject', subject_id)))
+        return keys
+
+    def discard(self, keys):
+        """Drop the boards of deleted quizzes, chapters or subjects"""
+        keys = list(keys)
+        if keys:
+            self._call('delete', *keys)
+
+    def top(self, key, k):
+        """[(rank, user_id, score)] for the first k places"""
+        entries = self._call('zrevrange', key, 0, k - 1, withscores=True)
+        return [(rank, self._member(member), score) for rank, (member, score) in enumerate(entries, start=1)]
+
+    def around(self, key, user_id, neighbors):
+        """(rank, score, [(rank, user_id, score)] for the places around the user); rank is None if unranked"""
+        rank = self._call('zrevrank', key, user_id)
+        if rank is None:
+            return None, None, []
+        start = max(0, rank - neighbors)
+        entries = self._call('zrevrange', key, start, rank + neighbors, withscores=True)
+        window = [(start + offset + 1, self._member(member), score) for offset, (member, score) in enumerate(entries)]
+        return rank + 1, self._call('zscore', key, user_id), window
+
+    def size(self, key):
+        return self._call('zcard', key)
+
+    def _write_board(self, key, members):
+        pipe = self.redis.pipeline(transaction=True)
+        staging = key + ':rebuild'
+        pipe.delete(staging)
+        pipe.zadd(staging, members)
+        # RENAME swaps the rebuilt board in atomically
+        pipe.rename(staging, key)
+        pipe.execute()
+
+    def rebuild(self, batch_size=10000):
+        """Recompute every board from the score table; returns the number of boards written"""
+        bests = select(Score.quiz_id, Score.user_id, func.max(Score.total_scored).label('best'))\
+            .group_by(Score.quiz_id, Score.user_id).subquery()
+        points = func.sum(bests.c.best)
+        queries = (
+            ('quiz', select(bests.c.quiz_id, bests.c.user_id, bests.c.best).order_by(bests.c.quiz_id)),
+            ('chapter', select(Quiz.chapter_id, bests.c.user_id, points).join(Quiz, bests.c.quiz_id == Quiz.id)
+             .group_by(Quiz.chapter_id, bests.c.user_id).order_by(Quiz.chapter_id)),
+            ('subject', select(Chapter.subject_id, bests.c.user_id, points).join(Quiz, bests.c.quiz_id == Quiz.id)
+             .join(Chapter, Quiz.chapter_id == Chapter.id)
+             .group_by(Chapter.subject_id, bests.c.user_id).order_by(Chapter.subject_id)),
+            ('global', select(db.literal(None), bests.c.user_id, points).group_by(bests.c.user_id)),
+        )
+        use_redis = False
+        if self.redis is not None:
+            try:
+                use_redis = self.redis.ping()
+            except redis.RedisError:
+                current_app.logger.warning("Redis unavailable, rebuilding leaderboards in process memory")
+        boards = {}
+        written = set()
+
+        def flush(key, members):
+            if use_redis:
+                self._write_board(key, members)
+            else:
+                boards[key] = members
+            written.add(key)
+
+        for scope, stmt in queries:
+            # Rows arrive grouped by scope id, so only one board is held in memory at a time
+            key, members = None, {}
+            result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+            for scope_id, user_id, score in result:
+                if board_key(scope, scope_id) != key:
+                    if members:
+                        flush(key, members)
+                    key, members = board_key(scope, scope_id), {}
+                members[user_id] = score
+            if members:
+                flush(key, members)
+
+        if use_redis:
+            stale = [key for key in self.redis.scan_iter(match=PREFIX + '*', count=1000)
+                     if key.decode() not in written]
+            for start in range(0, len(stale), 1000):
+                self.redis.delete(*stale[start:start + 1000])
+        else:
+            self.memory.replace_all(boards)
+        db.session.rollback()
+        return len(written)
+
+
+leaderboards = Leaderboards()
+
+
+@click.command('rebuild-leaderboards')
+@with_appcontext
+def rebuild_leaderboards_command():
+    """Rebuild every leaderboard from the score table."""
+    boards = leaderboards.rebuild()
+    click.echo(f'Rebuilt {boards} leaderboards.')
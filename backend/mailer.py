@@ -0,0 +1,114 @@
+import os
+import smtplib
+import time
+import click
+import jinja2
+from flask import current_app
+from flask.cli import with_appcontext
+from flask_mail import Message
+
+# Email templates are parsed and compiled once per process; the environment keeps the
+# compiled templates cached and never re-stats the files.
+templates = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')),
+    auto_reload=False,
+)
+
+
+def render(template_name, **context):
+    """Render templates/<template_name>.html"""
+    return templates.get_template(f'{template_name}.html').render(**context)
+
+
+class BulkMailer:
+    """Sends many messages over one SMTP connection.
+
+    Flask-Mail recycles the connection every MAIL_MAX_EMAILS messages. A dropped
+    connection is reopened and the message retried; a message the server rejects is
+    counted as failed without affecting the rest of the run.
+    """
+
+    def __init__(self, mail, retries=1):
+        self.mail = mail
+        self.retries = retries
+        self.connection = None
+        self.sent = 0
+        self.failed = 0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._disconnect()
+        stats = self.stats()
+        current_app.logger.info(
+            "Bulk mail: %d sent, %d failed in %.2fs (%.1f messages/sec)",
+            stats['sent'], stats['failed'], stats['seconds'], stats['messages_per_second']
+        )
+
+    def _connect(self):
+        self.connection = self.mail.connect()
+        self.connection.__enter__()
+
+    def _disconnect(self):
+        if self.connection is not None:
+            try:
+                self.connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+    def send(self, message):
+        """Send one message; returns False if it could not be delivered"""
+        for _ in range(self.retries + 1):
+            try:
+                if self.connection is None:
+                    self._connect()
+                self.connection.send(message)
+                self.sent += 1
+                return True
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError):
+                self._disconnect()
+            except smtplib.SMTPResponseException as e:
+                # 421: the server is closing the session, so retry on a fresh one
+                if e.smtp_code != 421:
+                    break
+                self._disconnect()
+            except smtplib.SMTPException:
+                break
+        current_app.logger.warning("Could not send '%s' to %s", message.subject, ', '.join(message.recipients))
+        self.failed += 1
+        return False
+
+    def stats(self):
+        seconds = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'seconds': round(seconds, 3),
+            'messages_per_second': round(self.sent / seconds, 1) if seconds else 0.0,
+        }
+
+
+@click.command('mail-benchmark')
+@click.option('--count', default=100, show_default=True, help='Number of messages to send.')
+@click.option('--to', 'recipient', default='benchmark@example.com', show_default=True)
+@with_appcontext
+def mail_benchmark_command(count, recipient):
+    """Send COUNT daily reminders through the bulk mailer and report messages/sec.
+
+    Point MAIL_SERVER/MAIL_PORT at a local stand-in such as
+    `python -m aiosmtpd -n -l localhost:8025` (with MAIL_USE_TLS=false).
+    """
+    mail = current_app.extensions['mail']
+    new_quizzes_html = render('new_quizzes', new_quizzes=[])
+    with BulkMailer(mail) as mailer:
+        for i in range(count):
+            mailer.send(Message(
+                "Quiz Master - Daily Reminder",
+                recipients=[recipient],
+                html=render('daily_reminder', user_name=f'User {i}', new_quizzes_html=new_quizzes_html)
+            ))
+    click.echo(mailer.stats())
@@ -0,0 +1,198 @@
+import threading
+import time
+from bisect import bisect_left
+import redis
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Opt-in performance instrumentation (METRICS_ENABLED), exposed in Prometheus text format
+# at /metrics. Nothing is hooked in when it is disabled.
+#
+# Request and SQL metrics live in each web process. Celery task metrics are recorded by
+# the workers into a Redis hash, so any web process can serve them.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _label_text(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{str(value)}"' for name, value in pairs) + '}'
+
+
+def _render_histogram(name, help_text, buckets, labelnames, values):
+    """values: {labels tuple: (per-bucket counts incl. +Inf, sum, count)}"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, (counts, total, count) in sorted(values.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_label_text(labelnames, labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_label_text(labelnames, labels)} {total}')
+        lines.append(f'{name}_count{_label_text(labelnames, labels)} {count}')
+    return lines
+
+
+class Histogram:
+    """In-process histogram"""
+
+    def __init__(self, name, help_text, buckets, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts, total, count = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value, count + 1)
+
+    def render(self):
+        with self._lock:
+            values = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._values.items()}
+        return _render_histogram(self.name, self.help_text, self.buckets, self.labelnames, values)
+
+
+class RedisHistogram:
+    """Histogram with a single label, accumulated in a Redis hash shared by all processes"""
+
+    def __init__(self, client, name, help_text, buckets, labelname):
+        self.client = client
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labelname = labelname
+
+    def observe(self, value, label):
+        key = f'metrics:{self.name}'
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hincrby(key, f'{label}|{bisect_left(self.buckets, value)}', 1)
+            pipe.hincrbyfloat(key, f'{label}|sum', value)
+            pipe.hincrby(key, f'{label}|count', 1)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def render(self):
+        try:
+            fields = self.client.hgetall(f'metrics:{self.name}')
+        except redis.RedisError:
+            fields = {}
+        values = {}
+        for field, raw in fields.items():
+            label, part = field.decode().rsplit('|', 1)
+            counts, total, count = values.get((label,)) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+            if part == 'sum':
+                total = float(raw)
+            elif part == 'count':
+                count = int(raw)
+            else:
+                counts[int(part)] = int(raw)
+            values[(label,)] = (counts, total, count)
+        return _render_histogram(self.name, self.help_text, self.buckets, (self.labelname,), values)
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.',
+    LATENCY_BUCKETS, ('endpoint', 'method', 'status'))
+request_statements = Histogram(
+    'http_request_sql_statements', 'SQL statements issued per request.',
+    STATEMENT_BUCKETS, ('endpoint',))
+request_sql_time = Histogram(
+    'http_request_sql_seconds', 'Time spent in SQL per request.',
+    LATENCY_BUCKETS, ('endpoint',))
+sql_duration = Histogram(
+    'sql_statement_duration_seconds', 'SQL statement latency.', LATENCY_BUCKETS)
+
+
+def _task_histograms(client):
+    return (
+        RedisHistogram(client, 'celery_task_duration_seconds', 'Celery task run time.', TASK_BUCKETS, 'task'),
+        RedisHistogram(client, 'celery_task_queue_wait_seconds', 'Time from publish to task start.',
+                       TASK_BUCKETS, 'task'),
+    )
+
+
+def init_metrics(app, db):
+    """Hook request and SQL instrumentation into the app when METRICS_ENABLED is set"""
+    if not app.config['METRICS_ENABLED']:
+        return
+    slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+    logger = app.logger
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.metrics_started
+        sql_duration.observe(elapsed)
+        if has_request_context():
+            g.sql_statements = g.get('sql_statements', 0) + 1
+            g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+        if elapsed >= slow_query_seconds:
+            endpoint = request.endpoint if has_request_context() else None
+            logger.warning("Slow query (%.0f ms, endpoint %s): %s", elapsed * 1000, endpoint, statement[:1000])
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' in g:
+            endpoint = request.endpoint or 'unmatched'
+            request_duration.observe(
+                time.perf_counter() - g.request_started, endpoint, request.method, response.status_code)
+            request_statements.observe(g.get('sql_statements', 0), endpoint)
+            request_sql_time.observe(g.get('sql_seconds', 0.0), endpoint)
+        return response
+
+    task_metrics = ()
+    if app.config.get('CACHE_REDIS_URL'):
+        task_metrics = _task_histograms(redis.Redis.from_url(app.config['CACHE_REDIS_URL'], socket_timeout=0.5))
+
+    def metrics_view():
+        lines = []
+        for metric in (request_duration, request_statements, request_sql_time, sql_duration) + task_metrics:
+            lines.extend(metric.render())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def init_celery_metrics(celery, config):
+    """Record task run time and queue wait into Redis when METRICS_ENABLED is set"""
+    if not config.METRICS_ENABLED or not config.CACHE_REDIS_URL:
+        return
+    from celery.signals import before_task_publish, task_prerun, task_postrun
+    duration, queue_wait = _task_histograms(redis.Redis.from_url(config.CACHE_REDIS_URL, socket_timeout=0.5))
+    started = {}
+
+    @before_task_publish.connect(weak=False)
+    def stamp_published(headers=None, **kwargs):
+        headers['published_at'] = time.time()
+
+    @task_prerun.connect(weak=False)
+    def task_started(task_id=None, task=None, **kwargs):
+        started[task_id] = time.perf_counter()
+        published_at = getattr(task.request, 'published_at', None)
+        if published_at:
+            queue_wait.observe(max(0.0, time.time() - published_at), task.name)
+
+    @task_postrun.connect(weak=False)
+    def task_finished(task_id=None, task=None, **kwargs):
+        began = started.pop(task_id, None)
+        if began is not None:
+            duration.observe(time.perf_counter() - began, task.name)
@@ -51,6 +51,15 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    # search.py creates the search index outside the models: an FTS5 virtual table
+    # on SQLite, whose shadow tables (search_index_data, _idx, _content, _docsize,
+    # _config) SQLite manages itself, or a table with a GIN index on PostgreSQL.
+    # Autogenerate would otherwise emit drops for all of them.
+    table = name if type_ == 'table' else getattr(getattr(object, 'table', None), 'name', '')
+    return not (table or '').startswith('search_index')
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +74,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +103,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
@@ -0,0 +1,43 @@
+"""Add full-text search index
+
+Revision ID: b7e2f0c3d418
+Revises: a1c4e7d2b9f0
+Create Date: 2025-08-06 16:41:09.227615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f0c3d418'
+down_revision = 'a1c4e7d2b9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 on SQLite, a weighted tsvector with a GIN index on Postgres.
+    # Populate afterwards with `flask rebuild-search-index`
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "CREATE TABLE search_index ("
+            "kind VARCHAR(10) NOT NULL, ref_id INTEGER NOT NULL, scope_id INTEGER, "
+            "title TEXT, body TEXT, context TEXT, "
+            "document tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(body, '')), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(context, '')), 'C')) STORED, "
+            "PRIMARY KEY (kind, ref_id))"
+        )
+        op.execute("CREATE INDEX ix_search_index_document ON search_index USING GIN (document)")
+    else:
+        op.execute(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, scope_id UNINDEXED, title, body, context, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def downgrade():
+    op.execute("DROP TABLE search_index")
@@ -0,0 +1,38 @@
+"""Add quiz snapshot tokens
+
+Revision ID: e7a4c9b2d816
+Revises: c8d1f5a2e947
+Create Date: 2025-09-02 15:41:27.306915
+
+"""
+import uuid
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a4c9b2d816'
+down_revision = 'c8d1f5a2e947'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quiz_snapshot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('token', sa.String(length=32), nullable=True))
+
+    # Existing snapshots get tokens before the column becomes required
+    snapshot = sa.table('quiz_snapshot', sa.column('id', sa.Integer), sa.column('token', sa.String))
+    connection = op.get_bind()
+    for (snapshot_id,) in connection.execute(sa.select(snapshot.c.id)).all():
+        connection.execute(snapshot.update().where(snapshot.c.id == snapshot_id).values(token=uuid.uuid4().hex))
+
+    with op.batch_alter_table('quiz_snapshot', schema=None) as batch_op:
+        batch_op.alter_column('token', existing_type=sa.String(length=32), nullable=False)
+        batch_op.create_unique_constraint('uq_quiz_snapshot_token', ['token'])
+
+
+def downgrade():
+    with op.batch_alter_table('quiz_snapshot', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_quiz_snapshot_token', type_='unique')
+        batch_op.drop_column('token')
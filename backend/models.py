@@ -2,10 +2,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, time
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_full_name_id', 'full_name', 'id'),  # Keyset pagination of /api/users
+        db.Index('ix_user_notification_time_id', 'notification_time', 'id'),  # Reminder time buckets
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False) # Email
     password_hash = db.Column(db.String(128), nullable=False)
@@ -14,6 +19,7 @@ class User(db.Model):
     dob = db.Column(db.Date)
     role = db.Column(db.String(10), nullable=False, default='user') # 'admin' or 'user'
     scores = db.relationship('Score', backref='user', lazy=True, cascade="all, delete-orphan")
+    stats = db.relationship('UserStats', backref='user', lazy=True, cascade="all, delete-orphan")
     
     # Notification preferences
     notifications_enabled = db.Column(db.Boolean, default=True)
@@ -34,6 +40,9 @@ class Subject(db.Model):
     chapters = db.relationship('Chapter', backref='subject', lazy=True, cascade="all, delete-orphan")
 
 class Chapter(db.Model):
+    __table_args__ = (
+        db.Index('ix_chapter_subject_id_name_id', 'subject_id', 'name', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -41,15 +50,40 @@ class Chapter(db.Model):
     quizzes = db.relationship('Quiz', backref='chapter', lazy=True, cascade="all, delete-orphan")
 
 class Quiz(db.Model):
+    __table_args__ = (
+        db.Index('ix_quiz_chapter_id_id', 'chapter_id', 'id'),  # Quizzes of a chapter
+        db.Index('ix_quiz_created_at', 'created_at'),  # New quizzes in reminders
+    )
     id = db.Column(db.Integer, primary_key=True)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), nullable=False)
     time_duration = db.Column(db.String(5), nullable=False) # "HH:MM"
     remarks = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+    published_version = db.Column(db.Integer)  # Current QuizSnapshot.version served to students
     questions = db.relationship('Question', backref='quiz', lazy=True, cascade="all, delete-orphan")
     scores = db.relationship('Score', backref='quiz', lazy=True, cascade="all, delete-orphan")
+    snapshots = db.relationship('QuizSnapshot', backref='quiz', lazy=True, cascade="all, delete-orphan")
+
+class QuizSnapshot(db.Model):
+    """Immutable, pre-serialized copy of a quiz used to deliver and grade attempts"""
+    __tablename__ = 'quiz_snapshot'
+    __table_args__ = (
+        db.UniqueConstraint('quiz_id', 'version', name='uq_quiz_snapshot_quiz_id_version'),
+        db.UniqueConstraint('token', name='uq_quiz_snapshot_token'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    token = db.Column(db.String(32), nullable=False)  # Cache key; unique even when quiz ids are reused
+    attempt_json = db.Column(db.LargeBinary, nullable=False)  # Attempt payload, without answers
+    answer_key = db.Column(db.Text, nullable=False)  # JSON {"question_id": correct_option}
+    question_count = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
 
 class Question(db.Model):
+    __table_args__ = (
+        db.Index('ix_question_quiz_id_id', 'quiz_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
     statement = db.Column(db.Text, nullable=False)
@@ -60,8 +94,66 @@ class Question(db.Model):
     correct_option = db.Column(db.Integer, nullable=False) # 1, 2, 3, or 4
 
 class Score(db.Model):
+    __table_args__ = (
+        db.Index('ix_score_user_id_id', 'user_id', 'id'),
+        db.Index('ix_score_user_id_time_stamp', 'user_id', 'time_stamp'),  # Monthly reports, inactivity checks
+        db.Index('ix_score_quiz_id', 'quiz_id'),  # Quiz deletes and per-quiz scores
+        db.UniqueConstraint('submission_id', name='uq_score_submission_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     total_scored = db.Column(db.Integer, nullable=False)
-    time_stamp = db.Column(db.DateTime, server_default=db.func.now())
\ No newline at end of file
+    time_stamp = db.Column(db.DateTime, server_default=db.func.now())
+    submission_id = db.Column(db.String(36))  # Idempotency key for queued submissions
+
+class UserStats(db.Model):
+    """Running per-user score aggregates, one row per period ('all' or 'YYYY-MM')"""
+    __tablename__ = 'user_stats'
+    __table_args__ = (
+        db.Index('ix_user_stats_period_user_id', 'period', 'user_id'),  # Rankings within a period
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    period = db.Column(db.String(7), primary_key=True, default='all')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)  # Sum of raw total_scored
+    percentage_sum = db.Column(db.Float, nullable=False, default=0.0)
+    best_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    last_attempt_at = db.Column(db.DateTime)
+
+class SchedulerLease(db.Model):
+    """Time-limited lease naming the one process allowed to run periodic jobs"""
+    __tablename__ = 'scheduler_lease'
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class JobRun(db.Model):
+    """One execution of a periodic job"""
+    __tablename__ = 'job_run'
+    __table_args__ = (
+        db.Index('ix_job_run_job_id_started_at', 'job_id', 'started_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(50), nullable=False)
+    holder = db.Column(db.String(100), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    duration_seconds = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(10), nullable=False)  # 'success' or 'failed'
+    error = db.Column(db.Text)
+
+class ReminderBucket(db.Model):
+    """Progress of one day's reminder time bucket, so an interrupted bucket resumes where it stopped"""
+    __tablename__ = 'reminder_bucket'
+    day = db.Column(db.Date, primary_key=True)
+    bucket_start = db.Column(db.Time, primary_key=True)
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    completed_at = db.Column(db.DateTime)
+
+class ContentCounter(db.Model):
+    """Maintained row count: site-wide totals under subject_id 0, per-subject counts under the subject's id"""
+    __tablename__ = 'content_counter'
+    subject_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(20), primary_key=True)  # 'subjects', 'chapters', 'quizzes', 'questions', 'users'
+    value = db.Column(db.Integer, nullable=False, default=0)
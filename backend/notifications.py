@@ -1,136 +1,223 @@
 from flask_mail import Mail, Message
 import requests
-from datetime import datetime, timedelta
-from models import db, User, Quiz, Score
-from sqlalchemy import and_, func
-import jinja2
-import os
+from concurrent.futures import wait
+from datetime import datetime, time, timedelta
+from collections import defaultdict
+from models import db, User, Subject, Chapter, Quiz, Score, UserStats, ReminderBucket
+from stats import month_period
+from sqlalchemy import exists, func, select
+from flask import current_app
+from mailer import BulkMailer, render
+from webhooks import WebhookDispatcher
 
 mail = Mail()
 
-def send_email(to, subject, template_name, **kwargs):
-    """Send an email using a template"""
-    template_loader = jinja2.FileSystemLoader('templates')
-    template_env = jinja2.Environment(loader=template_loader)
-    template = template_env.get_template(f'{template_name}.html')
-    html = template.render(**kwargs)
-    
-    msg = Message(
+def build_email(to, subject, template_name, **kwargs):
+    """Build an email from a template"""
+    return Message(
         subject,
         recipients=[to],
-        html=html
+        html=render(template_name, **kwargs)
     )
-    mail.send(msg)
+
+def send_email(to, subject, template_name, **kwargs):
+    """Send an email using a template"""
+    mail.send(build_email(to, subject, template_name, **kwargs))
 
 def send_gchat_message(webhook_url, message):
     """Send a message to Google Chat"""
     try:
         response = requests.post(
             webhook_url,
-            json={"text": message}
+            json={"text": message},
+            timeout=current_app.config['GCHAT_TIMEOUT_SECONDS']
         )
         return response.status_code == 200
-    except:
+    except requests.RequestException:
+        current_app.logger.warning("Google Chat message failed", exc_info=True)
         return False
 
-def send_daily_reminders():
-    """Send daily reminders to users about new quizzes or inactivity"""
-    # Get users who haven't taken a quiz in the last 7 days
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    
-    inactive_users = User.query.join(
-        Score, and_(Score.user_id == User.id, Score.time_stamp > seven_days_ago),
-        isouter=True
-    ).filter(
-        Score.id.is_(None),
+def _due_buckets(now, minutes, catchup_minutes):
+    """(day, start time) of the buckets that have ended within the catch-up window, oldest first"""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = (now - midnight) // timedelta(minutes=1)
+    last = midnight + timedelta(minutes=elapsed // minutes * minutes - minutes)
+    starts = (last - timedelta(minutes=minutes * i) for i in range(catchup_minutes // minutes, -1, -1))
+    return [(start.date(), start.time()) for start in starts]
+
+def bucket_users_query(bucket_start, minutes, after_id, limit, inactive_since):
+    """Next page of users to remind in a bucket, via ix_user_notification_time_id"""
+    start = bucket_start.hour * 60 + bucket_start.minute
+    query = User.query.filter(
+        User.notification_time >= bucket_start,
+        User.id > after_id,
+        User.notifications_enabled == True,
         User.role != 'admin',
-        User.notification_time <= datetime.utcnow().time()
-    ).all()
-
-    # Get new quizzes created in the last 24 hours
-    new_quizzes = Quiz.query.filter(
-        Quiz.created_at >= datetime.utcnow() - timedelta(days=1)
-    ).all()
-
-    for user in inactive_users:
-        # Skip if user has disabled notifications
-        if not user.notifications_enabled:
-            continue
-
-        message = f"Hi {user.full_name},\n\n"
-        
-        if new_quizzes:
-            message += "New quizzes are available:\n"
-            for quiz in new_quizzes:
-                message += f"- {quiz.chapter.subject.name} - {quiz.chapter.name}\n"
-        
-        message += "\nDon't forget to practice and improve your skills!"
-        
-        if user.gchat_webhook:
-            send_gchat_message(user.gchat_webhook, message)
-        
-        if user.email_notifications:
-            send_email(
-                user.username,
-                "Quiz Master - Daily Reminder",
-                "daily_reminder",
-                user_name=user.full_name,
-                new_quizzes=new_quizzes
-            )
-
-def generate_monthly_report(user):
-    """Generate monthly activity report for a user"""
-    last_month = datetime.utcnow().replace(day=1) - timedelta(days=1)
-    start_date = last_month.replace(day=1)
-    
-    # Get user's quiz attempts for the month
-    monthly_scores = Score.query.filter(
-        Score.user_id == user.id,
-        Score.time_stamp >= start_date,
-        Score.time_stamp < start_date.replace(day=1) + timedelta(days=32)
-    ).all()
-    
-    # Calculate statistics
-    total_quizzes = len(monthly_scores)
-    if total_quizzes > 0:
-        avg_score = sum(score.total_scored for score in monthly_scores) / total_quizzes
-    else:
-        avg_score = 0
-    
-    # Get user's ranking
-    rank_subquery = db.session.query(
+        ~exists().where(Score.user_id == User.id, Score.time_stamp > inactive_since)
+    )
+    # The day's last bucket has no upper bound
+    if start + minutes < 24 * 60:
+        end = start + minutes
+        query = query.filter(User.notification_time < time(end // 60, end % 60))
+    return query.order_by(User.id).limit(limit)
+
+def new_quizzes_query(now):
+    """Quizzes created in the last day"""
+    return Quiz.query.filter(Quiz.created_at >= now - timedelta(days=1))
+
+def _reminder_content(now):
+    """The new-quiz list is the same for everyone, so render it once per run"""
+    new_quizzes = new_quizzes_query(now).all()
+    new_quizzes_text = ""
+    if new_quizzes:
+        new_quizzes_text = "New quizzes are available:\n" + "".join(
+            f"- {quiz.chapter.subject.name} - {quiz.chapter.name}\n" for quiz in new_quizzes
+        )
+    return new_quizzes_text, render('new_quizzes', new_quizzes=new_quizzes)
+
+def send_daily_reminders(now=None):
+    """Remind inactive users in every due time bucket of their notification_time.
+
+    Runs every REMINDER_BUCKET_MINUTES. Each bucket is sent in pages and its progress is
+    committed after every page, so a run that dies part-way resumes where it stopped.
+    """
+    now = now or datetime.utcnow()
+    config = current_app.config
+    minutes = config['REMINDER_BUCKET_MINUTES']
+    batch_size = config['REMINDER_BATCH_SIZE']
+    # Remind users who haven't taken a quiz in the last 7 days
+    inactive_since = now - timedelta(days=7)
+
+    ReminderBucket.query.filter(ReminderBucket.day < now.date() - timedelta(days=7)).delete()
+    db.session.commit()
+
+    content = None
+    # Chat messages go out concurrently while emails are sent over the pooled connection
+    with WebhookDispatcher.from_config(config) as dispatcher, BulkMailer(mail) as mailer:
+        for day, bucket_start in _due_buckets(now, minutes, config['REMINDER_CATCHUP_MINUTES']):
+            bucket = db.session.get(ReminderBucket, (day, bucket_start))
+            if bucket is None:
+                bucket = ReminderBucket(day=day, bucket_start=bucket_start, last_user_id=0, sent=0)
+                db.session.add(bucket)
+            if bucket.completed_at:
+                continue
+            if content is None:
+                content = _reminder_content(now)
+            new_quizzes_text, new_quizzes_html = content
+
+            while True:
+                users = bucket_users_query(bucket_start, minutes, bucket.last_user_id, batch_size, inactive_since).all()
+                if not users:
+                    bucket.completed_at = datetime.utcnow()
+                    db.session.commit()
+                    break
+
+                deliveries = []
+                for user in users:
+                    message = f"Hi {user.full_name},\n\n{new_quizzes_text}"
+                    message += "\nDon't forget to practice and improve your skills!"
+
+                    if user.gchat_webhook:
+                        deliveries.append(dispatcher.submit(user.gchat_webhook, {"text": message}))
+
+                    if user.email_notifications:
+                        mailer.send(build_email(
+                            user.username,
+                            "Quiz Master - Daily Reminder",
+                            "daily_reminder",
+                            user_name=user.full_name,
+                            new_quizzes_html=new_quizzes_html
+                        ))
+                # Only move past this page once its chat messages are out too
+                wait(deliveries)
+                bucket.last_user_id = users[-1].id
+                bucket.sent += len(users)
+                db.session.commit()
+
+def monthly_ranking_query(period):
+    """Attempts, average and RANK() of every user with attempts in the period"""
+    average = (UserStats.percentage_sum / UserStats.attempts).label('avg_score')
+    return select(
+        UserStats.user_id,
+        UserStats.attempts,
+        average,
+        func.rank().over(order_by=average.desc()).label('rank')
+    ).filter(UserStats.period == period, UserStats.attempts > 0)
+
+def _monthly_report_rows(period, batch_size):
+    """Stream report recipients with their monthly attempts, average and rank, in batches.
+
+    One set-based query: RANK() over the month's user_stats rows replaces the per-user
+    Score and ranking queries.
+    """
+    ranked = monthly_ranking_query(period).subquery()
+
+    stmt = select(
+        User.id,
+        User.username,
+        User.full_name,
+        func.coalesce(ranked.c.attempts, 0).label('total_quizzes'),
+        func.coalesce(ranked.c.avg_score, 0.0).label('avg_score'),
+        ranked.c.rank
+    ).outerjoin(ranked, ranked.c.user_id == User.id).filter(
+        User.role != 'admin',
+        User.email_notifications == True
+    ).order_by(User.id)
+
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+    yield from result.partitions()
+
+def monthly_scores_query(user_ids, start_date, end_date):
+    """Quiz attempts listed in the reports, for a batch of users"""
+    return select(
         Score.user_id,
-        func.avg(Score.total_scored).label('avg_score')
+        Score.time_stamp,
+        Score.total_scored,
+        Subject.name.label('subject_name'),
+        Chapter.name.label('chapter_name')
+    ).join(Quiz, Quiz.id == Score.quiz_id).join(Chapter, Chapter.id == Quiz.chapter_id).join(
+        Subject, Subject.id == Chapter.subject_id
     ).filter(
-        Score.time_stamp >= start_date
-    ).group_by(Score.user_id).subquery()
-    
-    user_rank = db.session.query(
-        func.count('*') + 1
-    ).filter(
-        rank_subquery.c.avg_score > avg_score
-    ).scalar()
-
-    # Send the report
-    if user.email_notifications:
-        send_email(
-            user.username,
-            f"Quiz Master - Monthly Activity Report - {last_month.strftime('%B %Y')}",
-            "monthly_report",
-            user_name=user.full_name,
-            month=last_month.strftime('%B %Y'),
-            total_quizzes=total_quizzes,
-            avg_score=round(avg_score, 2),
-            rank=user_rank,
-            scores=monthly_scores
-        )
+        Score.user_id.in_(user_ids),
+        Score.time_stamp >= start_date,
+        Score.time_stamp < end_date
+    ).order_by(Score.user_id, Score.time_stamp)
+
+def _monthly_scores(user_ids, start_date, end_date):
+    """Quiz attempts listed in the reports, for a batch of users, keyed by user id"""
+    rows = db.session.execute(monthly_scores_query(user_ids, start_date, end_date))
+    scores = defaultdict(list)
+    for row in rows:
+        scores[row.user_id].append(row)
+    return scores
 
 def send_monthly_reports():
     """Send monthly reports to all users"""
-    users = User.query.filter(
-        User.role != 'admin',
-        User.email_notifications == True
-    ).all()
-    
-    for user in users:
-        generate_monthly_report(user)
+    end_date = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last_month = end_date - timedelta(days=1)
+    start_date = last_month.replace(day=1)
+    period = month_period(last_month)
+    month = last_month.strftime('%B %Y')
+
+    # Users with no attempts last month rank behind everyone with a positive average
+    unranked = db.session.query(func.count(UserStats.user_id)).filter(
+        UserStats.period == period,
+        UserStats.attempts > 0,
+        UserStats.percentage_sum > 0
+    ).scalar() + 1
+
+    with BulkMailer(mail) as mailer:
+        for batch in _monthly_report_rows(period, current_app.config['MONTHLY_REPORT_BATCH_SIZE']):
+            scores = _monthly_scores([row.id for row in batch], start_date, end_date)
+            for row in batch:
+                mailer.send(build_email(
+                    row.username,
+                    f"Quiz Master - Monthly Activity Report - {month}",
+                    "monthly_report",
+                    user_name=row.full_name,
+                    month=month,
+                    total_quizzes=row.total_quizzes,
+                    avg_score=round(row.avg_score, 2),
+                    rank=row.rank or unranked,
+                    scores=scores.get(row.id, [])
+                ))
@@ -0,0 +1,100 @@
+import base64
+import json
+from urllib.parse import urlencode
+from flask import current_app, jsonify, request
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _cursor_type(column):
+    """JSON type a cursor holds for a sort key column"""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    # Sort keys are ids and names; bool is an int subclass but never a valid key
+    return {int: int, str: str}.get(python_type)
+
+
+def decode_cursor(cursor, order_columns):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(values, list) or len(values) != len(order_columns):
+        raise InvalidCursor("Cursor does not match this listing")
+    for value, column in zip(values, order_columns):
+        expected = _cursor_type(column)
+        if expected is None or type(value) is not expected:
+            raise InvalidCursor("Cursor does not match this listing")
+    return values
+
+
+def wants_all():
+    """Legacy clients opt into the full, unpaginated list with ?all=true"""
+    return request.args.get('all', '').lower() in ('1', 'true', 'yes')
+
+
+def page_size():
+    """Requested page size, clamped to the configured bounds"""
+    try:
+        limit = int(request.args.get('limit', current_app.config['PAGE_SIZE_DEFAULT']))
+    except ValueError:
+        limit = current_app.config['PAGE_SIZE_DEFAULT']
+    return max(1, min(limit, current_app.config['PAGE_SIZE_MAX']))
+
+
+def result_limit():
+    """Row cap for ranked search results, which are returned as a single page"""
+    return None if wants_all() else page_size()
+
+
+def keyset_seek(query, order_columns, after=None):
+    """query in order_columns order, starting after the sort key `after` when one is given"""
+    query = query.order_by(*order_columns)
+    if after is not None:
+        query = query.filter(tuple_(*order_columns) > tuple_(*after))
+    return query
+
+
+def keyset_page(query, order_columns):
+    """Fetch one page of query ordered by order_columns, which must end in a unique column.
+
+    Returns (rows, next_cursor). The cursor holds the sort key of the last row, and the
+    next page seeks past it with a row-value comparison, so every page is an index range
+    scan no matter how deep it is.
+    """
+    if wants_all():
+        return query.order_by(*order_columns).all(), None
+
+    cursor = request.args.get('cursor')
+    after = decode_cursor(cursor, order_columns) if cursor else None
+    query = keyset_seek(query, order_columns, after)
+
+    limit = page_size()
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, column.key) for column in order_columns])
+
+
+def paginated_response(data, next_cursor):
+    """JSON list response; the next page is advertised in X-Next-Cursor and Link headers"""
+    response = jsonify(data)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
@@ -0,0 +1,61 @@
+from sqlalchemy import func, select
+from models import db, User, Subject, Chapter, Quiz, Question, Score, UserStats
+from stats import ALL_TIME
+
+# Query builders for the API's hot reads. The views run them, and query_plans.py
+# EXPLAINs the very same statements, so the plan check can't drift from the code.
+# Listings come with the sort key keyset_page() pages them by.
+
+USER_LIST_ORDER = (User.full_name, User.id)
+CHAPTER_LIST_ORDER = (Chapter.name, Chapter.id)
+QUESTION_LIST_ORDER = (Question.id,)
+CATALOG_ORDER = (Quiz.id,)
+SCORE_LIST_ORDER = (Score.id,)
+
+
+def user_by_email(email):
+    return User.query.filter_by(username=email)
+
+
+def user_list():
+    """Every non-admin account"""
+    return User.query.filter(User.role != 'admin')
+
+
+def subject_chapters(subject_id):
+    return Chapter.query.filter_by(subject_id=subject_id)
+
+
+def chapter_quizzes(chapter_id):
+    return Quiz.query.filter_by(chapter_id=chapter_id)
+
+
+def quiz_questions(quiz_id):
+    return Question.query.filter_by(quiz_id=quiz_id)
+
+
+def quiz_catalog():
+    """Quizzes with their chapter and subject names and question count"""
+    # Question counts come from a correlated subquery on ix_question_quiz_id_id, so paging
+    # by primary key evaluates it only for the rows on the page
+    question_count = select(func.count(Question.id)).where(Question.quiz_id == Quiz.id)\
+        .correlate(Quiz).scalar_subquery()
+    return db.session.query(
+        Quiz.id, Quiz.remarks, Chapter.name.label('chapter_name'), Subject.name.label('subject_name'),
+        question_count.label('question_count')
+    ).join(Chapter, Quiz.chapter_id == Chapter.id)\
+     .join(Subject, Chapter.subject_id == Subject.id)
+
+
+def user_scores(user_id):
+    return Score.query.filter_by(user_id=user_id)
+
+
+def performance_overview(limit=10):
+    """(full name, average percentage) of the best users of all time"""
+    avg_percentage = UserStats.percentage_sum / UserStats.attempts
+    return db.session.query(User.full_name, avg_percentage)\
+        .join(UserStats, User.id == UserStats.user_id)\
+        .filter(UserStats.period == ALL_TIME, UserStats.attempts > 0)\
+        .order_by(avg_percentage.desc())\
+        .limit(limit)
@@ -0,0 +1,129 @@
+import re
+from datetime import datetime, time, timedelta
+import click
+from flask.cli import with_appcontext
+from models import db
+from deletion import score_batch_query
+from notifications import bucket_users_query, monthly_ranking_query, monthly_scores_query, new_quizzes_query
+from pagination import keyset_seek
+from queries import (
+    CATALOG_ORDER, CHAPTER_LIST_ORDER, QUESTION_LIST_ORDER, SCORE_LIST_ORDER, USER_LIST_ORDER,
+    chapter_quizzes, performance_overview, quiz_catalog, quiz_questions, subject_chapters,
+    user_by_email, user_list, user_scores,
+)
+from snapshots import current_snapshot_query, snapshot_token_query
+
+# Query-plan regression check for the hot queries of the API, notifications, snapshots
+# and deletions. Each entry is built by the same helper the code runs, with sample
+# arguments and keyset seeks; `flask check-query-plans` fails if any of them plans a
+# full table scan or sorts its rows instead of reading them in index order.
+
+# Queries whose sort is inherent and bounded, with the reason it is acceptable
+ACCEPTED_SORTS = {
+    'performance_overview': 'top 10 of one row per user, ordered by a computed average',
+    'monthly_ranking': 'ranks one row per user by a computed average',
+    'reminder_bucket': 'sorts one five-minute notification bucket of at most 500 users',
+}
+PAGE = 51  # a default page plus the look-ahead row keyset_page fetches
+
+
+def _page(query, order_columns, after):
+    return keyset_seek(query, order_columns, after).limit(PAGE)
+
+
+def _hot_queries():
+    now = datetime.utcnow()
+    return {
+        'login': user_by_email('user@example.com'),
+        'user_list_page': _page(user_list(), USER_LIST_ORDER, ('M', 0)),
+        'subject_chapters_page': _page(subject_chapters(1), CHAPTER_LIST_ORDER, ('M', 0)),
+        'chapter_quizzes': chapter_quizzes(1),
+        'quiz_questions_page': _page(quiz_questions(1), QUESTION_LIST_ORDER, (0,)),
+        'quiz_catalog_page': _page(quiz_catalog(), CATALOG_ORDER, (0,)),
+        'current_snapshot': current_snapshot_query(1),
+        'snapshot_version': snapshot_token_query(1, 1),
+        'user_scores_page': _page(user_scores(1), SCORE_LIST_ORDER, (0,)),
+        'quiz_score_batch': score_batch_query([1], 1000),
+        'performance_overview': performance_overview(),
+        'monthly_ranking': monthly_ranking_query('2025-07'),
+        'monthly_scores': monthly_scores_query([1, 2, 3], now - timedelta(days=31), now),
+        'reminder_bucket': bucket_users_query(time(8, 0), 5, 0, 500, now - timedelta(days=7)),
+        'new_quizzes': new_quizzes_query(now),
+    }
+
+
+def explain(statement):
+    """Return the database's plan for a statement as a list of text lines"""
+    connection = db.session.connection()
+    # ORM queries plan the statement they would run
+    statement = getattr(statement, 'statement', statement)
+    # Plans don't depend on these sample values, so inline them rather than bind them
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = connection.exec_driver_sql(prefix + sql).all()
+    return [str(row[-1]) for row in rows]
+
+
+def full_scans(plan, dialect):
+    """Tables the plan reads in full"""
+    tables = set(db.metadata.tables)
+    if dialect == 'sqlite':
+        # 'SCAN quiz' is a table scan; 'SCAN quiz USING INDEX ...' walks an index instead
+        found = (re.match(r'\s*SCAN (\w+)$', line) for line in plan)
+    else:
+        found = (re.search(r'Seq Scan on (\w+)', line) for line in plan)
+    return sorted({match.group(1) for match in found if match and match.group(1) in tables})
+
+
+def sorts(plan, dialect):
+    """Plan lines that sort rows rather than read them in index order"""
+    if dialect == 'sqlite':
+        # 'USE TEMP B-TREE FOR ORDER BY' (or GROUP BY, DISTINCT, ...) sorts every input row
+        pattern = r'\s*USE TEMP B-TREE'
+    else:
+        # 'Incremental Sort' only sorts within groups its input already delivers in order
+        pattern = r'\s*(->\s+)?Sort\s+\(cost='
+    return [line.strip() for line in plan if re.match(pattern, line)]
+
+
+def plan_problems(plan, dialect, accept_sorts=False):
+    """Why a plan would not stay fast as its tables grow; empty if it will"""
+    problems = [f'full scan of {table}' for table in full_scans(plan, dialect)]
+    if not accept_sorts:
+        problems += [f'sort: {line}' for line in sorts(plan, dialect)]
+    return problems
+
+
+def check_query_plans():
+    """Return {query name: (plan lines, problems)}"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # Small tables make a seq scan the cheapest plan; only report it when no index applies
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    results = {}
+    for name, statement in _hot_queries().items():
+        plan = explain(statement)
+        results[name] = (plan, plan_problems(plan, connection.dialect.name, name in ACCEPTED_SORTS))
+    db.session.rollback()
+    return results
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print every plan, not just regressions.')
+@with_appcontext
+def check_query_plans_command(verbose):
+    """Fail if any hot query's plan regresses to a full table scan or an unindexed sort."""
+    failures = 0
+    for name, (plan, problems) in check_query_plans().items():
+        if problems:
+            failures += 1
+            click.echo(f'FAIL {name}: {"; ".join(problems)}')
+        elif name in ACCEPTED_SORTS and verbose:
+            click.echo(f'ok   {name} (accepted sort: {ACCEPTED_SORTS[name]})')
+        else:
+            click.echo(f'ok   {name}')
+        if problems or verbose:
+            for line in plan:
+                click.echo(f'       {line}')
+    if failures:
+        raise click.ClickException(f'{failures} hot queries plan a full table scan or an unindexed sort.')
@@ -0,0 +1,133 @@
+import csv
+import json
+import time
+from sqlalchemy import insert
+from models import db, Question
+
+QUESTION_FIELDS = ['statement', 'option1', 'option2', 'option3', 'option4', 'correct_option']
+OPTION_MAX_LENGTH = 255
+MAX_REPORTED_ERRORS = 100
+
+
+def detect_format(filename=None, content_type=None, requested=None):
+    """Pick 'csv' or 'jsonl' from an explicit format, the file name or the content type"""
+    if requested:
+        return requested.lower() if requested.lower() in ('csv', 'jsonl') else None
+    if filename:
+        if filename.lower().endswith('.csv'):
+            return 'csv'
+        if filename.lower().endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+    if content_type:
+        if 'csv' in content_type:
+            return 'csv'
+        if 'ndjson' in content_type or 'jsonl' in content_type:
+            return 'jsonl'
+    return None
+
+
+def _decode(raw, line_number):
+    # Decoded one line at a time, so a bad byte is reported on its own line
+    return raw.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+
+
+def _text_lines(stream):
+    for line_number, raw in enumerate(stream, start=1):
+        yield _decode(raw, line_number)
+
+
+def iter_rows(stream, fmt):
+    """Yield (line_number, row_dict, parse_error) for each record of a binary stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(_text_lines(stream))
+        try:
+            for row in reader:
+                yield reader.line_num, row, None
+        # Quoted fields can span lines, so reading can't resume after a bad line. The
+        # reader hasn't counted the line it failed on.
+        except UnicodeDecodeError as e:
+            yield reader.line_num + 1, None, f"Line is not valid UTF-8 ({e.reason}); the rest of the file was not read"
+        except csv.Error as e:
+            yield reader.line_num + 1, None, f"Invalid CSV ({e}); the rest of the file was not read"
+        return
+
+    for line_number, raw in enumerate(stream, start=1):
+        try:
+            line = _decode(raw, line_number)
+        except UnicodeDecodeError as e:
+            yield line_number, None, f"Line is not valid UTF-8 ({e.reason})"
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "Each line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def validate_row(row):
+    """Return (values, None) for a valid question row, or (None, error message)"""
+    missing = [field for field in QUESTION_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        return None, f"Missing required fields: {', '.join(missing)}"
+
+    values = {field: str(row[field]).strip() for field in QUESTION_FIELDS[:-1]}
+    for field in QUESTION_FIELDS[1:-1]:
+        if len(values[field]) > OPTION_MAX_LENGTH:
+            return None, f"{field} is longer than {OPTION_MAX_LENGTH} characters"
+
+    try:
+        correct_option = int(row['correct_option'])
+    except (TypeError, ValueError):
+        return None, "correct_option must be an integer"
+    if correct_option not in (1, 2, 3, 4):
+        return None, "correct_option must be 1, 2, 3, or 4"
+    values['correct_option'] = correct_option
+    return values, None
+
+
+def import_questions(quiz_id, rows, batch_size):
+    """Validate rows as they stream in and insert the valid ones in executemany batches.
+
+    Everything is written in the caller's transaction; the caller commits.
+    """
+    started = time.perf_counter()
+    imported = 0
+    error_count = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal imported
+        if batch:
+            db.session.execute(insert(Question), batch)
+            imported += len(batch)
+            batch.clear()
+
+    for line_number, row, error in rows:
+        if error is None:
+            values, error = validate_row(row)
+        if error is not None:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'error': error})
+            continue
+        values['quiz_id'] = quiz_id
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'failed': error_count,
+        'errors': errors,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round((imported + error_count) / elapsed, 1) if elapsed else None,
+    }
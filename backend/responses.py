@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+from functools import wraps
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+from cache import cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response layer for /api/* GETs: strong ETags with 304 revalidation, and gzip or
+# Brotli for bodies above COMPRESS_MIN_BYTES. Views with a cheap version stamp set
+# their own ETag (@versioned, or etag_matches() to answer 304 before doing any work);
+# other responses are tagged by a hash of their body. A compressed representation's ETag carries the
+# coding as a suffix, so every representation has its own strong validator.
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/csv', 'text/plain', 'text/html')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson; same documents as the default provider, with non-ASCII sent as UTF-8"""
+
+    def dumps(self, obj, **kwargs):
+        options = dict(kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if options.pop('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        options.pop('separators', None)  # orjson output is always compact
+        if options.get('indent') == 2:
+            # Debug-mode pretty printing in response()
+            options.pop('indent')
+            option |= orjson.OPT_INDENT_2
+        if options:
+            return super().dumps(obj, **kwargs)
+        # Dates and the other types orjson leaves alone are encoded as Flask does
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _representation_etags(etag):
+    return [etag] + [f'{etag}-{coding}' for coding in available_encodings()]
+
+
+def etag_matches(etag):
+    """Whether the client already holds any representation tagged with this ETag"""
+    return any(request.if_none_match.contains(candidate) for candidate in _representation_etags(etag))
+
+
+def _held_etag(etag):
+    """The representation ETag the client revalidated, which its 304 must carry"""
+    coding = request.accept_encodings.best_match(available_encodings())
+    # Prefer the representation this request would be served if several are held
+    preferred = [f'{etag}-{coding}'] if coding else []
+    for candidate in preferred + _representation_etags(etag):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return etag
+
+
+def versioned(namespace):
+    """ETag a GET view by its cache namespace version, so revalidation skips the view entirely"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            version = cache.version(namespace)
+            if version is None:
+                # No shared version to validate against; the body hash ETag still applies
+                return fn(*args, **kwargs)
+            stamp = f'{version}:{request.full_path}'
+            etag = hashlib.blake2b(stamp.encode(), digest_size=16).hexdigest()
+            if etag_matches(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(fn(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def _compress(body, coding, app):
+    if coding == 'br':
+        return brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def _set_cache_headers(response):
+    response.vary.add('Accept-Encoding')
+    if not response.cache_control:
+        # Per-user API data: browsers may keep it, but must revalidate each time
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+
+def init_responses(app):
+    """Install the JSON provider and the ETag/compression layer for /api/* GETs"""
+    if app.config['JSON_PROVIDER'] == 'orjson' and orjson is not None:
+        app.json = OrjsonProvider(app)
+
+    @app.after_request
+    def finish_api_get(response):
+        if request.method != 'GET' or not request.path.startswith('/api/'):
+            return response
+        if response.status_code == 304:
+            # Views that revalidate early (etag_matches, @versioned) set the base ETag; the
+            # 304 must carry the representation's tag and the headers its 200 would have
+            etag, _ = response.get_etag()
+            if etag is not None:
+                response.set_etag(_held_etag(etag))
+            _set_cache_headers(response)
+            return response
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+
+        body = response.get_data()
+        etag, _ = response.get_etag()
+        if etag is None:
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        _set_cache_headers(response)
+
+        coding = None
+        if len(body) >= app.config['COMPRESS_MIN_BYTES'] and response.mimetype in COMPRESSIBLE_TYPES:
+            coding = request.accept_encodings.best_match(available_encodings())
+        if etag_matches(etag):
+            response.set_etag(_held_etag(etag))
+            response.status_code = 304
+            response.set_data(b'')
+            response.headers.pop('Content-Type', None)
+        elif coding:
+            response.set_etag(f'{etag}-{coding}')
+            response.set_data(_compress(body, coding, app))
+            response.headers['Content-Encoding'] = coding
+        else:
+            response.set_etag(etag)
+        return response
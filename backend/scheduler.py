@@ -1,32 +1,218 @@
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+import click
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-from notifications import send_daily_reminders, send_monthly_reports
+from apscheduler.triggers.interval import IntervalTrigger
 from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from models import db, SchedulerLease, JobRun
+from notifications import mail, send_daily_reminders, send_monthly_reports
+from exports import exports_dir, sweep_exports
+from score_queue import drain_scores
+from counters import reconcile_counters
+
+# Any number of processes may run a scheduler; periodic jobs only execute in the one
+# holding the 'scheduler' lease row. The holder renews the lease well before it
+# expires, and when it dies another process takes the lease over once it lapses.
+LEASE_NAME = 'scheduler'
+HOLDER = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
 
 scheduler = BackgroundScheduler()
+_lease_valid_until = 0.0
 
-def init_scheduler(app):
+
+def renew_lease(app):
+    """Acquire or extend the scheduler lease; returns True while this process holds it"""
+    global _lease_valid_until
+    ttl = app.config['SCHEDULER_LEASE_SECONDS']
+    # Measured before the write, so our view of the lease never outlives the row's
+    started = time.monotonic()
     with app.app_context():
-        # Schedule daily reminders to run every day
-        scheduler.add_job(
-            send_daily_reminders,
-            trigger=CronTrigger(hour=18),  # Run at 6 PM every day
-            id='daily_reminders',
-            name='Send daily reminders to users',
-            replace_existing=True
-        )
-        
-        # Schedule monthly reports to run on the first day of each month
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        held = db.session.execute(
+            update(SchedulerLease).where(
+                SchedulerLease.name == LEASE_NAME,
+                or_(SchedulerLease.holder == HOLDER, SchedulerLease.expires_at < now)
+            ).values(holder=HOLDER, expires_at=expires_at)
+        ).rowcount == 1
+        if not held and db.session.get(SchedulerLease, LEASE_NAME) is None:
+            db.session.add(SchedulerLease(name=LEASE_NAME, holder=HOLDER, expires_at=expires_at))
+            held = True
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another process created the lease first
+            db.session.rollback()
+            held = False
+
+    was_leader = holds_lease()
+    _lease_valid_until = started + ttl if held else 0.0
+    if held != was_leader:
+        app.logger.info("Scheduler %s %s the lease", HOLDER, 'acquired' if held else 'lost')
+    return held
+
+
+def holds_lease():
+    return time.monotonic() < _lease_valid_until
+
+
+def run_job(app, job_id, func, kwargs=None, record=True, leader_only=True):
+    """Run a periodic job in an app context if this process holds the lease (or for per-host jobs, always)"""
+    if leader_only and not holds_lease():
+        return
+    with app.app_context():
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        status, error = 'success', None
+        try:
+            func(**(kwargs or {}))
+        except Exception as e:
+            status, error = 'failed', repr(e)
+            app.logger.exception("Scheduled job %s failed", job_id)
+            db.session.rollback()
+        duration = time.perf_counter() - started
+        app.logger.info("Scheduled job %s finished (%s) in %.2fs", job_id, status, duration)
+        if record:
+            db.session.add(JobRun(
+                job_id=job_id, holder=HOLDER, started_at=started_at,
+                duration_seconds=duration, status=status, error=error
+            ))
+            # Frequent jobs add a row every few minutes; keep only the recent history
+            cutoff = started_at - timedelta(days=app.config['JOB_RUN_RETENTION_DAYS'])
+            db.session.execute(delete(JobRun).where(JobRun.job_id == job_id, JobRun.started_at < cutoff))
+            db.session.commit()
+
+
+def monthly_reports_due(now):
+    """Whether this month's reports are due and no run has sent them yet"""
+    due_at = now.replace(day=1, hour=8, minute=0, second=0, microsecond=0)
+    if not due_at <= now < due_at + timedelta(days=current_app.config['MONTHLY_REPORT_CATCHUP_DAYS']):
+        return False
+    sent = db.session.query(JobRun.id).filter(
+        JobRun.job_id == 'monthly_reports',
+        JobRun.status == 'success',
+        JobRun.started_at >= due_at
+    ).first()
+    return sent is None
+
+
+def run_monthly_reports(app):
+    """Send the monthly reports on the first lease-holder tick after they fall due"""
+    # Checked on every tick rather than fired once at 08:00, so a lease failover at
+    # that moment (or a failed run) is caught up by whichever process holds it next
+    if not holds_lease():
+        return
+    with app.app_context():
+        due = monthly_reports_due(datetime.utcnow())
+    if due:
+        run_job(app, 'monthly_reports', send_monthly_reports)
+
+
+def add_jobs(scheduler, app):
+    lease_seconds = app.config['SCHEDULER_LEASE_SECONDS']
+    # Renew at a third of the lease so a couple of missed renewals don't drop it
+    scheduler.add_job(
+        renew_lease,
+        trigger=IntervalTrigger(seconds=max(1, lease_seconds // 3)),
+        args=[app],
+        id='renew_lease',
+        name='Renew the scheduler lease',
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
+    # Send daily reminders bucket by bucket as users' notification times come up
+    scheduler.add_job(
+        run_job,
+        trigger=CronTrigger(minute=f"*/{app.config['REMINDER_BUCKET_MINUTES']}"),
+        args=[app, 'daily_reminders', send_daily_reminders],
+        id='daily_reminders',
+        name='Send daily reminders to users',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    # Send monthly reports from 8 AM (UTC) on the first day of each month
+    scheduler.add_job(
+        run_monthly_reports,
+        trigger=CronTrigger(minute=f"*/{app.config['MONTHLY_REPORT_CHECK_MINUTES']}"),
+        args=[app],
+        id='monthly_reports',
+        name='Send monthly activity reports',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
+    # Keep the report exports directory within its age and size limits
+    scheduler.add_job(
+        run_job,
+        trigger=IntervalTrigger(hours=app.config['EXPORTS_SWEEP_INTERVAL_HOURS']),
+        args=[app, 'sweep_exports', sweep_exports],
+        kwargs={'kwargs': {
+            'directory': exports_dir(app),
+            'max_age_days': app.config['EXPORTS_MAX_AGE_DAYS'],
+            'max_total_bytes': app.config['EXPORTS_MAX_TOTAL_MB'] * 1024 * 1024,
+        }},
+        id='sweep_exports',
+        name='Delete expired report exports',
+        replace_existing=True
+    )
+
+    # Repair any drift in the maintained content counters
+    scheduler.add_job(
+        run_job,
+        trigger=IntervalTrigger(hours=app.config['COUNTER_RECONCILE_INTERVAL_HOURS']),
+        args=[app, 'reconcile_counters', reconcile_counters],
+        id='reconcile_counters',
+        name='Reconcile content counters',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+
+    # Flush write-behind quiz submissions (too frequent to record every run). A file
+    # queue only exists on its own host, so every host's scheduler drains its own.
+    if app.config['SCORE_WRITE_MODE'] == 'queued':
         scheduler.add_job(
-            send_monthly_reports,
-            trigger=CronTrigger(day=1, hour=8),  # Run at 8 AM on the first day of each month
-            id='monthly_reports',
-            name='Send monthly activity reports',
+            run_job,
+            trigger=IntervalTrigger(seconds=app.config['SCORE_DRAIN_INTERVAL_SECONDS']),
+            args=[app, 'drain_scores', drain_scores],
+            kwargs={'record': False, 'leader_only': app.config['SCORE_QUEUE_BACKEND'] != 'file'},
+            id='drain_scores',
+            name='Write queued quiz submissions',
+            max_instances=1,
+            coalesce=True,
             replace_existing=True
         )
-        
 
-       
 
-        scheduler.start()
+def init_scheduler(app):
+    """Run the periodic jobs on a background thread of this process"""
+    if 'mail' not in app.extensions:
+        # Only the cli profile sets up mail; the jobs need it wherever they run
+        mail.init_app(app)
+    add_jobs(scheduler, app)
+    scheduler.start()
+
 
+@click.command('run-scheduler')
+@with_appcontext
+def run_scheduler_command():
+    """Run the periodic jobs in the foreground (start one per host for failover)."""
+    app = current_app._get_current_object()
+    blocking = BlockingScheduler()
+    add_jobs(blocking, app)
+    click.echo(f'Scheduler {HOLDER} started.')
+    blocking.start()
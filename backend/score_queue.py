@@ -0,0 +1,262 @@
+import fcntl
+import glob
+import json
+import os
+import time
+import uuid
+import click
+import redis
+from datetime import datetime
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from models import db, Score
+from stats import record_attempts
+from leaderboards import leaderboards
+
+# Write-behind ingestion for quiz submissions. In 'queued' mode the submit endpoint
+# grades the attempt, appends the Score row to a durable queue and returns at once;
+# drain_scores() later writes queued rows with multi-row INSERTs.
+#
+# Delivery is at-least-once: a record is only removed from the queue after the
+# transaction that inserted it has committed. Every record carries a submission_id
+# (unique on score), so records replayed after a crash are skipped instead of
+# being inserted twice.
+#
+# A record the database rejects on its own (e.g. its quiz or user was deleted while it
+# was queued) is moved to a dead-letter stream or file and acknowledged, so it cannot
+# hold up the records behind it.
+#
+# The file backend is local to each host: every host that queues to it must also run
+# the scheduler (`flask run-scheduler`), which drains its own host's log.
+
+# Errors that retrying the same record can never fix; anything else (e.g. the database
+# being unreachable) leaves the batch queued for the next drain
+REJECTED = (IntegrityError, DataError, KeyError, TypeError, ValueError)
+
+
+class RedisStreamQueue:
+    """Queue on a Redis stream, drained through a consumer group"""
+
+    group = 'score-drainers'
+
+    def __init__(self, url, stream):
+        self.client = redis.Redis.from_url(url)
+        self.stream = stream
+        self.consumer = f'{os.uname().nodename}-{os.getpid()}'
+        self._group_ready = False
+
+    def append(self, record):
+        self.client.xadd(self.stream, {'data': json.dumps(record)})
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.client.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def read(self, count, reclaim_after_ms=60000):
+        """Return [(entry_id, record)]; entries left unacked by a crashed drainer are reclaimed"""
+        self._ensure_group()
+        _, claimed, *_ = self.client.xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_time=reclaim_after_ms, count=count
+        )
+        entries = list(claimed)
+        if len(entries) < count:
+            response = self.client.xreadgroup(
+                self.group, self.consumer, {self.stream: '>'}, count=count - len(entries)
+            )
+            for _, stream_entries in response:
+                entries.extend(stream_entries)
+        return [(entry_id, json.loads(fields[b'data'])) for entry_id, fields in entries if fields]
+
+    def ack(self, entry_ids):
+        if entry_ids:
+            self.client.xack(self.stream, self.group, *entry_ids)
+            self.client.xdel(self.stream, *entry_ids)
+
+    def dead_letter(self, failed):
+        """Keep rejected records, with the error, on a separate stream"""
+        for record, error in failed:
+            self.client.xadd(self.stream + ':dead', {'data': json.dumps(record), 'error': error})
+
+
+class FileQueue:
+    """Append-only local log: one fsynced JSON line per record.
+
+    The drainer atomically renames the active log to a numbered segment and consumes
+    segments oldest first, deleting each one only after its rows are committed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.active_path = os.path.join(directory, 'scores.log')
+        self.lock_path = os.path.join(directory, 'drain.lock')
+        self.dead_letter_path = os.path.join(directory, 'dead-letter.log')
+
+    def append(self, record):
+        line = (json.dumps(record) + '\n').encode()
+        while True:
+            fd = os.open(self.active_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # The drainer may have rotated the log between open() and flock()
+                try:
+                    current = os.stat(self.active_path).st_ino == os.fstat(fd).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    os.write(fd, line)
+                    os.fsync(fd)
+                    return
+            finally:
+                os.close(fd)
+
+    def dead_letter(self, failed):
+        """Keep rejected records, with the error, in dead-letter.log"""
+        with open(self.dead_letter_path, 'a') as log:
+            for record, error in failed:
+                log.write(json.dumps({'record': record, 'error': error}) + '\n')
+            log.flush()
+            os.fsync(log.fileno())
+
+    def _rotate(self):
+        if not os.path.exists(self.active_path):
+            return
+        fd = os.open(self.active_path, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size:
+                os.rename(self.active_path, os.path.join(self.directory, f'segment-{time.time_ns()}.log'))
+        finally:
+            os.close(fd)
+
+    def segments(self):
+        """Yield (path, records) for each pending segment while holding the drain lock"""
+        with open(self.lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._rotate()
+            for path in sorted(glob.glob(os.path.join(self.directory, 'segment-*.log'))):
+                with open(path) as segment:
+                    # A torn final line (crash mid-write) was never acknowledged to a client
+                    records = []
+                    for line in segment:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            continue
+                yield path, records
+
+
+def get_queue(app=None):
+    app = app or current_app
+    queue = app.extensions.get('score_queue')
+    if queue is None:
+        if app.config['SCORE_QUEUE_BACKEND'] == 'redis':
+            queue = RedisStreamQueue(app.config['SCORE_QUEUE_REDIS_URL'], app.config['SCORE_QUEUE_STREAM'])
+        else:
+            queue = FileQueue(os.path.join(app.instance_path, app.config['SCORE_QUEUE_DIR']))
+        app.extensions['score_queue'] = queue
+    return queue
+
+
+def enqueue_score(user_id, quiz_id, total_scored, total_questions):
+    """Durably queue a graded attempt for the drainer"""
+    get_queue().append({
+        'submission_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'quiz_id': quiz_id,
+        'total_scored': total_scored,
+        'total_questions': total_questions,
+        'time_stamp': datetime.utcnow().isoformat(),
+    })
+
+
+def _write_batch(records):
+    """Insert records not already present, in one transaction. Returns rows inserted."""
+    ids = [record['submission_id'] for record in records]
+    existing = set(db.session.execute(
+        select(Score.submission_id).filter(Score.submission_id.in_(ids))
+    ).scalars())
+    rows = []
+    seen = set()
+    for record in records:
+        if record['submission_id'] in existing or record['submission_id'] in seen:
+            continue
+        seen.add(record['submission_id'])
+        rows.append(dict(record, time_stamp=datetime.fromisoformat(record['time_stamp'])))
+    if rows:
+        db.session.execute(insert(Score).values([{
+            'submission_id': row['submission_id'],
+            'user_id': row['user_id'],
+            'quiz_id': row['quiz_id'],
+            'total_scored': row['total_scored'],
+            'time_stamp': row['time_stamp'],
+        } for row in rows]))
+        record_attempts(
+            (row['user_id'], row['total_scored'], row['total_questions'], row['time_stamp']) for row in rows
+        )
+    db.session.commit()
+    leaderboards.record((row['user_id'], row['quiz_id'], row['total_scored']) for row in rows)
+    return len(rows)
+
+
+def _write_records(records):
+    """Write a batch, falling back to one record at a time if it is rejected.
+
+    Returns (rows written, [(record, error)] for records rejected on their own).
+    """
+    try:
+        return _write_batch(records), []
+    except REJECTED:
+        db.session.rollback()
+    written, failed = 0, []
+    for record in records:
+        try:
+            written += _write_batch([record])
+        except REJECTED as e:
+            db.session.rollback()
+            failed.append((record, repr(e)))
+    if failed:
+        current_app.logger.error("Moved %d rejected queued scores to the dead-letter queue", len(failed))
+    return written, failed
+
+
+def drain_scores(app=None):
+    """Flush queued scores to the database in batches; returns the number of rows written"""
+    app = app or current_app
+    with app.app_context():
+        queue = get_queue(app)
+        batch_size = app.config['SCORE_QUEUE_BATCH_SIZE']
+        written = 0
+        if isinstance(queue, RedisStreamQueue):
+            while True:
+                entries = queue.read(batch_size)
+                if not entries:
+                    break
+                count, failed = _write_records([record for _, record in entries])
+                written += count
+                queue.dead_letter(failed)
+                queue.ack([entry_id for entry_id, _ in entries])
+        else:
+            for path, records in queue.segments():
+                for start in range(0, len(records), batch_size):
+                    count, failed = _write_records(records[start:start + batch_size])
+                    written += count
+                    queue.dead_letter(failed)
+                os.remove(path)
+        return written
+
+
+@click.command('drain-scores')
+@with_appcontext
+def drain_scores_command():
+    """Write all queued quiz submissions to the score table."""
+    written = drain_scores(current_app._get_current_object())
+    click.echo(f'Drained {written} queued scores.')
@@ -0,0 +1,205 @@
+import re
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, null, select, text
+from sqlalchemy.orm import Session
+from models import db, User, Subject, Chapter, Quiz
+
+# Every searchable row becomes one document: (kind, ref_id, scope_id, title, body, context).
+# scope_id is the parent id (subject for chapters, chapter for quizzes) so lists can be
+# searched within their parent. title/body/context are ranked in that order of weight.
+KINDS = ('subject', 'chapter', 'quiz', 'user')
+COLUMNS = ('title', 'body', 'context')
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, scope_id UNINDEXED, title, body, context, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+]
+POSTGRES_DDL = [
+    "CREATE TABLE IF NOT EXISTS search_index ("
+    "kind VARCHAR(10) NOT NULL, ref_id INTEGER NOT NULL, scope_id INTEGER, "
+    "title TEXT, body TEXT, context TEXT, "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(context, '')), 'C')) STORED, "
+    "PRIMARY KEY (kind, ref_id))",
+    "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)",
+]
+POSTGRES_WEIGHTS = {'title': 'A', 'body': 'B', 'context': 'C'}
+
+
+def _normalize(value):
+    """Lowercase and split on punctuation so e-mails and codes index as separate words"""
+    return ' '.join(re.findall(r'\w+', (value or '').lower()))
+
+
+def _tokens(term):
+    return re.findall(r'\w+', (term or '').lower())
+
+
+def _dialect(connection):
+    return connection.dialect.name
+
+
+def ensure_search_index(connection=None):
+    """Create the search index table for the current database if it is missing"""
+    connection = connection or db.session.connection()
+    ddl = POSTGRES_DDL if _dialect(connection) == 'postgresql' else SQLITE_DDL
+    for statement in ddl:
+        connection.execute(text(statement))
+
+
+def _document_rows(connection, kind, ids=None):
+    """Select (ref_id, scope_id, title, body, context) for the given rows of a kind"""
+    if kind == 'subject':
+        stmt = select(Subject.id, null(), Subject.name, Subject.description, null())
+        key = Subject.id
+    elif kind == 'chapter':
+        stmt = select(Chapter.id, Chapter.subject_id, Chapter.name, Chapter.description, Subject.name)\
+            .join(Subject, Chapter.subject_id == Subject.id)
+        key = Chapter.id
+    elif kind == 'quiz':
+        stmt = select(Quiz.id, Quiz.chapter_id, Quiz.remarks, null(), Subject.name + ' ' + Chapter.name)\
+            .join(Chapter, Quiz.chapter_id == Chapter.id)\
+            .join(Subject, Chapter.subject_id == Subject.id)
+        key = Quiz.id
+    else:
+        stmt = select(User.id, null(), User.full_name, User.username, null()).filter(User.role != 'admin')
+        key = User.id
+    if ids is not None:
+        stmt = stmt.filter(key.in_(ids))
+    return connection.execute(stmt)
+
+
+def delete_documents(connection, kind, ids):
+    """Drop the index documents for the given ids of a kind"""
+    if ids:
+        connection.execute(
+            text("DELETE FROM search_index WHERE kind = :kind AND ref_id = :ref_id"),
+            [{'kind': kind, 'ref_id': ref_id} for ref_id in ids]
+        )
+
+
+def index_documents(connection, kind, ids=None):
+    """(Re)write the index documents for the given ids of a kind, or for all rows"""
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+        delete_documents(connection, kind, ids)
+    documents = [
+        {'kind': kind, 'ref_id': ref_id, 'scope_id': scope_id, 'title': _normalize(title),
+         'body': _normalize(body), 'context': _normalize(context)}
+        for ref_id, scope_id, title, body, context in _document_rows(connection, kind, ids)
+    ]
+    if documents:
+        connection.execute(
+            text("INSERT INTO search_index (kind, ref_id, scope_id, title, body, context) "
+                 "VALUES (:kind, :ref_id, :scope_id, :title, :body, :context)"),
+            documents
+        )
+
+
+def search(kind, term, scope_id=None, columns=COLUMNS, limit=None):
+    """Return ids of the given kind matching every word of term (as prefixes), best first"""
+    tokens = _tokens(term)
+    if not tokens:
+        return []
+    connection = db.session.connection()
+    params = {'kind': kind}
+
+    if _dialect(connection) == 'postgresql':
+        weights = ''.join(POSTGRES_WEIGHTS[column] for column in columns)
+        params['query'] = ' & '.join(f"{token}:*{weights}" for token in tokens)
+        sql = ("SELECT ref_id FROM search_index, to_tsquery('simple', :query) AS q "
+               "WHERE document @@ q AND kind = :kind")
+        order = " ORDER BY ts_rank(document, q) DESC, ref_id"
+    else:
+        words = ' AND '.join(f'"{token}"*' for token in tokens)
+        params['query'] = f"{{{' '.join(columns)}}} : ({words})"
+        sql = "SELECT ref_id FROM search_index WHERE search_index MATCH :query AND kind = :kind"
+        order = " ORDER BY bm25(search_index, 0, 0, 0, 10.0, 4.0, 1.0), ref_id"
+
+    if scope_id is not None:
+        sql += " AND scope_id = :scope_id"
+        params['scope_id'] = scope_id
+    sql += order
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params['limit'] = limit
+    return [row[0] for row in connection.execute(text(sql), params)]
+
+
+def in_rank_order(items, ids):
+    """Sort loaded rows to match the ranked id list returned by search()"""
+    position = {ref_id: i for i, ref_id in enumerate(ids)}
+    return sorted(items, key=lambda item: position[item.id])
+
+
+# --- Keep the index in sync with ORM writes ---
+MODEL_KINDS = {Subject: 'subject', Chapter: 'chapter', Quiz: 'quiz', User: 'user'}
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_search_index(session, flush_context):
+    changed = {kind: set() for kind in KINDS}
+    deleted = {kind: set() for kind in KINDS}
+    renamed_subjects = set()
+    renamed_chapters = set()
+
+    for obj in session.new:
+        kind = MODEL_KINDS.get(type(obj))
+        if kind:
+            changed[kind].add(obj.id)
+    for obj in session.dirty:
+        kind = MODEL_KINDS.get(type(obj))
+        if kind and session.is_modified(obj, include_collections=False):
+            changed[kind].add(obj.id)
+            if kind == 'subject':
+                renamed_subjects.add(obj.id)
+            elif kind == 'chapter':
+                renamed_chapters.add(obj.id)
+    for obj in session.deleted:
+        kind = MODEL_KINDS.get(type(obj))
+        if kind:
+            deleted[kind].add(obj.id)
+
+    if not any(changed.values()) and not any(deleted.values()):
+        return
+
+    connection = session.connection()
+    # Parent names are part of the chapter/quiz context, so renames re-index children
+    if renamed_subjects:
+        changed['chapter'].update(connection.execute(
+            select(Chapter.id).filter(Chapter.subject_id.in_(renamed_subjects))).scalars())
+        renamed_chapters.update(changed['chapter'])
+    if renamed_chapters:
+        changed['quiz'].update(connection.execute(
+            select(Quiz.id).filter(Quiz.chapter_id.in_(renamed_chapters))).scalars())
+
+    for kind in KINDS:
+        delete_documents(connection, kind, deleted[kind])
+        # Deleted ids are simply absent from the rows selected for re-indexing
+        index_documents(connection, kind, changed[kind] - deleted[kind])
+
+
+def rebuild_search_index():
+    """Recreate every search document from the source tables"""
+    connection = db.session.connection()
+    ensure_search_index(connection)
+    connection.execute(text("DELETE FROM search_index"))
+    for kind in KINDS:
+        index_documents(connection, kind)
+    documents = connection.execute(text("SELECT count(*) FROM search_index")).scalar()
+    db.session.commit()
+    return documents
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Rebuild the full-text search index from subjects, chapters, quizzes and users."""
+    documents = rebuild_search_index()
+    click.echo(f'Rebuilt search_index: {documents} documents.')
@@ -0,0 +1,130 @@
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from models import db, User, Subject, Chapter, Quiz, Question, Score
+from cache import cache
+from stats import rebuild_user_stats
+from search import rebuild_search_index
+from counters import reconcile_counters
+from leaderboards import leaderboards
+
+# Synthetic data for benchmarks. Seeded users are named bench-<tag>-<n>@example.com
+# and all share SEED_PASSWORD, so the benchmark harness can log in as them.
+SEED_PASSWORD = 'benchmark'
+USER_PREFIX = 'bench-'
+
+SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'Computer Science', 'History',
+            'Geography', 'Economics', 'Literature', 'Statistics']
+TOPICS = ['Foundations', 'Algebra', 'Mechanics', 'Kinetics', 'Genetics', 'Algorithms', 'Databases',
+          'Networks', 'Revolutions', 'Climate', 'Markets', 'Poetry', 'Probability', 'Optics', 'Ecology']
+WORDS = ['which', 'value', 'process', 'system', 'energy', 'function', 'structure', 'model', 'rate',
+         'theory', 'equation', 'reaction', 'element', 'table', 'query', 'index', 'period', 'force']
+FIRST_NAMES = ['Aarav', 'Priya', 'Rahul', 'Ananya', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Isha']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Reddy', 'Gupta', 'Nair', 'Singh', 'Das', 'Mehta', 'Rao']
+
+
+def _sentence(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '?'
+
+
+def _insert_ids(model, rows, batch_size):
+    """Core bulk insert in batches; returns the new primary keys in row order"""
+    ids = []
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    for start in range(0, len(rows), batch_size):
+        ids.extend(db.session.execute(statement, rows[start:start + batch_size]).scalars())
+    return ids
+
+
+def seed_data(subjects, chapters, quizzes, questions, users, scores, batch_size=1000, seed=None):
+    """Insert synthetic content; counts for chapters and below are per parent. Returns row counts."""
+    rng = random.Random(seed)
+    tag = uuid.UUID(int=rng.getrandbits(128)).hex[:6] if seed is not None else uuid.uuid4().hex[:6]
+    now = datetime.utcnow()
+
+    subject_ids = _insert_ids(Subject, [
+        {'name': f'{SUBJECTS[i % len(SUBJECTS)]} {tag}-{i}', 'description': _sentence(rng, 12)}
+        for i in range(subjects)
+    ], batch_size)
+    chapter_ids = _insert_ids(Chapter, [
+        {'name': f'{rng.choice(TOPICS)} {j + 1}', 'description': _sentence(rng, 10), 'subject_id': subject_id}
+        for subject_id in subject_ids for j in range(chapters)
+    ], batch_size)
+    quiz_ids = _insert_ids(Quiz, [
+        {'chapter_id': chapter_id, 'time_duration': rng.choice(['00:10', '00:20', '00:30']),
+         'remarks': _sentence(rng, 5), 'created_at': now - timedelta(days=rng.randint(0, 365))}
+        for chapter_id in chapter_ids for _ in range(quizzes)
+    ], batch_size)
+    question_rows = [
+        {'quiz_id': quiz_id, 'statement': _sentence(rng), 'option1': rng.choice(WORDS),
+         'option2': rng.choice(WORDS), 'option3': rng.choice(WORDS), 'option4': rng.choice(WORDS),
+         'correct_option': rng.randint(1, 4)}
+        for quiz_id in quiz_ids for _ in range(questions)
+    ]
+    for start in range(0, len(question_rows), batch_size):
+        db.session.execute(insert(Question), question_rows[start:start + batch_size])
+
+    # Hashing is deliberately slow, so every seeded user shares one hash
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    user_ids = _insert_ids(User, [
+        {'username': f'{USER_PREFIX}{tag}-{i}@example.com', 'password_hash': password_hash,
+         'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', 'role': 'user',
+         'qualification': rng.choice(['B.Sc', 'B.Tech', 'M.Sc', 'High School']),
+         'notifications_enabled': True, 'email_notifications': rng.random() < 0.5,
+         'notification_time': datetime(2000, 1, 1, rng.randint(6, 22), rng.randrange(0, 60, 5)).time()}
+        for i in range(users)
+    ], batch_size)
+    score_rows = []
+    if quiz_ids:
+        for user_id in user_ids:
+            for _ in range(scores):
+                score_rows.append({
+                    'user_id': user_id, 'quiz_id': rng.choice(quiz_ids),
+                    'total_scored': rng.randint(0, questions),
+                    'time_stamp': now - timedelta(minutes=rng.randint(0, 180 * 24 * 60)),
+                })
+                if len(score_rows) >= batch_size:
+                    db.session.execute(insert(Score), score_rows)
+                    score_rows = []
+    if score_rows:
+        db.session.execute(insert(Score), score_rows)
+    db.session.commit()
+
+    # Derived tables are rebuilt in bulk rather than maintained row by row
+    rebuild_user_stats()
+    rebuild_search_index()
+    reconcile_counters()
+    leaderboards.rebuild()
+    cache.bump('catalog')
+    return {
+        'tag': tag,
+        'subjects': len(subject_ids),
+        'chapters': len(chapter_ids),
+        'quizzes': len(quiz_ids),
+        'questions': len(question_rows),
+        'users': len(user_ids),
+        'scores': len(user_ids) * scores if quiz_ids else 0,
+    }
+
+
+@click.command('seed-data')
+@click.option('--subjects', default=10, show_default=True)
+@click.option('--chapters', default=5, show_default=True, help='Chapters per subject.')
+@click.option('--quizzes', default=4, show_default=True, help='Quizzes per chapter.')
+@click.option('--questions', default=10, show_default=True, help='Questions per quiz.')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--scores', default=20, show_default=True, help='Scores per user.')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--seed', type=int, help='Random seed, for reproducible data.')
+@with_appcontext
+def seed_data_command(subjects, chapters, quizzes, questions, users, scores, batch_size, seed):
+    """Bulk-insert synthetic subjects, quizzes, users and scores for benchmarking."""
+    started = time.perf_counter()
+    counts = seed_data(subjects, chapters, quizzes, questions, users, scores, batch_size, seed)
+    click.echo(f'Seeded {counts} in {time.perf_counter() - started:.1f}s '
+               f'(users log in with password "{SEED_PASSWORD}").')
@@ -0,0 +1,272 @@
+import json
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, Quiz, QuizSnapshot, Question
+from cache import cache
+
+# Published quizzes are frozen into numbered QuizSnapshot rows. A snapshot never changes,
+# so it can be cached forever under its random token; only the per-quiz pointer to the
+# current version moves when a quiz is republished. Caches are not keyed by
+# (quiz_id, version): SQLite reuses the ids of deleted quizzes, and a new quiz would
+# otherwise be served the deleted one's cached snapshots.
+Snapshot = namedtuple('Snapshot', ['quiz_id', 'version', 'token', 'attempt_json', 'answer_key', 'question_count'])
+
+
+class _LRU:
+    """Small thread-safe LRU for decoded snapshots"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def discard_quizzes(self, quiz_ids):
+        with self._lock:
+            for key in [key for key, value in self._data.items() if value.quiz_id in quiz_ids]:
+                del self._data[key]
+
+
+_local = _LRU()
+
+
+def _pointer_key(quiz_id):
+    return f'snapshot:current:{quiz_id}'
+
+
+def _snapshot_key(token):
+    return f'snapshot:{token}'
+
+
+def _next_version(quiz_id):
+    """Claim the quiz's next snapshot version, holding its row until the transaction ends"""
+    # Bumping the counter in place rather than reading it and writing it back locks the
+    # row (and on SQLite the database) first, so a concurrent publish of the same quiz
+    # waits for this one to commit and then takes the following version
+    db.session.execute(
+        update(Quiz).where(Quiz.id == quiz_id)
+        .values(published_version=func.coalesce(Quiz.published_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(select(Quiz.published_version).where(Quiz.id == quiz_id)).scalar_one()
+
+
+def _publish(quiz_id):
+    version = _next_version(quiz_id)
+    quiz = db.session.get(Quiz, quiz_id)
+    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.id).all()
+
+    attempt_json = json.dumps({
+        'quiz_id': quiz.id,
+        'version': version,
+        'time_duration': quiz.time_duration,
+        'questions': [{
+            'id': q.id,
+            'statement': q.statement,
+            'option1': q.option1,
+            'option2': q.option2,
+            'option3': q.option3,
+            'option4': q.option4
+        } for q in questions]
+    }, separators=(',', ':')).encode()
+    answer_key = json.dumps({str(q.id): q.correct_option for q in questions}, separators=(',', ':'))
+
+    snapshot = QuizSnapshot(
+        quiz_id=quiz.id, version=version, token=uuid.uuid4().hex, attempt_json=attempt_json,
+        answer_key=answer_key, question_count=len(questions)
+    )
+    db.session.add(snapshot)
+    quiz.published_version = version
+    db.session.info.setdefault('published_quizzes', {})[quiz.id] = (version, snapshot.token)
+    _prune(quiz.id, version)
+    return snapshot
+
+
+def _prune(quiz_id, version):
+    """Delete the quiz's snapshots older than the one the new version replaces"""
+    # Only attempts started before an edit can still refer to an old version, so the
+    # replaced one is kept for them; submissions against anything older are graded
+    # against the current version
+    stale = db.session.execute(
+        select(QuizSnapshot.id, QuizSnapshot.token)
+        .filter(QuizSnapshot.quiz_id == quiz_id, QuizSnapshot.version < version - 1)
+    ).all()
+    if stale:
+        db.session.execute(delete(QuizSnapshot).where(QuizSnapshot.id.in_([row[0] for row in stale])))
+        mark_snapshots_deleted(db.session, [row[1] for row in stale])
+
+
+def publish_quiz(quiz_id):
+    """Freeze the quiz's current questions into a new snapshot version.
+
+    Runs in the caller's transaction; the new version becomes current on commit.
+    """
+    return _publish(quiz_id).version
+
+
+def republish_quiz(quiz_id):
+    """Publish an edit to a quiz that students already see; unpublished quizzes stay drafts"""
+    published = db.session.query(Quiz.published_version).filter(Quiz.id == quiz_id).scalar()
+    if published:
+        publish_quiz(quiz_id)
+
+
+def _pointer(version, token):
+    return f'{version}:{token}'
+
+
+def current_snapshot_query(quiz_id):
+    """(published version, its snapshot token) of a quiz; the token is None before first publish"""
+    return db.session.query(Quiz.published_version, QuizSnapshot.token).outerjoin(
+        QuizSnapshot, (QuizSnapshot.quiz_id == Quiz.id) & (QuizSnapshot.version == Quiz.published_version)
+    ).filter(Quiz.id == quiz_id)
+
+
+def snapshot_token_query(quiz_id, version):
+    return db.session.query(QuizSnapshot.token).filter_by(quiz_id=quiz_id, version=version)
+
+
+def _current(quiz_id):
+    """(version, token) of the snapshot currently served for a quiz, or None if the quiz does not exist.
+
+    Quizzes that were never published are published on first use.
+    """
+    cached = cache.get(_pointer_key(quiz_id))
+    if cached is not None:
+        version, token = (cached.decode() if isinstance(cached, bytes) else cached).split(':')
+        return int(version), token
+
+    row = current_snapshot_query(quiz_id).first()
+    if row is None:
+        return None
+    version, token = row
+    if token is None:
+        try:
+            snapshot = _publish(quiz_id)
+            db.session.commit()
+            version, token = snapshot.version, snapshot.token
+        except IntegrityError:
+            # Another request published it first
+            db.session.rollback()
+            return _current(quiz_id)
+    cache.set(_pointer_key(quiz_id), _pointer(version, token), ttl=current_app.config['SNAPSHOT_POINTER_TTL'])
+    return version, token
+
+
+def get_snapshot(quiz_id, version=None, _reload_pointer=True):
+    """Load a snapshot: in-process LRU first, then Redis, then the database"""
+    current = _current(quiz_id)
+    if current is None:
+        return None
+    current_version, token = current
+    if version is not None and version < current_version:
+        # An attempt served before the quiz was republished
+        older = snapshot_token_query(quiz_id, version).scalar()
+        token = older or token
+
+    snapshot = _local.get(token)
+    if snapshot is not None:
+        return snapshot
+
+    packed = cache.get(_snapshot_key(token), local_fallback=False)
+    if packed is None:
+        row = QuizSnapshot.query.filter_by(token=token).first()
+        if row is None:
+            # The pointer outlived its snapshot (the quiz was deleted); read it again
+            if not _reload_pointer:
+                return None
+            cache.delete(_pointer_key(quiz_id))
+            return get_snapshot(quiz_id, version, _reload_pointer=False)
+        # header, answer key and attempt payload are all single lines
+        packed = f'{row.quiz_id}:{row.version}\n{row.answer_key}\n'.encode() + row.attempt_json
+        cache.set(_snapshot_key(token), packed, ttl=current_app.config['SNAPSHOT_CACHE_TTL'], local_fallback=False)
+
+    header, answer_key_json, attempt_json = packed.split(b'\n', 2)
+    snapshot_quiz_id, snapshot_version = map(int, header.split(b':'))
+    answer_key = {int(question_id): correct for question_id, correct in json.loads(answer_key_json).items()}
+    snapshot = Snapshot(snapshot_quiz_id, snapshot_version, token, attempt_json, answer_key, len(answer_key))
+    _local.put(token, snapshot)
+    return snapshot
+
+
+def grade(snapshot, user_answers):
+    """Score a submission against the snapshot's answer key"""
+    score = 0
+    for question_id, correct_option in snapshot.answer_key.items():
+        # User answers are sent as strings, so look them up by the string id
+        user_answer = user_answers.get(str(question_id))
+        if user_answer and str(user_answer).strip() == str(correct_option):
+            score += 1
+    return score
+
+
+def init_snapshots(app):
+    _local.maxsize = app.config['SNAPSHOT_LRU_SIZE']
+
+
+def mark_quizzes_deleted(session, quiz_ids):
+    """Drop the quizzes' version pointers and cached snapshots once the session commits (for Core deletes)"""
+    session.info.setdefault('deleted_quizzes', set()).update(quiz_ids)
+
+
+def mark_snapshots_deleted(session, tokens):
+    """Evict deleted snapshots from the caches once the session commits (for Core deletes)"""
+    session.info.setdefault('deleted_snapshots', set()).update(tokens)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_deleted_quizzes(session, flush_context):
+    for obj in session.deleted:
+        if isinstance(obj, Quiz):
+            mark_quizzes_deleted(session, [obj.id])
+        elif isinstance(obj, QuizSnapshot):
+            mark_snapshots_deleted(session, [obj.token])
+
+
+@event.listens_for(Session, 'after_commit')
+def _move_pointers(session):
+    published = session.info.pop('published_quizzes', None)
+    deleted = session.info.pop('deleted_quizzes', None)
+    deleted_snapshots = session.info.pop('deleted_snapshots', None)
+    if not has_app_context():
+        return
+    ttl = current_app.config['SNAPSHOT_POINTER_TTL']
+    for quiz_id, (version, token) in (published or {}).items():
+        cache.set(_pointer_key(quiz_id), _pointer(version, token), ttl=ttl)
+    for quiz_id in deleted or ():
+        cache.delete(_pointer_key(quiz_id))
+    if deleted:
+        _local.discard_quizzes(deleted)
+    for token in deleted_snapshots or ():
+        cache.delete(_snapshot_key(token))
+    _local.discard(deleted_snapshots or ())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pointers(session):
+    session.info.pop('published_quizzes', None)
+    session.info.pop('deleted_quizzes', None)
+    session.info.pop('deleted_snapshots', None)
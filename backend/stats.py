@@ -0,0 +1,173 @@
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func, insert, select, update
+from models import db, UserStats, Score, Question
+
+ALL_TIME = 'all'
+
+
+def month_period(moment):
+    """Period key used for the monthly aggregate rows, e.g. '2025-07'"""
+    return moment.strftime('%Y-%m')
+
+
+def _upsert(values):
+    """Add attempts to a user_stats row, creating the row if needed"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        greatest = func.max
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        greatest = func.greatest
+    else:
+        dialect_insert = None
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(UserStats).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'period'],
+            set_={
+                'attempts': UserStats.attempts + stmt.excluded.attempts,
+                'score_sum': UserStats.score_sum + stmt.excluded.score_sum,
+                'percentage_sum': UserStats.percentage_sum + stmt.excluded.percentage_sum,
+                'best_percentage': greatest(UserStats.best_percentage, stmt.excluded.best_percentage),
+                'last_attempt_at': greatest(
+                    func.coalesce(UserStats.last_attempt_at, stmt.excluded.last_attempt_at),
+                    stmt.excluded.last_attempt_at
+                ),
+            }
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback: update in place, insert when the row doesn't exist yet
+    result = db.session.execute(
+        update(UserStats)
+        .where(UserStats.user_id == values['user_id'], UserStats.period == values['period'])
+        .values(
+            attempts=UserStats.attempts + values['attempts'],
+            score_sum=UserStats.score_sum + values['score_sum'],
+            percentage_sum=UserStats.percentage_sum + values['percentage_sum'],
+            best_percentage=case(
+                (UserStats.best_percentage < values['best_percentage'], values['best_percentage']),
+                else_=UserStats.best_percentage
+            ),
+            last_attempt_at=case(
+                (UserStats.last_attempt_at > values['last_attempt_at'], UserStats.last_attempt_at),
+                else_=values['last_attempt_at']
+            )
+        )
+    )
+    if result.rowcount == 0:
+        db.session.execute(insert(UserStats).values(**values))
+
+
+def record_attempts(attempts):
+    """Fold (user_id, total_scored, total_questions, attempted_at) attempts into the aggregates.
+
+    Attempts are combined per user and period first, so a batch costs one upsert per row
+    touched. Runs inside the caller's transaction; the caller commits with the Score rows.
+    """
+    rows = {}
+    for user_id, total_scored, total_questions, attempted_at in attempts:
+        percentage = total_scored * 100.0 / total_questions if total_questions else 0.0
+        for period in (ALL_TIME, month_period(attempted_at)):
+            row = rows.get((user_id, period))
+            if row is None:
+                rows[(user_id, period)] = {
+                    'user_id': user_id,
+                    'period': period,
+                    'attempts': 1,
+                    'score_sum': total_scored,
+                    'percentage_sum': percentage,
+                    'best_percentage': percentage,
+                    'last_attempt_at': attempted_at,
+                }
+            else:
+                row['attempts'] += 1
+                row['score_sum'] += total_scored
+                row['percentage_sum'] += percentage
+                row['best_percentage'] = max(row['best_percentage'], percentage)
+                row['last_attempt_at'] = max(row['last_attempt_at'], attempted_at)
+    for values in rows.values():
+        _upsert(values)
+
+
+def record_attempt(user_id, total_scored, total_questions, attempted_at=None):
+    """Fold a single quiz attempt into the user's aggregates"""
+    record_attempts([(user_id, total_scored, total_questions, attempted_at or datetime.utcnow())])
+
+
+def average_percentage(stats):
+    """Mean percentage score for a user_stats row; 0 when the user has no attempts"""
+    if stats is None or not stats.attempts:
+        return 0
+    return stats.percentage_sum / stats.attempts
+
+
+def _insert_user_stats(user_ids=None):
+    """Insert aggregate rows computed from the score table, for all users or some of them"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        month = func.to_char(Score.time_stamp, 'YYYY-MM')
+    else:
+        month = func.strftime('%Y-%m', Score.time_stamp)
+
+    question_counts = select(
+        Question.quiz_id, func.count(Question.id).label('question_count')
+    ).group_by(Question.quiz_id).subquery()
+    percentage = case(
+        (question_counts.c.question_count > 0,
+         Score.total_scored * 100.0 / question_counts.c.question_count),
+        else_=0.0
+    )
+
+    def aggregate(period, *group_by):
+        stmt = select(
+            Score.user_id,
+            period,
+            func.count(Score.id),
+            func.sum(Score.total_scored),
+            func.sum(percentage),
+            func.max(percentage),
+            func.max(Score.time_stamp),
+        ).outerjoin(
+            question_counts, question_counts.c.quiz_id == Score.quiz_id
+        ).group_by(Score.user_id, *group_by)
+        if user_ids is not None:
+            stmt = stmt.filter(Score.user_id.in_(user_ids))
+        return stmt
+
+    columns = ['user_id', 'period', 'attempts', 'score_sum', 'percentage_sum',
+               'best_percentage', 'last_attempt_at']
+    db.session.execute(insert(UserStats).from_select(columns, aggregate(db.literal(ALL_TIME))))
+    db.session.execute(insert(UserStats).from_select(columns, aggregate(month, month)))
+
+
+def refresh_user_stats(user_ids):
+    """Recompute some users' user_stats rows after their scores were bulk-deleted.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    user_ids = list(user_ids)
+    if user_ids:
+        db.session.execute(delete(UserStats).where(UserStats.user_id.in_(user_ids)))
+        _insert_user_stats(user_ids)
+
+
+def rebuild_user_stats():
+    """Recompute every user_stats row from the score table"""
+    db.session.query(UserStats).delete()
+    _insert_user_stats()
+    db.session.commit()
+    return db.session.query(func.count()).select_from(UserStats).scalar()
+
+
+@click.command('rebuild-user-stats')
+@with_appcontext
+def rebuild_user_stats_command():
+    """Backfill the user_stats table from existing scores."""
+    rows = rebuild_user_stats()
+    click.echo(f'Rebuilt user_stats: {rows} rows.')
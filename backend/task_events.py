@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+import redis
+from celery.signals import task_prerun, task_postrun
+from flask import Response, current_app, stream_with_context
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Push-based task status. Tasks publish every state change (STARTED, PROGRESS, then
+# SUCCESS or FAILURE) to a Redis channel per task, and keep the latest one under a key
+# so a late subscriber starts from the current state. Browsers hold one Server-Sent
+# Events stream per task instead of polling the status endpoints.
+#
+# Events have the same shape as GET /api/admin/tasks/<task_id>:
+#   {"state": ..., "progress": {...} | null, "result": ... | null, "error": ... | null}
+#
+# Each open stream holds a pub/sub connection and, on sync servers, a worker thread.
+CHANNEL = 'task-events:'
+LAST = 'task-events:last:'
+DONE_STATES = ('SUCCESS', 'FAILURE', 'REVOKED')
+
+
+def _event(state, progress=None, result=None, error=None):
+    return {'state': state, 'progress': progress, 'result': result, 'error': error}
+
+
+class TaskEvents:
+    """Task state changes over Redis pub/sub, falling back to process memory when Redis is unavailable"""
+
+    def __init__(self, app=None, memory_size=1000):
+        self.redis = None
+        self.ttl = 86400
+        self.memory_size = memory_size
+        self._last = OrderedDict()  # task_id -> latest event, for the memory fallback
+        self._changed = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        url = app.config.get('TASK_EVENTS_REDIS_URL')
+        if url:
+            self.redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.ttl = app.config['TASK_EVENTS_TTL']
+        app.extensions['task_events'] = self
+
+    def publish(self, task_id, state, progress=None, result=None, error=None):
+        payload = json.dumps(_event(state, progress, result, error), default=str)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.set(LAST + task_id, payload, ex=self.ttl)
+                pipe.publish(CHANNEL + task_id, payload)
+                pipe.execute()
+                return
+            except redis.RedisError:
+                pass
+        with self._changed:
+            self._last[task_id] = json.loads(payload)
+            self._last.move_to_end(task_id)
+            while len(self._last) > self.memory_size:
+                self._last.popitem(last=False)
+            self._changed.notify_all()
+
+    def _listen_redis(self, task_id, heartbeat):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before reading the latest state so nothing published in between is lost
+            pubsub.subscribe(CHANNEL + task_id)
+            current = self.redis.get(LAST + task_id)
+            yield json.loads(current) if current else None
+            while True:
+                message = pubsub.get_message(timeout=heartbeat)
+                yield json.loads(message['data']) if message else None
+        finally:
+            pubsub.close()
+
+    def _listen_memory(self, task_id, heartbeat):
+        with self._changed:
+            event = self._last.get(task_id)
+        yield event
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._last.get(task_id) is not event, timeout=heartbeat)
+                latest = self._last.get(task_id)
+            if latest is event:
+                yield None
+            else:
+                event = latest
+                yield event
+
+    def listen(self, task_id, heartbeat):
+        """Yield the latest event (None if there is none yet), then each new one, or None every heartbeat seconds"""
+        if self.redis is not None:
+            try:
+                self.redis.ping()
+                return self._listen_redis(task_id, heartbeat)
+            except redis.RedisError:
+                pass
+        return self._listen_memory(task_id, heartbeat)
+
+
+task_events = TaskEvents()
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='task-events')
+
+
+def stream_token(task_id):
+    """Signed token that authorizes an event stream for one task"""
+    return _serializer().dumps(task_id)
+
+
+def check_stream_token(token, task_id):
+    try:
+        return _serializer().loads(token, max_age=current_app.config['TASK_EVENTS_TOKEN_MAX_AGE']) == task_id
+    except BadSignature:
+        return False
+
+
+def _sse(event):
+    return f"event: state\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def event_stream(task_id):
+    """text/event-stream response that follows the task until it finishes"""
+    config = current_app.config
+    heartbeat = config['TASK_EVENTS_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + config['TASK_EVENTS_MAX_STREAM_SECONDS']
+
+    def generate():
+        # Browsers reconnect on their own after a dropped or expired stream
+        yield 'retry: 3000\n\n'
+        events = task_events.listen(task_id, heartbeat)
+        try:
+            # Nothing published yet means queued (or unknown), which Celery also calls PENDING
+            event = next(events) or _event('PENDING')
+            while True:
+                if event is None:
+                    # Comment lines keep proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+                else:
+                    yield _sse(event)
+                    if event['state'] in DONE_STATES:
+                        return
+                if time.monotonic() > deadline:
+                    return
+                event = next(events)
+        except redis.RedisError:
+            return
+        finally:
+            events.close()
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
+
+
+# --- Celery signals: start and finish events for every task ---
+@task_prerun.connect(weak=False)
+def _task_started(task_id=None, **kwargs):
+    task_events.publish(task_id, 'STARTED')
+
+
+@task_postrun.connect(weak=False)
+def _task_finished(task_id=None, retval=None, state=None, **kwargs):
+    if state == 'SUCCESS':
+        task_events.publish(task_id, state, result=retval)
+    elif state in DONE_STATES:
+        task_events.publish(task_id, state, error=str(retval))
@@ -8,75 +8,142 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # ----------------------
 
 from celery import Celery
+from celery.signals import worker_process_init
+from celery.utils.log import get_task_logger
 import csv
+import resource
+import time
+import tracemalloc
 from datetime import datetime
-from models import User, Score
+from flask import current_app, has_app_context
+from sqlalchemy import func, select
+from models import db, User, UserStats
+from stats import ALL_TIME
+from exports import PARTIAL_SUFFIX, exports_dir, open_export
+from config import Config
+from counters import get_counters
+from metrics import init_celery_metrics
+from task_events import task_events
+
+logger = get_task_logger(__name__)
 
 celery = Celery('tasks',
                 broker='redis://localhost:6379/0',
                 backend='redis://localhost:6379/0')
+init_celery_metrics(celery, Config)
+
+_app = None
+
+
+def worker_app():
+    """The Flask app tasks run in, built once per process"""
+    global _app
+    if has_app_context():
+        # Eager tasks run inside the calling web or CLI app
+        return current_app._get_current_object()
+    if _app is None:
+        from app_factory import create_app
+        _app = create_app('worker')
+    return _app
+
+
+@worker_process_init.connect(weak=False)
+def _build_worker_app(**kwargs):
+    # Built after the fork, so no pooled database connections are shared with the parent
+    worker_app()
+
+
+def _progress_reporter(task, key):
+    """progress(done, total) callback that records PROGRESS state and pushes it to event streams"""
+    interval = current_app.config['TASK_PROGRESS_INTERVAL_SECONDS']
+    last_sent = [0.0]
+
+    def progress(done, total):
+        now = time.monotonic()
+        # Batches can finish far faster than anyone watches; send at most one update per interval
+        if done < total and now - last_sent[0] < interval:
+            return
+        last_sent[0] = now
+        meta = {key: done, 'total': total}
+        if not task.request.is_eager:
+            task.update_state(state='PROGRESS', meta=meta)
+        task_events.publish(task.request.id, 'PROGRESS', progress=meta)
+    return progress
+
 
-@celery.task
-def generate_user_performance_report():
-    from app_factory import create_app
-    app = create_app()
-    
+def _performance_report_rows(chunk_size):
+    """Stream (user_id, full_name, email, quizzes_taken, average_score) rows in chunks"""
+    stmt = select(
+        User.id,
+        User.full_name,
+        User.username,
+        func.coalesce(UserStats.attempts, 0),
+        func.coalesce(UserStats.score_sum, 0),
+    ).outerjoin(
+        UserStats, (UserStats.user_id == User.id) & (UserStats.period == ALL_TIME)
+    ).filter(User.role != 'admin').order_by(User.id)
+
+    # stream_results asks the driver for a server-side cursor where it has one
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    for chunk in result.partitions():
+        yield [
+            (user_id, full_name, email, attempts, round(score_sum / attempts, 2) if attempts else 0)
+            for user_id, full_name, email, attempts, score_sum in chunk
+        ]
+
+
+@celery.task(bind=True)
+def generate_user_performance_report(self):
+    app = worker_app()
     with app.app_context():
-        users = User.query.filter(User.role != 'admin').all()
-        
-        report_data = []
-        for user in users:
-            scores = user.scores
-            quizzes_taken = len(scores)
-            average_score = sum(s.total_scored for s in scores) / quizzes_taken if quizzes_taken > 0 else 0
-            
-            report_data.append({
-                'user_id': user.id,
-                'full_name': user.full_name,
-                'email': user.username,
-                'quizzes_taken': quizzes_taken,
-                'average_score': round(average_score, 2)
-            })
-            
+        # Report rows are the non-admin users, which the content counters already hold
+        total = get_counters()['users']
+        progress = _progress_reporter(self, 'rows')
+        chunk_size = app.config['REPORT_CHUNK_SIZE']
+        trace_memory = app.config['REPORT_TRACE_MEMORY']
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+
+        compress = app.config['REPORT_GZIP']
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"user_performance_{timestamp}.csv"
-        
-        exports_dir = 'exports'
-        if not os.path.exists(exports_dir):
-            os.makedirs(exports_dir)
+        filename = f"user_performance_{timestamp}.csv" + ('.gz' if compress else '')
             
-        filepath = os.path.join(exports_dir, filename)
+        filepath = os.path.join(exports_dir(app), filename)
+        partial_path = filepath + PARTIAL_SUFFIX
         
-        with open(filepath, 'w', newline='') as csvfile:
-            fieldnames = ['user_id', 'full_name', 'email', 'quizzes_taken', 'average_score']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(report_data)
+        rows_written = 0
+        with open_export(partial_path, compress) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['user_id', 'full_name', 'email', 'quizzes_taken', 'average_score'])
+            for chunk in _performance_report_rows(chunk_size):
+                writer.writerows(chunk)
+                rows_written += len(chunk)
+                progress(rows_written, max(total, rows_written))
+        # Only expose the file under its final name once it is complete
+        os.replace(partial_path, filepath)
+
+        elapsed = time.perf_counter() - started
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak_memory = f"peak traced memory {peak / 1024 / 1024:.1f} MiB"
+        else:
+            # ru_maxrss is reported in KiB on Linux
+            peak_memory = f"process max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB"
+        logger.info(
+            "Wrote %s: %d rows in %.2fs (%.0f rows/sec), %s",
+            filename, rows_written, elapsed, rows_written / elapsed if elapsed else 0, peak_memory
+        )
             
         return filename
 
 
+@celery.task(bind=True)
+def delete_content(self, kind, ref_id):
+    """Delete a subject, chapter or quiz tree in batches, reporting progress as task state"""
+    from deletion import delete_tree
+    app = worker_app()
 
-# --- Placeholder tasks for future features ---
-@celery.task
-def daily_reminder():
-    print("Sending daily reminders...")
-    return "Daily reminders sent."
-
-@celery.task
-def monthly_activity_report():
-    print("Generating and sending monthly reports...")
-    return "Monthly reports sent."
-
-@celery.on_after_configure.connect
-def setup_periodic_tasks(sender, **kwargs):
-    # Daily reminder task scheduled for 7 PM every day
-    sender.add_periodic_task(
-        crontab(hour=19, minute=0),
-        daily_reminder.s(),
-    )
-    # Monthly report task scheduled for the 1st day of the month at 8 AM
-    sender.add_periodic_task(
-        crontab(day_of_month=1, hour=8, minute=0),
-        monthly_activity_report.s(),
-    )
\ No newline at end of file
+    with app.app_context():
+        return delete_tree(kind, ref_id, app.config['DELETE_BATCH_SIZE'], _progress_reporter(self, 'deleted'))
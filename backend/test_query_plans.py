@@ -0,0 +1,89 @@
+import pytest
+from app_factory import create_app
+from config import Config
+from models import db
+from query_plans import check_query_plans, full_scans, plan_problems, sorts
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'plans.db'}")
+    monkeypatch.setattr(Config, 'DATABASE_REPLICA_URL', None)
+    app = create_app('worker')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+# Plans as `explain()` returns them, captured from known regressions
+
+# The catalog page before its question counts moved into a subquery: grouping every
+# quiz's questions before the LIMIT sorts the whole catalog
+SQLITE_GROUPED_CATALOG = [
+    'SEARCH quiz USING INTEGER PRIMARY KEY (rowid>?)',
+    'SEARCH chapter USING INTEGER PRIMARY KEY (rowid=?)',
+    'SEARCH subject USING INTEGER PRIMARY KEY (rowid=?)',
+    'SEARCH question USING COVERING INDEX ix_question_quiz_id_id (quiz_id=?) LEFT-JOIN',
+    'USE TEMP B-TREE FOR ORDER BY',
+]
+SQLITE_KEYSET_CATALOG = [
+    'SEARCH quiz USING INTEGER PRIMARY KEY (rowid>?)',
+    'SEARCH chapter USING INTEGER PRIMARY KEY (rowid=?)',
+    'SEARCH subject USING INTEGER PRIMARY KEY (rowid=?)',
+    'CORRELATED SCALAR SUBQUERY 1',
+    'SEARCH question USING COVERING INDEX ix_question_quiz_id_id (quiz_id=?)',
+]
+SQLITE_TABLE_SCAN = [
+    'SCAN score',
+    'SEARCH user USING INTEGER PRIMARY KEY (rowid=?)',
+]
+POSTGRES_SORTED_SCORES = [
+    'Limit  (cost=1520.12..1520.25 rows=51 width=4)',
+    '  ->  Sort  (cost=1520.12..1595.12 rows=30000 width=4)',
+    '        Sort Key: id',
+    '        ->  Seq Scan on score  (cost=0.00..550.00 rows=30000 width=4)',
+    '              Filter: (user_id = 1)',
+]
+POSTGRES_INCREMENTAL_SORT = [
+    'Limit  (cost=0.52..12.40 rows=51 width=36)',
+    '  ->  Incremental Sort  (cost=0.52..700.10 rows=3000 width=36)',
+    '        Sort Key: chapter_id, name',
+    '        Presorted Key: chapter_id',
+    '        ->  Index Scan using ix_quiz_chapter_id_id on quiz  (cost=0.29..600.00 rows=3000 width=36)',
+]
+
+
+def test_sqlite_temp_btree_is_a_sort():
+    assert sorts(SQLITE_GROUPED_CATALOG, 'sqlite') == ['USE TEMP B-TREE FOR ORDER BY']
+    assert plan_problems(SQLITE_GROUPED_CATALOG, 'sqlite') == ['sort: USE TEMP B-TREE FOR ORDER BY']
+
+
+def test_sqlite_index_ordered_plan_passes():
+    assert plan_problems(SQLITE_KEYSET_CATALOG, 'sqlite') == []
+
+
+def test_sqlite_table_scan():
+    assert full_scans(SQLITE_TABLE_SCAN, 'sqlite') == ['score']
+    assert plan_problems(SQLITE_TABLE_SCAN, 'sqlite') == ['full scan of score']
+
+
+def test_postgres_sort_and_seq_scan():
+    assert plan_problems(POSTGRES_SORTED_SCORES, 'postgresql') == [
+        'full scan of score',
+        'sort: ->  Sort  (cost=1520.12..1595.12 rows=30000 width=4)',
+    ]
+
+
+def test_postgres_incremental_sort_passes():
+    assert plan_problems(POSTGRES_INCREMENTAL_SORT, 'postgresql') == []
+
+
+def test_accepted_sorts_still_report_scans():
+    assert plan_problems(SQLITE_GROUPED_CATALOG, 'sqlite', accept_sorts=True) == []
+    assert plan_problems(POSTGRES_SORTED_SCORES, 'postgresql', accept_sorts=True) == ['full scan of score']
+
+
+def test_hot_queries_plan_without_scans_or_sorts(app):
+    problems = {name: found for name, (_, found) in check_query_plans().items() if found}
+    assert problems == {}
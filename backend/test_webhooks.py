@@ -0,0 +1,104 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from flask import Flask
+from webhooks import WebhookDispatcher
+
+
+class _Stub(BaseHTTPRequestHandler):
+    """Local webhook endpoint; each path plays a script of (status, headers, delay) responses"""
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests[self.path] = server.requests.get(self.path, 0) + 1
+            script = server.scripts[self.path]
+            status, headers, delay = script.pop(0) if len(script) > 1 else script[0]
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(delay)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up waiting
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Stub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = {}
+    server.scripts = {}
+    server.in_flight = server.max_in_flight = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    with Flask(__name__).app_context():
+        yield
+
+
+def test_retries_rate_limits_and_server_errors_until_delivered(stub):
+    stub.scripts['/flaky'] = [(429, {'Retry-After': '0'}, 0), (500, {}, 0), (200, {}, 0)]
+    with WebhookDispatcher(max_workers=2, per_host=2, timeout=2, max_retries=3, backoff=0.01) as dispatcher:
+        assert dispatcher.submit(stub.url + '/flaky', {'text': 'hi'}).result() is True
+    summary = dispatcher.metrics.summary()
+    assert stub.requests['/flaky'] == 3
+    assert (summary['delivered'], summary['failed'], summary['retries']) == (1, 0, 2)
+    assert summary['latency_ms_max'] > 0
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.scripts['/down'] = [(500, {}, 0)]
+    stub.scripts['/gone'] = [(404, {}, 0)]
+    with WebhookDispatcher(max_workers=2, per_host=2, timeout=2, max_retries=2, backoff=0.01) as dispatcher:
+        down = dispatcher.submit(stub.url + '/down', {'text': 'hi'})
+        gone = dispatcher.submit(stub.url + '/gone', {'text': 'hi'})
+        assert down.result() is False and gone.result() is False
+    summary = dispatcher.metrics.summary()
+    assert stub.requests == {'/down': 3, '/gone': 1}  # 404 is not retried
+    assert (summary['delivered'], summary['failed'], summary['retries']) == (0, 2, 2)
+
+
+def test_caps_requests_in_flight_per_host(stub):
+    stub.scripts['/hold'] = [(200, {}, 0.1)]
+    with WebhookDispatcher(max_workers=8, per_host=2, timeout=2, backoff=0.01) as dispatcher:
+        futures = [dispatcher.submit(stub.url + '/hold', {'n': n}) for n in range(8)]
+        assert all(future.result() for future in futures)
+    assert stub.max_in_flight == 2
+    summary = dispatcher.metrics.summary()
+    assert summary['delivered'] == 8
+    # Eight 100 ms requests two at a time: the last one waited for three rounds
+    assert summary['latency_ms_max'] >= 350
+
+
+def test_slow_endpoint_times_out(stub):
+    stub.scripts['/slow'] = [(200, {}, 1.0)]
+    started = time.perf_counter()
+    with WebhookDispatcher(max_workers=1, per_host=1, timeout=0.2, max_retries=1, backoff=0.01) as dispatcher:
+        assert dispatcher.submit(stub.url + '/slow', {'text': 'hi'}).result() is False
+    summary = dispatcher.metrics.summary()
+    assert (summary['delivered'], summary['failed'], summary['retries']) == (0, 1, 1)
+    assert stub.requests['/slow'] == 2
+    # Two attempts of at most 0.2 s each, not two full 1 s responses
+    assert summary['latency_ms_max'] < 900
+    assert time.perf_counter() - started < 2
@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DeliveryMetrics:
+    """Thread-safe delivery counters and latencies"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = []
+
+    def record(self, ok, latency, retries):
+        with self._lock:
+            if ok:
+                self.delivered += 1
+            else:
+                self.failed += 1
+            self.retries += retries
+            self.latencies.append(latency)
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            delivered, failed, retries = self.delivered, self.failed, self.retries
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            'delivered': delivered,
+            'failed': failed,
+            'retries': retries,
+            'latency_ms_p50': percentile(0.50),
+            'latency_ms_p95': percentile(0.95),
+            'latency_ms_max': percentile(1.0),
+        }
+
+
+class WebhookDispatcher:
+    """Posts webhook messages concurrently from a bounded thread pool.
+
+    Each host gets its own keep-alive requests.Session and a semaphore capping the
+    requests in flight to it. 429/5xx responses and connection errors are retried
+    with exponential backoff (honoring Retry-After).
+    """
+
+    def __init__(self, max_workers=16, per_host=8, timeout=10, max_retries=3, backoff=0.5):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.metrics = DeliveryMetrics()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='webhook')
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_workers=config['GCHAT_MAX_WORKERS'],
+            per_host=config['GCHAT_PER_HOST_LIMIT'],
+            timeout=config['GCHAT_TIMEOUT_SECONDS'],
+            max_retries=config['GCHAT_MAX_RETRIES'],
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._hosts[host] = (session, threading.BoundedSemaphore(self.per_host))
+            return self._hosts[host]
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), 30.0)
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def _deliver(self, url, payload, logger):
+        session, slots = self._host(url)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            with slots:
+                try:
+                    response = session.post(url, json=payload, timeout=self.timeout)
+                except requests.RequestException as e:
+                    error = e
+            if response is not None and response.status_code < 300:
+                self.metrics.record(True, time.perf_counter() - started, attempt)
+                return True
+            retryable = error is not None or response.status_code in RETRY_STATUSES
+            if not retryable or attempt >= self.max_retries:
+                logger.warning(
+                    "Webhook delivery to %s failed after %d attempts: %s",
+                    urlsplit(url).netloc, attempt + 1, error or f'HTTP {response.status_code}'
+                )
+                self.metrics.record(False, time.perf_counter() - started, attempt)
+                return False
+            # Sleep outside the host slot so other deliveries can use it
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def submit(self, url, payload):
+        """Queue a delivery; returns a future resolving to True on success"""
+        return self._executor.submit(self._deliver, url, payload, current_app.logger)
+
+    def close(self):
+        """Wait for queued deliveries, then release pooled connections"""
+        self._executor.shutdown(wait=True)
+        for session, _ in self._hosts.values():
+            session.close()
+        current_app.logger.info("Webhook dispatch: %s", self.metrics.summary())